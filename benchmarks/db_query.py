@@ -0,0 +1,106 @@
+"""
+Benchmark of the query layer against MySQL from .env
+
+Compares the previous execute_query (SET NAMES before every SELECT,
+DictCursor + fetchall) with the current one (session set up once per
+connection), tuple rows via row_factory and streaming through a
+server-side cursor. Reports latency per query for a point lookup and
+time plus peak Python memory for a large result.
+
+Usage:
+    python -m benchmarks.db_query [iterations] [rows]
+"""
+import asyncio
+import sys
+import time
+import tracemalloc
+
+import aiomysql
+
+from src.database import get_database
+
+POINT_QUERY = "SELECT good_id, name, type, price_c, price_amt, min_size FROM assortment WHERE good_id = %s"
+# Synthetic result of the given size, without touching real tables
+LARGE_QUERY = """
+    WITH RECURSIVE seq (n) AS (
+        SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < %s
+    )
+    SELECT /*+ SET_VAR(cte_max_recursion_depth = 10000000) */
+        n, CONCAT('Товар ', n), 'л', n * 1.5, n * 1.6, 30.0
+    FROM seq
+"""
+
+
+async def legacy_execute_query(db, query: str, params: tuple = None):
+    """execute_query as it was: extra SET NAMES round trip and dict rows"""
+    async with db._acquire() as conn:
+        async with conn.cursor(aiomysql.DictCursor) as cursor:
+            await cursor.execute("SET NAMES utf8mb4")
+            await cursor.execute(query, params or ())
+            return await cursor.fetchall()
+
+
+async def stream_all(db, query: str, params: tuple):
+    return [row async for row in db.stream_query(query, params, row_factory=tuple)]
+
+
+async def stream_count(db, query: str, params: tuple):
+    count = 0
+    async for _ in db.stream_query(query, params, row_factory=tuple):
+        count += 1
+    return count
+
+
+async def bench_point(db, iterations: int):
+    variants = {
+        "legacy (SET NAMES + dict)": lambda: legacy_execute_query(db, POINT_QUERY, (1,)),
+        "execute_query (dict)": lambda: db.execute_query(POINT_QUERY, (1,)),
+        "execute_query (tuple)": lambda: db.execute_query(POINT_QUERY, (1,), row_factory=tuple),
+    }
+    print(f"Point lookup, {iterations} queries")
+    print(f"{'variant':<28}{'per query, ms':>16}")
+    for name, run in variants.items():
+        await run()
+        started_at = time.perf_counter()
+        for _ in range(iterations):
+            await run()
+        per_query = (time.perf_counter() - started_at) / iterations * 1000
+        print(f"{name:<28}{per_query:>16.3f}")
+
+
+async def bench_large(db, rows: int):
+    params = (rows,)
+    variants = {
+        "legacy (SET NAMES + dict)": lambda: legacy_execute_query(db, LARGE_QUERY, params),
+        "execute_query (dict)": lambda: db.execute_query(LARGE_QUERY, params),
+        "execute_query (tuple)": lambda: db.execute_query(LARGE_QUERY, params, row_factory=tuple),
+        "stream_query (collect)": lambda: stream_all(db, LARGE_QUERY, params),
+        "stream_query (consume)": lambda: stream_count(db, LARGE_QUERY, params),
+    }
+    print(f"\nLarge result, {rows} rows")
+    print(f"{'variant':<28}{'total, s':>12}{'peak memory, MB':>18}")
+    for name, run in variants.items():
+        tracemalloc.start()
+        started_at = time.perf_counter()
+        result = await run()
+        elapsed = time.perf_counter() - started_at
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del result
+        print(f"{name:<28}{elapsed:>12.3f}{peak / 2 ** 20:>18.1f}")
+
+
+async def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    rows = int(sys.argv[2]) if len(sys.argv) > 2 else 200000
+    db = get_database()
+    await db.connect()
+    try:
+        await bench_point(db, iterations)
+        await bench_large(db, rows)
+    finally:
+        await db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
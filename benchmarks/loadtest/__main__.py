@@ -0,0 +1,315 @@
+"""
+End-to-end load test of src.main:app against local stand-ins
+
+Runs the real FastAPI app (webhook mode) in process with a fake Telegram
+Bot API, a fake OpenAI server with configurable latency, an in-process
+MySQL stand-in (or the MySQL from .env with --mysql) and a fake Google
+Sheets backend. Synthetic users send registrations, orders, corrections
+and confirm callbacks at the target rate. The machine-readable report
+has throughput, p50/p95/p99 per stage and error rates.
+
+Usage:
+    python -m benchmarks.loadtest --rate 20 --duration 60 --out report.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import sys
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiohttp
+
+from .fakes import CATALOG, FakeDatabase, FakeOpenAIServer, FakeSheetsService, FakeTelegramServer
+from .scenario import ADMIN_ID, Scenario, Step
+
+STAGES = {
+    "webhook": "webhook_request_seconds",
+    "update_processing": "update_processing_seconds",
+    "order_parse": "order_parse_seconds",
+    "openai_queue": "openai_queue_seconds",
+    "openai_model": "openai_model_seconds",
+    "db_query": "db_query_seconds",
+    "db_pool_acquire": "db_pool_acquire_seconds",
+    "sheets_write": "sheets_write_seconds",
+    "telegram_api": "telegram_api_seconds",
+}
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Order bot load test")
+    parser.add_argument("--rate", type=float, default=10.0, help="target updates per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="load duration in seconds")
+    parser.add_argument("--customers", type=int, default=500, help="number of approved synthetic customers")
+    parser.add_argument("--think-time", type=float, default=1.5, help="pause between steps of a flow, seconds")
+    parser.add_argument("--openai-latency", type=float, default=0.8, help="mean fake OpenAI latency, seconds")
+    parser.add_argument("--openai-jitter", type=float, default=0.3, help="fake OpenAI latency deviation, seconds")
+    parser.add_argument("--openai-error-rate", type=float, default=0.0, help="share of fake OpenAI 429 answers")
+    parser.add_argument("--telegram-latency", type=float, default=0.02, help="fake Bot API latency, seconds")
+    parser.add_argument("--db-latency", type=float, default=0.001, help="in-process MySQL stand-in latency, seconds")
+    parser.add_argument("--sheets-latency", type=float, default=0.3, help="fake Sheets append latency, seconds")
+    parser.add_argument("--mysql", action="store_true", help="use MySQL from .env instead of the in-process stand-in")
+    parser.add_argument("--grace", type=float, default=30.0, help="max wait for in-flight updates after load, seconds")
+    parser.add_argument("--seed", type=int, default=None, help="random seed of the scenario")
+    parser.add_argument("--out", default=None, help="report path (JSON), stdout if omitted")
+    parser.add_argument("--log-level", default="WARNING")
+    return parser.parse_args()
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _percentiles(samples: List[float]) -> Dict[str, Optional[float]]:
+    if not samples:
+        return {"count": 0, "p50": None, "p95": None, "p99": None}
+    ordered = sorted(samples)
+
+    def pick(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 4)
+
+    return {"count": len(ordered), "p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99)}
+
+
+def _histogram_summary(histogram) -> Dict[str, Optional[float]]:
+    def rounded(value):
+        return round(value, 4) if value is not None else None
+
+    return {
+        "count": histogram.count(),
+        "p50": rounded(histogram.quantile(0.5)),
+        "p95": rounded(histogram.quantile(0.95)),
+        "p99": rounded(histogram.quantile(0.99)),
+    }
+
+
+class LoadTest:
+    """Runs the app with fakes and drives synthetic traffic"""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.telegram = FakeTelegramServer(latency=args.telegram_latency)
+        self.openai = FakeOpenAIServer(
+            latency=args.openai_latency,
+            jitter=args.openai_jitter,
+            error_rate=args.openai_error_rate,
+        )
+        self.scenario = Scenario(customers=args.customers, seed=args.seed)
+        self.port = _free_port()
+        # (kind, reply_chat_id, sent_at, ack_latency, status)
+        self.sent: List[Tuple[str, Optional[int], float, float, int]] = []
+        self.transport_errors = 0
+
+    def _configure_env(self):
+        os.environ.update({
+            "BOT_TOKEN": "123456789:LOADTEST",
+            "BOT_ADMIN_IDS": str(ADMIN_ID),
+            "BOT_API_URL": self.telegram.url,
+            "OPENAI_API_KEY": "load-test",
+            "OPENAI_BASE_URL": self.openai.url,
+            "WEBHOOK_URL": f"http://127.0.0.1:{self.port}/webhook_17821",
+            "WEBHOOK_PATH": "/webhook_17821",
+        })
+
+    def _install_fakes(self):
+        import src.database.connection as connection
+        import src.google_sheets.service as sheets
+
+        if not self.args.mysql:
+            connection._database = FakeDatabase(latency=self.args.db_latency)
+        sheets._sheets_service = FakeSheetsService(latency=self.args.sheets_latency)
+
+    async def _seed(self):
+        from src.database import User, get_database
+
+        if self.args.mysql:
+            # The in-process stand-in already has the catalog
+            await get_database().execute_many(
+                """INSERT IGNORE INTO assortment (good_id, name, type, price_c, price_amt, min_size)
+                   VALUES (%s, %s, %s, %s, %s, %s)""",
+                [(p["good_id"], p["name"], p["type"], p["price_c"], p["price_amt"], p["min_size"]) for p in CATALOG]
+            )
+        for user_id in [ADMIN_ID] + self.scenario.customers:
+            await User(
+                user_id=user_id,
+                user_name=f"User{user_id}",
+                tg_account=f"@user{user_id}",
+                user_info=f"Load test {user_id}",
+                approved=True,
+                date_register=datetime.now(),
+            ).save()
+
+    async def _post(self, session: aiohttp.ClientSession, step: Step):
+        payload = await step.resolve() if step.resolve else step.payload
+        body = json.dumps(payload, ensure_ascii=False).encode()
+        sent_at = time.monotonic()
+        try:
+            async with session.post(
+                f"http://127.0.0.1:{self.port}/webhook_17821",
+                data=body,
+                headers={"Content-Type": "application/json"},
+            ) as response:
+                await response.read()
+                status = response.status
+        except aiohttp.ClientError:
+            self.transport_errors += 1
+            status = 0
+        self.sent.append((step.kind, step.reply_chat_id, sent_at, time.monotonic() - sent_at, status))
+
+    async def _flow(self, session: aiohttp.ClientSession, steps: List[Step]):
+        for i, step in enumerate(steps):
+            if i:
+                await asyncio.sleep(self.args.think_time)
+            await self._post(session, step)
+
+    async def _generate(self, session: aiohttp.ClientSession):
+        flows_per_second = self.args.rate / self.scenario.average_steps
+        interval = 1.0 / flows_per_second
+        started_at = time.monotonic()
+        tasks = []
+        next_at = started_at
+        while time.monotonic() - started_at < self.args.duration:
+            tasks.append(asyncio.create_task(self._flow(session, self.scenario.next_flow())))
+            next_at += interval
+            await asyncio.sleep(max(0.0, next_at - time.monotonic()))
+        await asyncio.gather(*tasks)
+
+    async def _wait_idle(self):
+        from src.updates import get_update_queue
+
+        deadline = time.monotonic() + self.args.grace
+        queue = get_update_queue()
+        while time.monotonic() < deadline and queue and (queue.depth or queue.active):
+            await asyncio.sleep(0.1)
+
+    def _end_to_end(self) -> Tuple[Dict[str, Any], int]:
+        """Time from posting an update to the first bot reply in the expected chat"""
+        by_kind: Dict[str, List[float]] = {}
+        missing = 0
+        for kind, chat_id, sent_at, _, status in self.sent:
+            if chat_id is None or status != 200:
+                continue
+            reply_at = next(
+                (at for at, method, text in self.telegram.events.get(chat_id, [])
+                 if at > sent_at and not text.startswith("🔄")),
+                None,
+            )
+            if reply_at is None:
+                missing += 1
+                continue
+            by_kind.setdefault(kind, []).append(reply_at - sent_at)
+        return {kind: _percentiles(samples) for kind, samples in sorted(by_kind.items())}, missing
+
+    def _report(self, elapsed: float) -> Dict[str, Any]:
+        from src.main import UPDATE_LATENCY, _component_stats
+        from src.metrics import REGISTRY
+
+        statuses: Dict[str, int] = {}
+        for *_, status in self.sent:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        sent = len(self.sent)
+        http_errors = sum(count for status, count in statuses.items() if status != "200")
+        end_to_end, missing_replies = self._end_to_end()
+        processed = UPDATE_LATENCY.count()
+
+        order_parse = REGISTRY.get("order_parse_seconds")
+        telegram_api = REGISTRY.get("telegram_api_seconds")
+        sheets_write = REGISTRY.get("sheets_write_seconds")
+        components = _component_stats()
+
+        return {
+            "generated_at": datetime.now().isoformat(timespec="seconds"),
+            "config": vars(self.args),
+            "elapsed_seconds": round(elapsed, 2),
+            "updates": {
+                "sent": sent,
+                "processed": processed,
+                "http_status": statuses,
+            },
+            "throughput": {
+                "target_rps": self.args.rate,
+                "sent_rps": round(sent / elapsed, 2) if elapsed else 0.0,
+                "processed_rps": round(processed / elapsed, 2) if elapsed else 0.0,
+            },
+            "latency": {
+                "webhook_ack": _percentiles([ack for _, _, _, ack, _ in self.sent]),
+                "end_to_end": end_to_end,
+            },
+            "stages": {name: _histogram_summary(REGISTRY.get(metric)) for name, metric in STAGES.items()},
+            "errors": {
+                "webhook_error_rate": round(http_errors / sent, 4) if sent else 0.0,
+                "transport_errors": self.transport_errors,
+                "update_failures": (components["update_queue"] or {}).get("failed", 0),
+                "parse_failures": order_parse.count(result="failed"),
+                "telegram_api_errors": telegram_api.count(result="error"),
+                "sheets_failures": sheets_write.count(result="failed"),
+                "missing_replies": missing_replies,
+            },
+            "fakes": {
+                "openai_requests": self.openai.requests,
+                "telegram_calls": dict(self.telegram.calls),
+            },
+            "components": components,
+        }
+
+    async def run(self) -> Dict[str, Any]:
+        import uvicorn
+
+        await self.telegram.start()
+        await self.openai.start()
+        self._configure_env()
+
+        # Settings are read on import, so the app is imported after env is set
+        from src.main import app
+        logging.getLogger().setLevel(self.args.log_level)
+        self._install_fakes()
+
+        server = uvicorn.Server(uvicorn.Config(
+            app,
+            host="127.0.0.1",
+            port=self.port,
+            log_level=self.args.log_level.lower(),
+            lifespan="on",
+        ))
+        server_task = asyncio.create_task(server.serve())
+        while not server.started:
+            if server_task.done():
+                raise RuntimeError("Application failed to start")
+            await asyncio.sleep(0.05)
+
+        try:
+            await self._seed()
+            connector = aiohttp.TCPConnector(limit=0)
+            async with aiohttp.ClientSession(connector=connector) as session:
+                started_at = time.monotonic()
+                await self._generate(session)
+                await self._wait_idle()
+                elapsed = time.monotonic() - started_at
+            return self._report(elapsed)
+        finally:
+            server.should_exit = True
+            await server_task
+            await self.openai.stop()
+            await self.telegram.stop()
+
+
+def main():
+    args = parse_args()
+    report = asyncio.run(LoadTest(args).run())
+    text = json.dumps(report, ensure_ascii=False, indent=2, default=str)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as file:
+            file.write(text)
+        print(f"Report written to {args.out}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,454 @@
+"""Local stand-ins for Telegram Bot API, OpenAI, MySQL and Google Sheets"""
+import asyncio
+import itertools
+import json
+import logging
+import random
+import re
+import time
+import zlib
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+from src.database.connection import Database, DB_QUERY_LATENCY, _query_label
+from src.google_sheets.service import GoogleSheetsService
+
+logger = logging.getLogger(__name__)
+
+BOT_USER = {"id": 7000000001, "is_bot": True, "first_name": "LoadTestBot", "username": "load_test_bot"}
+
+CATALOG = [
+    {"good_id": 1, "name": "Гаус", "type": "л", "price_c": 150.0, "price_amt": 160.0, "min_size": 30.0},
+    {"good_id": 2, "name": "Хорошечное", "type": "л", "price_c": 140.0, "price_amt": 150.0, "min_size": 30.0},
+    {"good_id": 3, "name": "Лагер", "type": "л", "price_c": 120.0, "price_amt": 130.0, "min_size": 30.0},
+    {"good_id": 4, "name": "Портер", "type": "л", "price_c": 170.0, "price_amt": 180.0, "min_size": 30.0},
+    {"good_id": 5, "name": "Сидр яблочный", "type": "термокега", "price_c": 200.0, "price_amt": 210.0, "min_size": 25.0},
+    {"good_id": 6, "name": "Чипсы", "type": "шт", "price_c": 90.0, "price_amt": 95.0, "min_size": 1.0},
+]
+
+
+async def _run_site(app: web.Application, host: str = "127.0.0.1") -> Tuple[web.AppRunner, int]:
+    """Start aiohttp app on a free port"""
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, port
+
+
+class FakeTelegramServer:
+    """
+    Bot API stand-in: answers the methods the bot uses and records every
+    outgoing message with its time, so the harness can measure replies.
+    """
+
+    def __init__(self, latency: float = 0.02):
+        self.latency = latency
+        self.events: Dict[int, List[Tuple[float, str, str]]] = defaultdict(list)
+        self.calls: Dict[str, int] = defaultdict(int)
+        self._message_ids = itertools.count(1000)
+        self._runner: Optional[web.AppRunner] = None
+        self.url = ""
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner, port = await _run_site(app)
+        self.url = f"http://127.0.0.1:{port}"
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    def _message(self, chat_id: int, text: str, message_id: Optional[int] = None) -> Dict[str, Any]:
+        return {
+            "message_id": message_id or next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            "text": text,
+        }
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        params = dict(await request.post())
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        result: Any = True
+        if method == "getme":
+            result = BOT_USER
+        elif method == "getwebhookinfo":
+            result = {"url": "", "has_custom_certificate": False, "pending_update_count": 0}
+        elif method in ("sendmessage", "editmessagetext"):
+            chat_id = int(params.get("chat_id", 0))
+            text = params.get("text", "")
+            self.events[chat_id].append((time.monotonic(), method, text))
+            message_id = int(params["message_id"]) if params.get("message_id") else None
+            result = self._message(chat_id, text, message_id)
+        return web.json_response({"ok": True, "result": result})
+
+
+class FakeOpenAIServer:
+    """
+    OpenAI chat completions stand-in with configurable latency.
+
+    Builds a valid order from catalog names found in the user message.
+    """
+
+    def __init__(self, latency: float = 0.8, jitter: float = 0.3, error_rate: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.requests = 0
+        self._runner: Optional[web.AppRunner] = None
+        self.url = ""
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self._handle)
+        self._runner, port = await _run_site(app)
+        self.url = f"http://127.0.0.1:{port}/v1"
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    @staticmethod
+    def build_order(message: str) -> List[Dict[str, Any]]:
+        goods = {}
+        lowered = message.lower()
+        for product in CATALOG:
+            match = re.search(re.escape(product["name"].lower()) + r"\D{0,12}(\d+)", lowered)
+            if match:
+                goods[str(product["good_id"])] = int(match.group(1))
+        address = re.search(r"адрес:?\s*([^,.\n]+\d+)", message, re.IGNORECASE)
+        return [{
+            "date_delivery": (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d"),
+            "adress": address.group(1).strip() if address else "Иванова 12",
+            "goods": goods,
+            "payment_type": "price_c" if "нал" in lowered.replace("безнал", "") else "price_amt",
+            "company_name": None,
+        }]
+
+    @staticmethod
+    def build_patch(message: str) -> List[Dict[str, Any]]:
+        """Correction patch: goods and address as in the correction, the rest of the goods removed"""
+        current, _, correction = message.partition("Уточнение:")
+        order = FakeOpenAIServer.build_order(correction)[0]
+        operations: List[Dict[str, Any]] = [
+            {"op": "set_goods", "order": 0, "good_id": int(good_id), "number": number, "unit": None}
+            for good_id, number in order["goods"].items()
+        ]
+        for product in CATALOG:
+            if f'"good_id":{product["good_id"]},' in current and str(product["good_id"]) not in order["goods"]:
+                operations.append({"op": "remove_goods", "order": 0, "good_id": product["good_id"]})
+        if re.search(r"адрес", correction, re.IGNORECASE):
+            operations.append({"op": "set", "order": 0, "field": "adress", "value": order["adress"]})
+        return operations
+
+    async def _handle(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        self.requests += 1
+        await asyncio.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+        if random.random() < self.error_rate:
+            return web.json_response(
+                {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                status=429,
+            )
+
+        user_message = body["messages"][-1]["content"]
+        if "Текущий заказ:" in user_message:
+            content = json.dumps(self.build_patch(user_message), ensure_ascii=False)
+        else:
+            content = json.dumps(self.build_order(user_message), ensure_ascii=False)
+        prompt_tokens = sum(len(m["content"]) for m in body["messages"]) // 4
+        completion_tokens = len(content) // 4
+
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+
+        if body.get("stream"):
+            return await self._stream(request, body, content, usage)
+
+        return web.json_response({
+            "id": f"chatcmpl-{self.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": usage,
+        })
+
+    async def _stream(self, request: web.Request, body: Dict[str, Any], content: str,
+                      usage: Dict[str, int]) -> web.StreamResponse:
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for i in range(0, len(content), 16):
+            chunk = {
+                "id": f"chatcmpl-{self.requests}",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model", "fake"),
+                "choices": [{"index": 0, "delta": {"content": content[i:i + 16]}, "finish_reason": None}],
+            }
+            await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+            await asyncio.sleep(0.005)
+        if (body.get("stream_options") or {}).get("include_usage"):
+            chunk = {
+                "id": f"chatcmpl-{self.requests}",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model", "fake"),
+                "choices": [],
+                "usage": usage,
+            }
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+
+class FakeDatabase(Database):
+    """
+    In-process stand-in for MySQL: keeps the tables the bot uses in dicts
+    and answers the bot's queries by their text, with simulated latency.
+    """
+
+    def __init__(self, latency: float = 0.001):
+        super().__init__()
+        self.latency = latency
+        self.users: Dict[int, Dict[str, Any]] = {}
+        self.assortment: Dict[int, Dict[str, Any]] = {p["good_id"]: dict(p) for p in CATALOG}
+        self.orders: Dict[int, Dict[str, Any]] = {}
+        self.telegram_updates: Dict[int, float] = {}
+        self.fsm: Dict[str, Dict[str, Any]] = {}
+        self.parse_cache: Dict[str, str] = {}
+        self._order_ids = itertools.count(1)
+        self._unknown: set = set()
+        self._handlers: List[Tuple[re.Pattern, Callable]] = [
+            (re.compile(r"^select \* from users where user_id"), self._select_user),
+            (re.compile(r"^select \* from users where user_name"), self._select_user_by_name),
+            (re.compile(r"^insert into users"), self._upsert_user),
+            (re.compile(r"^update users set approved"), self._update_approval),
+            (re.compile(r"^update users set user_name = coalesce"), self._update_user_info),
+            (re.compile(r"^select .+ from assortment where good_id"), self._select_product),
+            (re.compile(r"^select count\(\*\), coalesce\(sum\(crc32"), self._assortment_checksum),
+            (re.compile(r"^select .+ from assortment$"), self._select_assortment),
+            (re.compile(r"^insert into orders"), self._insert_order),
+            (re.compile(r"^update orders set status = %s where order_id = %s$"), self._update_order_status),
+            (re.compile(r"^update orders set status = %s where order_id = %s and status = %s$"), self._transition_order_status),
+            (re.compile(r"^select .+ from orders where order_id = %s"), self._select_order),
+            (re.compile(r"^select .+ from orders where user_id = %s and status = 'pending_admin'"), self._select_pending_order),
+            (re.compile(r"^select .+ from orders where user_id = %s and status = 'confirmed'"), self._select_confirmed_orders),
+            (re.compile(r"^insert ignore into telegram_updates"), self._insert_update_id),
+            (re.compile(r"^delete from telegram_updates"), self._noop),
+            (re.compile(r"^select result from parse_cache"), self._select_parse_cache),
+            (re.compile(r"^insert into parse_cache"), self._upsert_parse_cache),
+            (re.compile(r"^delete from parse_cache"), self._noop),
+            (re.compile(r"^select state, data from fsm_storage"), self._select_fsm),
+            (re.compile(r"^insert into fsm_storage"), self._upsert_fsm),
+            (re.compile(r"^delete from fsm_storage"), self._noop),
+        ]
+
+    async def connect(self):
+        return None
+
+    async def close(self):
+        return None
+
+    def pool_stats(self) -> Dict[str, float]:
+        return {}
+
+    async def _dispatch(self, query: str, params: tuple) -> Tuple[Any, int]:
+        normalized = " ".join(query.split()).lower()
+        with DB_QUERY_LATENCY.labels(query=_query_label(query)).time():
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            for pattern, handler in self._handlers:
+                if pattern.search(normalized):
+                    return handler(params or ())
+        if normalized not in self._unknown:
+            self._unknown.add(normalized)
+            logger.warning(f"FakeDatabase does not know query: {normalized[:120]}")
+        return [], 0
+
+    async def execute_query(self, query: str, params: tuple = None, row_factory=None,
+                            use_primary: bool = False) -> Optional[List[Any]]:
+        result, _ = await self._dispatch(query, params)
+        if row_factory:
+            # Handlers build rows with keys in SELECT order
+            return [row_factory(tuple(row.values())) for row in result]
+        return result
+
+    async def stream_query(self, query: str, params: tuple = None, row_factory=None,
+                           batch_size: int = 1000, use_primary: bool = False) -> AsyncIterator[Any]:
+        for row in await self.execute_query(query, params, row_factory):
+            yield row
+
+    async def execute_command(self, query: str, params: tuple = None) -> int:
+        _, value = await self._dispatch(query, params)
+        return value
+
+    async def execute_rowcount(self, query: str, params: tuple = None) -> int:
+        _, value = await self._dispatch(query, params)
+        return value
+
+    async def execute_many(self, query: str, params_list: List[tuple]) -> int:
+        total = 0
+        for params in params_list:
+            _, value = await self._dispatch(query, params)
+            total += value or 0
+        return total
+
+    # Query handlers return (rows, lastrowid or rowcount)
+
+    def _noop(self, params):
+        return [], 0
+
+    def _select_user(self, params):
+        user = self.users.get(int(params[0]))
+        return ([dict(user)] if user else []), 0
+
+    def _select_user_by_name(self, params):
+        return [dict(u) for u in self.users.values() if u["user_name"] == params[0]][:1], 0
+
+    def _upsert_user(self, params):
+        user_id, user_name, tg_account, user_info, phone, approved, date_register = params
+        existing = self.users.get(user_id, {})
+        self.users[user_id] = {
+            "user_id": user_id,
+            "user_name": user_name,
+            "tg_account": tg_account,
+            "user_info": user_info,
+            "phone": phone,
+            "approved": approved,
+            "date_register": existing.get("date_register") or date_register or datetime.now(),
+        }
+        return [], 1
+
+    def _update_approval(self, params):
+        approved, user_id = params
+        if user_id in self.users:
+            self.users[user_id]["approved"] = approved
+            return [], 1
+        return [], 0
+
+    def _update_user_info(self, params):
+        user_name, tg_account, user_info, phone, user_id = params
+        user = self.users.get(user_id)
+        if not user:
+            return [], 0
+        for key, value in (("user_name", user_name), ("tg_account", tg_account),
+                           ("user_info", user_info), ("phone", phone)):
+            if value is not None:
+                user[key] = value
+        return [], 1
+
+    def _select_product(self, params):
+        product = self.assortment.get(int(params[0]))
+        return ([dict(product)] if product else []), 0
+
+    def _select_assortment(self, params):
+        return [dict(p) for p in self.assortment.values()], 0
+
+    def _assortment_checksum(self, params):
+        checksum = sum(zlib.crc32("|".join(map(str, p.values())).encode()) for p in self.assortment.values())
+        return [{"count": len(self.assortment), "checksum": checksum}], 0
+
+    def _insert_order(self, params):
+        order_id = next(self._order_ids)
+        user_id, order_data, status = params[:3]
+        self.orders[order_id] = {
+            "order_id": order_id,
+            "user_id": user_id,
+            "order_data": order_data,
+            "status": status,
+            "created_at": datetime.now(),
+        }
+        return [], order_id
+
+    def _update_order_status(self, params):
+        status, order_id = params
+        if order_id in self.orders:
+            self.orders[order_id]["status"] = status
+            return [], 1
+        return [], 0
+
+    def _transition_order_status(self, params):
+        status, order_id, from_status = params
+        order = self.orders.get(order_id)
+        if order and order["status"] == from_status:
+            order["status"] = status
+            return [], 1
+        return [], 0
+
+    def _select_order(self, params):
+        order = self.orders.get(int(params[0]))
+        return ([dict(order)] if order else []), 0
+
+    def _select_pending_order(self, params):
+        user_id = int(params[0])
+        pending = [o for o in self.orders.values() if o["user_id"] == user_id and o["status"] == "pending_admin"]
+        pending.sort(key=lambda o: o["created_at"], reverse=True)
+        return [dict(o) for o in pending[:1]], 0
+
+    def _select_confirmed_orders(self, params):
+        user_id, limit = int(params[0]), int(params[1])
+        confirmed = [o for o in self.orders.values() if o["user_id"] == user_id and o["status"] == "confirmed"]
+        confirmed.sort(key=lambda o: o["created_at"], reverse=True)
+        return [dict(o) for o in confirmed[:limit]], 0
+
+    def _insert_update_id(self, params):
+        update_id = int(params[0])
+        if update_id in self.telegram_updates:
+            return [], 0
+        self.telegram_updates[update_id] = time.time()
+        return [], 1
+
+    def _select_parse_cache(self, params):
+        result = self.parse_cache.get(params[0])
+        return ([{"result": result}] if result is not None else []), 0
+
+    def _upsert_parse_cache(self, params):
+        key, result = params
+        self.parse_cache[key] = result
+        return [], 1
+
+    def _select_fsm(self, params):
+        row = self.fsm.get(params[0])
+        return ([dict(row)] if row else []), 0
+
+    def _upsert_fsm(self, params):
+        storage_key, state, data = params
+        self.fsm[storage_key] = {"state": state, "data": data}
+        return [], 1
+
+
+class FakeSheetsService(GoogleSheetsService):
+    """Google Sheets stand-in that only simulates append latency"""
+
+    def __init__(self, latency: float = 0.3):
+        self.spreadsheet_id = "load-test"
+        self.worksheet_name = "Заказы"
+        self._client = None
+        self._worksheet = None
+        self.latency = latency
+        self.orders_written = 0
+
+    async def _write_order(self, user_id, username, phone, organization, order_data, order_date=None) -> bool:
+        await asyncio.sleep(self.latency)
+        self.orders_written += 1
+        return True
@@ -0,0 +1,153 @@
+"""Synthetic Telegram updates for load tests"""
+import itertools
+import random
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from .fakes import CATALOG
+
+ADMIN_ID = 1
+
+ADDRESSES = ["Иванова 12", "Станиславского 12", "Советская 69/1", "Ленина 4", "Мира 15"]
+COMPANIES = ["ИП Иванов", "ООО Ромашка", "ИП Петров", "ООО Бар", "ИП Сидоров"]
+
+
+@dataclass
+class Step:
+    """One update of a flow"""
+    kind: str
+    payload: Dict[str, Any]
+    # Chat expected to receive the reply (None - no reply is measured)
+    reply_chat_id: Optional[int]
+    # Builds the payload at send time from data created by previous steps
+    resolve: Optional[Callable[[], Awaitable[Dict[str, Any]]]] = None
+
+
+class UpdateFactory:
+    """Builds Telegram update payloads with increasing update ids"""
+
+    def __init__(self, first_update_id: int = 900000000):
+        self._update_ids = itertools.count(first_update_id)
+        self._message_ids = itertools.count(1)
+
+    @staticmethod
+    def _user(user_id: int) -> Dict[str, Any]:
+        return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}"}
+
+    def message(self, user_id: int, text: str) -> Dict[str, Any]:
+        message = {
+            "message_id": next(self._message_ids),
+            "from": self._user(user_id),
+            "chat": {"id": user_id, "type": "private", "first_name": f"User{user_id}"},
+            "date": int(time.time()),
+            "text": text,
+        }
+        if text.startswith("/"):
+            message["entities"] = [{"offset": 0, "length": len(text.split()[0]), "type": "bot_command"}]
+        return {"update_id": next(self._update_ids), "message": message}
+
+    def callback(self, user_id: int, data: str, text: str = "📦 ВАШ ЗАКАЗ") -> Dict[str, Any]:
+        return {
+            "update_id": next(self._update_ids),
+            "callback_query": {
+                "id": str(next(self._message_ids)),
+                "from": self._user(user_id),
+                "chat_instance": str(user_id),
+                "data": data,
+                "message": {
+                    "message_id": next(self._message_ids),
+                    "from": {"id": 7000000001, "is_bot": True, "first_name": "LoadTestBot"},
+                    "chat": {"id": user_id, "type": "private"},
+                    "date": int(time.time()),
+                    "text": text,
+                },
+            },
+        }
+
+
+def goods_text() -> str:
+    """Company and 1-3 products of an order"""
+    products = random.sample(CATALOG, random.randint(1, 3))
+    goods = ", ".join(f"{p['name']} {random.randint(1, 4)} кеги" for p in products)
+    return f"{random.choice(COMPANIES)} {goods}"
+
+
+def address_text() -> str:
+    """Delivery address and date of an order"""
+    date = time.strftime("%d.%m.%Y", time.localtime(time.time() + 86400))
+    return f"Адрес: {random.choice(ADDRESSES)}, на {date}"
+
+
+def order_text() -> str:
+    """Free-form order text mentioning 1-3 products"""
+    return f"{goods_text()}. {address_text()}"
+
+
+class Scenario:
+    """
+    Mix of user flows:
+    - registration: /start, organization, admin approves
+    - order: order text, confirm, admin confirms
+    - correction: order text, corrected text, confirm, admin confirms
+    - split_order: products and address in two messages, confirm, admin confirms
+    """
+
+    FLOWS = {"registration": 0.1, "order": 0.5, "correction": 0.3, "split_order": 0.1}
+
+    def __init__(self, customers: int = 500, seed: Optional[int] = None):
+        self.factory = UpdateFactory()
+        self.customers = [100000 + i for i in range(customers)]
+        # Round robin, so one customer rarely has two flows at a time
+        self._customer_cycle = itertools.cycle(self.customers)
+        self._new_users = itertools.count(5000000)
+        self._random = random.Random(seed)
+
+    @property
+    def average_steps(self) -> float:
+        steps = {"registration": 3, "order": 3, "correction": 4, "split_order": 4}
+        return sum(weight * steps[name] for name, weight in self.FLOWS.items())
+
+    def next_flow(self) -> List[Step]:
+        name = self._random.choices(list(self.FLOWS), weights=list(self.FLOWS.values()))[0]
+        return getattr(self, f"_{name}")()
+
+    def _registration(self) -> List[Step]:
+        user_id = next(self._new_users)
+        f = self.factory
+        return [
+            Step("start", f.message(user_id, "/start"), user_id),
+            Step("registration", f.message(user_id, f"{random.choice(COMPANIES)}, Иван"), user_id),
+            Step("admin_approve", f.callback(ADMIN_ID, f"approve_user:{user_id}", "🔔 Новый пользователь"), user_id),
+        ]
+
+    def _order(self, correction: bool = False, split: bool = False) -> List[Step]:
+        user_id = next(self._customer_cycle)
+        f = self.factory
+        if split:
+            # The bot waits for the address, the reply comes to the second message
+            steps = [
+                Step("split_goods", f.message(user_id, goods_text()), None),
+                Step("split_address", f.message(user_id, address_text()), user_id),
+            ]
+        else:
+            steps = [Step("order", f.message(user_id, order_text()), user_id)]
+        if correction:
+            steps.append(Step("correction", f.message(user_id, order_text()), user_id))
+        steps.append(Step("confirm", f.callback(user_id, "confirm_order"), user_id))
+        steps.append(Step("admin_confirm", {}, user_id, resolve=lambda: self._admin_confirm(user_id)))
+        return steps
+
+    async def _admin_confirm(self, user_id: int) -> Dict[str, Any]:
+        """Admin button of the order confirmed by the user (as the bot would have sent it)"""
+        from src.database import Order
+
+        order = await Order.get_latest_pending(user_id)
+        data = f"admin_order:{order.order_id}" if order else f"admin_confirm:{user_id}:0"
+        return self.factory.callback(ADMIN_ID, data, "📦 НОВЫЙ ЗАКАЗ")
+
+    def _correction(self) -> List[Step]:
+        return self._order(correction=True)
+
+    def _split_order(self) -> List[Step]:
+        return self._order(split=True)
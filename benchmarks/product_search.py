@@ -0,0 +1,101 @@
+"""
+Benchmark of the product search index on synthetic catalogs
+
+Builds catalogs of 1k/10k/100k products from brewery-like names and
+measures index build time, incremental sync after 1% of products
+changed, and search latency for shorthand, typo and full-message
+queries.
+
+Usage:
+    python -m benchmarks.product_search [queries]
+"""
+import random
+import statistics
+import sys
+import time
+
+from src.ai_service.search import ProductSearchIndex
+from src.database import Assortment, AssortmentSnapshot
+
+SIZES = (1000, 10000, 100000)
+
+STYLES = ["Лагер", "Портер", "Стаут", "Эль", "Пилснер", "Сидр", "Медовуха", "Вайцен", "Бок", "Дункель", "Гозе", "Квас"]
+ADJECTIVES = ["светлый", "темный", "янтарный", "нефильтрованный", "пшеничный", "яблочный", "вишневый",
+              "крепкий", "легкий", "ночной", "северный", "хмельной", "бархатный", "золотой", "живой"]
+BRANDS = ["Гаус", "Хорошечное", "Жигули", "Бавария", "Тверь", "Волга", "Сибирь", "Ладога", "Каспий",
+          "Урал", "Байкал", "Алтай", "Кубань", "Карелия", "Ямал", "Таймыр"]
+TYPES = ["л", "термокега", "шт"]
+
+
+def make_name(rng: random.Random, i: int) -> str:
+    name = f"{rng.choice(BRANDS)} {rng.choice(STYLES)} {rng.choice(ADJECTIVES)}"
+    # Unique suffix like a batch/series code
+    return f"{name} {rng.choice(BRANDS)[:3]}{i}"
+
+
+def make_snapshot(size: int, version: str, rng: random.Random) -> AssortmentSnapshot:
+    products = [
+        Assortment(i, make_name(rng, i), rng.choice(TYPES), 100.0, 110.0, 30.0)
+        for i in range(1, size + 1)
+    ]
+    return AssortmentSnapshot.build(version, products)
+
+
+def make_queries(snapshot: AssortmentSnapshot, count: int, rng: random.Random):
+    queries = []
+    for _ in range(count):
+        product = rng.choice(snapshot.products)
+        words = product.name.split()
+        kind = rng.choice(["shorthand", "typo", "message"])
+        if kind == "shorthand":
+            text = f"{words[0][:5]} {words[-1]} {rng.randint(1, 4)} кеги"
+        elif kind == "typo":
+            word = words[1]
+            pos = rng.randrange(len(word))
+            text = " ".join([words[0], word[:pos] + word[pos + 1:], *words[2:]])
+        else:
+            text = f"ИП Иванов, {product.name.lower()} 2 кеги, адрес Ленина 4, на завтра"
+        queries.append((product.good_id, text))
+    return queries
+
+
+def main():
+    query_count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    rng = random.Random(42)
+    print(f"{'products':>9}{'build, s':>10}{'sync 1%, ms':>13}{'p50, us':>10}{'p99, us':>10}{'top1':>7}{'top5':>7}")
+    for size in SIZES:
+        snapshot = make_snapshot(size, "v1", rng)
+        index = ProductSearchIndex()
+        started_at = time.perf_counter()
+        index.sync(snapshot)
+        build = time.perf_counter() - started_at
+
+        # 1% of products renamed
+        products = list(snapshot.products)
+        for i in rng.sample(range(size), size // 100):
+            old = products[i]
+            products[i] = Assortment(old.good_id, make_name(rng, old.good_id), old.type, old.price_c,
+                                     old.price_amt, old.min_size)
+        changed = AssortmentSnapshot.build("v2", products)
+        started_at = time.perf_counter()
+        index.sync(changed)
+        sync = time.perf_counter() - started_at
+
+        timings = []
+        top1 = top5 = 0
+        for good_id, text in make_queries(changed, query_count, rng):
+            started_at = time.perf_counter()
+            results = index.search(text, limit=5)
+            timings.append(time.perf_counter() - started_at)
+            ids = [result.good_id for result in results]
+            top1 += bool(ids) and ids[0] == good_id
+            top5 += good_id in ids
+        timings.sort()
+        p50 = statistics.median(timings) * 1e6
+        p99 = timings[int(len(timings) * 0.99)] * 1e6
+        print(f"{size:>9}{build:>10.2f}{sync * 1000:>13.1f}{p50:>10.0f}{p99:>10.0f}"
+              f"{top1 / query_count:>7.2f}{top5 / query_count:>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Report of system prompt size before and after the compact catalog
+
+Compares the previous prompt (catalog as JSON at the top, rebuilt on
+every request) with the current one (static instructions first, TSV
+catalog after them) on the load test catalog and on synthetic catalogs.
+Token counts come from tiktoken (o200k_base, the gpt-4o encoding) when
+it and its encoding file are available, otherwise they are estimated
+from the byte length and marked as such. Also reports how long the
+byte-identical prefix of two prompts is, i.e. what the provider's
+prompt caching can reuse.
+
+With --api a real chat completion is made with each prompt (OpenAI
+credentials from .env) and usage.prompt_tokens is reported instead.
+
+Usage:
+    python -m benchmarks.prompt_tokens [--api]
+"""
+import asyncio
+import json
+import random
+import sys
+from typing import Callable, List, Optional, Tuple
+
+from benchmarks.loadtest.fakes import CATALOG
+from benchmarks.product_search import make_snapshot
+from src.ai_service.order_parser import OrderParser
+from src.database import Assortment, AssortmentSnapshot
+
+SYNTHETIC_SIZES = (100, 1000)
+
+# Prompt template before the change, kept verbatim for comparison
+LEGACY_TEMPLATE = '''
+1. Товары (Ассортимент) в формате JSON:
+%s
+End
+
+Твоя задача: прочитать сообщение от клиента и выявить что он хотел заказать. Определить good_id по названию товара (name)  и кол-во! Выявить Дату доставки,
+Выявить Адресса Заказов. 
+Вернуть ответ в JSON
+[
+{'date_delivery':'(дата доставки)','adress':'(Наименование адреса)','goods':{(good_id из ассортимента 1,2 20 и тп):(кол-во товара), ... },'payment_type':(тип оплаты- price_c или price_amt ), company_name : (Название компании из сообщения если явно указанно либо null)
+}, ...]
+Если Адресов больше 1, то вернуть столько же json в списке
+Без переносов строки без посторонних символов
+Адрес может быть как 1м словом так и сцифрой или дробью "\\" или "/" или любым знаком
+    Пример: [Наименование адреса] 69/1 , [Наименование адреса] 12\\1, [Наименование адреса] 4 или [Наименование адреса]
+
+Примечание: Цены указаны в рублях. "Нал" - оплата наличными, "Безнал" - безналичный расчет. "Мин. объем/партия" - минимальный объем заказа в литрах или минимальное количество штук.
+ 1 кега - 30 литров. Заказ всегда нужно переаодить в ЛИТРЫ (л.) например если пользватель написал Гаус 1 кега или Гаус 1 то это будет - Гаус 30
+ 1 термокега - 20 или 25 литров. Если явно не указано что клиент хочет термокегу то считать то он хочет обычную кегу. Если явно не указан объем термокеги считать 25 литров
+
+Заказ может быть в литрах, кегах , термокегах или штуках поле type из ассортемента
+    Примечание: Минимальный заказ — определяется min_size из ассортимента.
+        литры / кеги : Можно заказать 30 л 60 л, 90 л, 120 л и т.д. (кратно полю min_size). В ответах используй правильные склонения: 1 кега, 2 кеги, 5 кег.
+        термокеги : Можно заказать 20 / 25 л, 40 /50 ли т.д. (кратно полю min_size). В ответах используй правильные склонения: 1 термокега, 2 термокеги, 5 термокег.
+        Штуки : Можно заказать 1, 2, 3 и т.д. (кратно полю min_size). В ответах используй правильные склонения: 1 штука, 2 штуки, 5 штук.
+
+'''
+
+
+def legacy_prompt(snapshot: AssortmentSnapshot) -> str:
+    return (LEGACY_TEMPLATE % json.dumps(snapshot.as_dicts(), ensure_ascii=False)).replace("'", '"')
+
+
+def current_prompt(snapshot: AssortmentSnapshot) -> str:
+    return OrderParser.__new__(OrderParser)._build_system_prompt(snapshot.products)
+
+
+def token_counter() -> Tuple[Callable[[str], int], str]:
+    """Exact counter if tiktoken can load o200k_base, byte length heuristic otherwise"""
+    try:
+        import tiktoken
+        encoding = tiktoken.get_encoding("o200k_base")
+        return (lambda text: len(encoding.encode(text))), "tiktoken o200k_base"
+    except Exception:
+        # Cyrillic-heavy text averages about 4 UTF-8 bytes per token
+        return (lambda text: round(len(text.encode()) / 4)), "estimate: utf-8 bytes / 4"
+
+
+def common_prefix(a: str, b: str) -> int:
+    """Length in characters of the byte-identical prefix"""
+    length = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        length += 1
+    return length
+
+
+async def api_prompt_tokens(prompt: str) -> Optional[int]:
+    from openai import AsyncOpenAI
+    from src.config import get_settings
+
+    settings = get_settings().ai
+    client = AsyncOpenAI(api_key=settings.api_key, base_url=settings.base_url or None)
+    response = await client.chat.completions.create(
+        model=settings.model,
+        messages=[{"role": "system", "content": prompt}, {"role": "user", "content": "Гаус 1"}],
+        max_tokens=1,
+    )
+    return response.usage.prompt_tokens if response.usage else None
+
+
+def snapshots() -> List[Tuple[str, AssortmentSnapshot]]:
+    rng = random.Random(17)
+    result = [("loadtest", AssortmentSnapshot.build("loadtest", [Assortment(**row) for row in CATALOG]))]
+    for size in SYNTHETIC_SIZES:
+        result.append((f"synthetic {size}", make_snapshot(size, str(size), rng)))
+    return result
+
+
+async def main():
+    use_api = "--api" in sys.argv
+    count, method = token_counter()
+    if use_api:
+        method = "usage.prompt_tokens from the API"
+    print(f"Tokens: {method}")
+    print(f"{'catalog':<16}{'legacy':>10}{'current':>10}{'saved':>8}{'prefix legacy':>16}{'prefix current':>16}")
+
+    for name, snapshot in snapshots():
+        legacy, current = legacy_prompt(snapshot), current_prompt(snapshot)
+        if use_api:
+            legacy_tokens, current_tokens = await api_prompt_tokens(legacy), await api_prompt_tokens(current)
+        else:
+            legacy_tokens, current_tokens = count(legacy), count(current)
+
+        # Stable prefix across assortment versions: same catalog with one price changed
+        products = list(snapshot.products)
+        first = products[0]
+        products[0] = Assortment(first.good_id, first.name, first.type, first.price_c + 1, first.price_amt, first.min_size)
+        changed = AssortmentSnapshot.build(snapshot.version + "-changed", products)
+        legacy_prefix = common_prefix(legacy, legacy_prompt(changed))
+        current_prefix = common_prefix(current, current_prompt(changed))
+
+        saved = 1 - current_tokens / legacy_tokens if legacy_tokens else 0.0
+        print(
+            f"{name:<16}{legacy_tokens:>10}{current_tokens:>10}{saved:>8.0%}"
+            f"{count(legacy[:legacy_prefix]):>16}{count(current[:current_prefix]):>16}"
+        )
+    print("\nprefix: tokens shared by prompts before and after a price change (reusable by prompt caching)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
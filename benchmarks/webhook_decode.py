@@ -0,0 +1,60 @@
+"""
+Microbenchmark of webhook payload decoding
+
+Compares the old path (request.json() + Update(**data)) with the fast path
+(payload head peek + Update.model_validate_json) on recorded payloads.
+
+Usage:
+    python -m benchmarks.webhook_decode [iterations]
+"""
+import json
+import sys
+import timeit
+from pathlib import Path
+
+from aiogram.types import Update
+
+from src.updates.decoding import UpdateDecoder, peek_update
+
+PAYLOADS_PATH = Path(__file__).parent / "payloads" / "updates.json"
+ALLOWED_TYPES = ["message", "callback_query"]
+
+
+def load_payloads():
+    """Load recorded payloads as raw request bodies"""
+    updates = json.loads(PAYLOADS_PATH.read_text(encoding="utf-8"))
+    return [json.dumps(update, ensure_ascii=False).encode() for update in updates]
+
+
+def decode_old(body: bytes):
+    data = json.loads(body)
+    return Update(**data)
+
+
+def make_decode_fast(decoder: UpdateDecoder):
+    def decode_fast(body: bytes):
+        head = peek_update(body)
+        if head and not decoder.is_allowed(head[1]):
+            return None
+        return decoder.decode(body)
+    return decode_fast
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    bodies = load_payloads()
+    decode_fast = make_decode_fast(UpdateDecoder(bot=None, allowed_types=ALLOWED_TYPES))
+
+    print(f"{len(bodies)} payloads x {iterations} iterations")
+    print(f"{'path':<8}{'total, s':>12}{'per update, us':>18}")
+    results = {}
+    for name, func in (("old", decode_old), ("fast", decode_fast)):
+        total = timeit.timeit(lambda: [func(body) for body in bodies], number=iterations)
+        results[name] = total
+        per_update = total / (iterations * len(bodies)) * 1e6
+        print(f"{name:<8}{total:>12.3f}{per_update:>18.1f}")
+    print(f"speedup: {results['old'] / results['fast']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
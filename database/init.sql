@@ -15,10 +15,38 @@ CREATE TABLE IF NOT EXISTS orders (
     status VARCHAR(50) DEFAULT 'pending',
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
-    INDEX idx_user_id (user_id),
+    INDEX idx_user_status_created (user_id, status, created_at),
     INDEX idx_status (status)
 );
 
+-- Existing databases: replace idx_user_id with the composite index
+-- (it also serves the foreign key, being prefixed by user_id)
+-- ALTER TABLE orders ADD INDEX idx_user_status_created (user_id, status, created_at), DROP INDEX idx_user_id;
+
+-- Create processed Telegram updates table (shared de-duplication, UPDATE_DEDUP_BACKEND=mysql)
+CREATE TABLE IF NOT EXISTS telegram_updates (
+    update_id BIGINT PRIMARY KEY,
+    received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_received_at (received_at)
+);
+
+-- Create FSM storage table (conversation state shared by replicas, FSM_STORAGE=mysql)
+CREATE TABLE IF NOT EXISTS fsm_storage (
+    storage_key VARCHAR(255) PRIMARY KEY,
+    state VARCHAR(255) NULL,
+    data JSON NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    INDEX idx_updated_at (updated_at)
+);
+
+-- Create order parse cache table (AI results shared by replicas, PARSE_CACHE_BACKEND=mysql)
+CREATE TABLE IF NOT EXISTS parse_cache (
+    cache_key CHAR(64) PRIMARY KEY,
+    result JSON NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_created_at (created_at)
+);
+
 -- Note: assortment table should already exist in your database
 -- If not, create it with the following structure:
 -- CREATE TABLE IF NOT EXISTS assortment (
@@ -1,6 +1,22 @@
 """AI Service module"""
 
 from .order_parser import OrderParser, get_order_parser
+from .local_parser import LocalOrderParser, LocalParseResult
+from .parse_cache import ParseCache, get_parse_cache
+from .search import ProductSearchIndex, SearchResult, get_search_index, get_product_index
+from .streaming import OrderStreamParser, StreamedOrder
 
-__all__ = ["OrderParser", "get_order_parser"]
-
+__all__ = [
+    "OrderParser",
+    "get_order_parser",
+    "LocalOrderParser",
+    "LocalParseResult",
+    "ParseCache",
+    "get_parse_cache",
+    "ProductSearchIndex",
+    "SearchResult",
+    "get_search_index",
+    "get_product_index",
+    "OrderStreamParser",
+    "StreamedOrder",
+]
@@ -0,0 +1,192 @@
+"""Order corrections as patches of the already parsed order"""
+import copy
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Set
+
+from src.database import AssortmentSnapshot
+from src.metrics import Counter
+from .local_parser import to_order_quantity
+
+CORRECTIONS = Counter(
+    "order_corrections_total",
+    "Order corrections by result: patched, or why the order was parsed from scratch",
+    ["result"],
+)
+
+CORRECTION_INSTRUCTIONS = """Клиент уже сделал заказ, он разобран в JSON ниже ("Текущий заказ", заказы по адресам пронумерованы полем order с 0). Теперь клиент прислал уточнение.
+Верни только изменения заказа: JSON список операций, без переносов строки и без посторонних символов.
+Операции:
+{"op":"add_goods","order":N,"good_id":ID,"number":K,"unit":U} - добавить K к количеству товара (если товара нет в заказе - добавить товар)
+{"op":"set_goods","order":N,"good_id":ID,"number":K,"unit":U} - заменить количество товара на K
+{"op":"remove_goods","order":N,"good_id":ID} - убрать товар из заказа
+{"op":"set","order":N,"field":F,"value":V} - изменить поле F: date_delivery (YYYY-MM-DD), adress, payment_type (price_c - наличные, price_amt - безнал), company_name
+{"op":"add_order","adress":A,"date_delivery":D,"payment_type":P,"company_name":C} - заказ на новый адрес, его order - следующий номер, товары добавь операциями add_goods
+{"op":"remove_order","order":N} - отменить заказ на адрес
+{"op":"new_order"} - сообщение не уточнение, а полностью новый заказ
+U - единица, как написал клиент: "keg" (кега), "thermokeg" (термокега), "liter" (литры), "piece" (штуки) или null, если не указана. K - число в этой единице.
+Если заказ один, order = 0. Если менять нечего, верни [].
+"""
+
+# Order fields a "set" operation may change
+FIELDS = ("date_delivery", "adress", "payment_type", "company_name")
+PAYMENT_TYPES = ("price_c", "price_amt")
+UNITS = (None, "liter", "keg", "thermokeg", "piece")
+
+
+class PatchError(ValueError):
+    """Patch doesn't fit the order or the assortment"""
+
+
+class NewOrderError(PatchError):
+    """Message is a whole new order, not a correction"""
+
+
+def is_patchable(orders: Any) -> bool:
+    """Whether the orders are a parsed order a correction can patch (not an error message)"""
+    if not isinstance(orders, list) or not orders or not all(isinstance(order, dict) for order in orders):
+        return False
+    return not (orders[0].get('message') and not orders[0].get('adress'))
+
+
+def order_good_ids(orders: List[Dict]) -> Set[int]:
+    """Products in the orders"""
+    good_ids = set()
+    for order in orders:
+        for good_id in order.get('goods') or {}:
+            try:
+                good_ids.add(int(good_id))
+            except (TypeError, ValueError):
+                continue
+    return good_ids
+
+
+def format_current_order(orders: List[Dict], snapshot: AssortmentSnapshot) -> str:
+    """The order as the model sees it: numbered, goods with names and amounts"""
+    current = []
+    for i, order in enumerate(orders):
+        goods = []
+        for good_id, quantity in (order.get('goods') or {}).items():
+            product = snapshot.get(int(good_id)) if str(good_id).isdigit() else None
+            if product is None:
+                goods.append({"good_id": good_id, "quantity": quantity})
+                continue
+            amount = quantity * (product.min_size or 1)
+            goods.append({"good_id": product.good_id, "name": product.name, "amount": f"{amount:g} {product.type}"})
+        current.append({
+            "order": i,
+            **{field: order.get(field) for field in FIELDS},
+            "goods": goods,
+        })
+    return json.dumps(current, ensure_ascii=False, separators=(",", ":"))
+
+
+def apply_patch(orders: List[Dict], operations: List[Dict], snapshot: AssortmentSnapshot) -> List[Dict]:
+    """
+    Orders with the operations applied (the given orders stay unchanged)
+
+    Quantities are converted with the local parser's rules, so they are
+    whole min_size batches of products that exist.
+
+    Raises:
+        NewOrderError: the model found the message to be a new order
+        PatchError: an operation doesn't fit the order or the assortment
+    """
+    if any(operation.get("op") == "new_order" for operation in operations):
+        raise NewOrderError("Message is a new order")
+    patched = copy.deepcopy(orders)
+    removed = set()
+    for operation in operations:
+        op = operation.get("op")
+        if op == "add_order":
+            # Date, payment and company are usually the same for all addresses
+            first = patched[0] if patched else {}
+            order = {field: first.get(field) for field in FIELDS}
+            order.update(adress=None, goods={})
+            for field in FIELDS:
+                if field in operation:
+                    _set_field(order, field, operation[field])
+            patched.append(order)
+            continue
+
+        index = _order_index(patched, operation)
+        order = patched[index]
+        if op == "remove_order":
+            removed.add(index)
+        elif op == "set":
+            _set_field(order, operation.get("field"), operation.get("value"))
+        elif op in ("add_goods", "set_goods", "remove_goods"):
+            _patch_goods(order, op, operation, snapshot)
+        else:
+            raise PatchError(f"Unknown operation {op!r}")
+
+    patched = [order for i, order in enumerate(patched) if i not in removed]
+    if not patched:
+        raise PatchError("No orders left")
+    for order in patched:
+        if not order.get("adress"):
+            raise PatchError("Order without address")
+        if not order.get("goods"):
+            raise PatchError(f"Order to {order['adress']} without goods")
+    return patched
+
+
+def _order_index(orders: List[Dict], operation: Dict) -> int:
+    index = operation.get("order")
+    if index is None and len(orders) == 1:
+        return 0
+    if not isinstance(index, int) or isinstance(index, bool) or not 0 <= index < len(orders):
+        raise PatchError(f"No order {index!r}")
+    return index
+
+
+def _set_field(order: Dict, field: Any, value: Any):
+    if field not in FIELDS:
+        raise PatchError(f"Field {field!r} can't be changed")
+    if field == "payment_type" and value not in PAYMENT_TYPES:
+        raise PatchError(f"Unknown payment type {value!r}")
+    if field == "date_delivery" and value is not None:
+        try:
+            datetime.strptime(str(value), "%Y-%m-%d")
+        except ValueError:
+            raise PatchError(f"Bad delivery date {value!r}")
+    if field == "adress" and (not isinstance(value, str) or not value.strip()):
+        raise PatchError(f"Bad address {value!r}")
+    if field == "company_name" and value is not None and not isinstance(value, str):
+        raise PatchError(f"Bad company name {value!r}")
+    order[field] = value.strip() if isinstance(value, str) else value
+
+
+def _patch_goods(order: Dict, op: str, operation: Dict, snapshot: AssortmentSnapshot):
+    good_id = operation.get("good_id")
+    try:
+        product = snapshot.get(int(good_id))
+    except (TypeError, ValueError):
+        product = None
+    if product is None:
+        raise PatchError(f"Unknown product {good_id!r}")
+
+    goods = order.get("goods")
+    if not isinstance(goods, dict):
+        goods = order["goods"] = {}
+    # The model may have returned the key as a number
+    existing = next((key for key in goods if str(key) == str(product.good_id)), None)
+    current = goods.pop(existing, 0) if existing is not None else 0
+    if op == "remove_goods":
+        return
+
+    number = operation.get("number")
+    if isinstance(number, float) and number.is_integer():
+        number = int(number)
+    if not isinstance(number, int) or isinstance(number, bool) or number < 0:
+        raise PatchError(f"Bad number {number!r} of {product.name}")
+    unit = operation.get("unit")
+    if unit not in UNITS:
+        raise PatchError(f"Unknown unit {unit!r}")
+    if op == "set_goods" and number == 0:
+        return
+
+    quantity = to_order_quantity(product, number, unit)
+    if quantity is None:
+        raise PatchError(f"{number} {unit or ''} of {product.name} is ambiguous or not whole batches of {product.min_size:g}")
+    goods[str(product.good_id)] = quantity + (current if op == "add_goods" else 0)
@@ -0,0 +1,271 @@
+"""Concurrency and rate limits around OpenAI chat completions"""
+import asyncio
+import logging
+import random
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from openai import (
+    APIConnectionError,
+    APIStatusError,
+    APITimeoutError,
+    AsyncOpenAI,
+    RateLimitError,
+)
+
+from src.metrics import Counter, Histogram
+from src.utils.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+OPENAI_QUEUE_LATENCY = Histogram(
+    "openai_queue_seconds",
+    "Time an OpenAI request attempt waited for rate limit tokens and a concurrency slot",
+)
+OPENAI_MODEL_LATENCY = Histogram(
+    "openai_model_seconds",
+    "Time of an OpenAI request attempt on the wire (model time)",
+    ["result"],
+)
+OPENAI_ATTEMPTS = Counter(
+    "openai_attempts_total",
+    "OpenAI request attempts by result",
+    ["result"],
+)
+
+# Attempt results worth retrying: 429, 5xx, timeouts and connection errors
+RETRYABLE_RESULTS = {"timeout", "rate_limited", "connection_error", "server_error"}
+
+# Cyrillic prompts average well over 3 characters per token, so this overestimates
+CHARS_PER_TOKEN = 3
+
+
+class RetryableError(Exception):
+    """Attempt failed in a way worth retrying (kept for the last error of all attempts)"""
+
+
+def _result_of(error: BaseException) -> str:
+    """Attempt result label of an error"""
+    if isinstance(error, (asyncio.TimeoutError, APITimeoutError)):
+        return "timeout"
+    if isinstance(error, RateLimitError):
+        return "rate_limited"
+    if isinstance(error, APIConnectionError):
+        return "connection_error"
+    if isinstance(error, APIStatusError):
+        return "server_error" if error.status_code >= 500 else "client_error"
+    return "error"
+
+
+def estimate_tokens(messages: List[Dict[str, Any]], max_tokens: int) -> int:
+    """Upper estimate of tokens a request consumes from the TPM budget"""
+    return sum(len(str(message.get("content") or "")) for message in messages) // CHARS_PER_TOKEN + max_tokens
+
+
+class OpenAIGovernor:
+    """
+    Gate for chat completions of one client.
+
+    Each attempt takes a token of the requests-per-minute bucket and the
+    estimated prompt + completion tokens of the tokens-per-minute bucket
+    (corrected by the actual usage afterwards), then one of
+    max_concurrency slots. Attempts get their own deadline; 429, 5xx,
+    timeouts and connection errors are retried with full-jitter
+    exponential backoff (at least Retry-After when the API sends it).
+    """
+
+    def __init__(
+        self,
+        client: AsyncOpenAI,
+        max_concurrency: int = 8,
+        requests_per_minute: float = 500,
+        tokens_per_minute: float = 200000,
+        attempt_timeout: float = 20.0,
+        max_attempts: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+    ):
+        self.client = client
+        self.max_concurrency = max_concurrency
+        self.attempt_timeout = attempt_timeout
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._requests = TokenBucket(requests_per_minute / 60, requests_per_minute)
+        self._tokens = TokenBucket(tokens_per_minute / 60, tokens_per_minute)
+
+        # Stats
+        self.in_flight = 0
+        self.waiting = 0
+        self.completed = 0
+        self.retried = 0
+        self.failed = 0
+        self._queued_total = 0.0
+        self._queued_max = 0.0
+        self._model_total = 0.0
+        self._attempts = 0
+
+    async def create(self, messages: List[Dict[str, Any]], max_tokens: int, **kwargs) -> Any:
+        """client.chat.completions.create within the limits, with retries"""
+        estimate = estimate_tokens(messages, max_tokens)
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                response = await self._attempt(messages, max_tokens, estimate, **kwargs)
+                self.completed += 1
+                return response
+            except RetryableError as e:
+                if attempt >= self.max_attempts:
+                    self.failed += 1
+                    raise e.__cause__
+                await self._backoff(attempt, e.__cause__)
+
+    async def stream(self, messages: List[Dict[str, Any]], max_tokens: int, **kwargs) -> AsyncIterator[Any]:
+        """
+        Streamed client.chat.completions.create within the limits, yields
+        the chunks. Retried like create() until the first chunk arrives;
+        the concurrency slot is held until the stream ends.
+        """
+        estimate = estimate_tokens(messages, max_tokens)
+        attempt = 0
+        while True:
+            attempt += 1
+            received = False
+            try:
+                async for chunk in self._stream_attempt(messages, max_tokens, estimate, **kwargs):
+                    received = True
+                    yield chunk
+                self.completed += 1
+                return
+            except RetryableError as e:
+                if received or attempt >= self.max_attempts:
+                    self.failed += 1
+                    raise e.__cause__
+                await self._backoff(attempt, e.__cause__)
+
+    async def _backoff(self, attempt: int, cause: BaseException):
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+        retry_after = self._retry_after(cause)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        self.retried += 1
+        logger.warning(f"OpenAI request failed ({cause!r}), retry {attempt} in {delay:.2f}s")
+        await asyncio.sleep(delay)
+
+    async def _acquire(self, estimate: int):
+        """Wait for rate limit tokens and a concurrency slot"""
+        queued_at = time.monotonic()
+        self.waiting += 1
+        try:
+            await self._requests.acquire()
+            await self._tokens.acquire(estimate)
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        queued = time.monotonic() - queued_at
+        OPENAI_QUEUE_LATENCY.observe(queued)
+        self._queued_total += queued
+        self._queued_max = max(self._queued_max, queued)
+        self._attempts += 1
+        self.in_flight += 1
+
+    def _release(self, started_at: float, result: str):
+        elapsed = time.monotonic() - started_at
+        self._model_total += elapsed
+        OPENAI_MODEL_LATENCY.labels(result=result).observe(elapsed)
+        OPENAI_ATTEMPTS.labels(result=result).inc()
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    def _settle(self, estimate: int, usage: Any):
+        """Settle the tokens budget with the actual usage"""
+        if usage is None or usage.total_tokens is None:
+            return
+        if usage.total_tokens < estimate:
+            self._tokens.release(estimate - usage.total_tokens)
+        else:
+            self._tokens.reserve(usage.total_tokens - estimate)
+
+    async def _attempt(self, messages: List[Dict[str, Any]], max_tokens: int, estimate: int, **kwargs) -> Any:
+        await self._acquire(estimate)
+        started_at = time.monotonic()
+        result = "ok"
+        try:
+            response = await asyncio.wait_for(
+                self.client.chat.completions.create(messages=messages, max_tokens=max_tokens, **kwargs),
+                self.attempt_timeout,
+            )
+        except BaseException as e:
+            result = _result_of(e)
+            if result in RETRYABLE_RESULTS:
+                raise RetryableError() from e
+            raise
+        finally:
+            self._release(started_at, result)
+
+        self._settle(estimate, getattr(response, "usage", None))
+        return response
+
+    async def _stream_attempt(self, messages: List[Dict[str, Any]], max_tokens: int, estimate: int,
+                              **kwargs) -> AsyncIterator[Any]:
+        await self._acquire(estimate)
+        started_at = time.monotonic()
+        # The deadline covers the whole stream, not each chunk
+        deadline = started_at + self.attempt_timeout
+        result = "ok"
+        stream = None
+        try:
+            stream = await asyncio.wait_for(
+                self.client.chat.completions.create(
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                    **kwargs,
+                ),
+                self.attempt_timeout,
+            )
+            chunks = stream.__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), max(0.0, deadline - time.monotonic()))
+                except StopAsyncIteration:
+                    break
+                # The last chunk carries the usage of the whole completion
+                self._settle(estimate, getattr(chunk, "usage", None))
+                yield chunk
+        except BaseException as e:
+            result = _result_of(e)
+            if result in RETRYABLE_RESULTS:
+                raise RetryableError() from e
+            raise
+        finally:
+            if stream is not None:
+                await stream.close()
+            self._release(started_at, result)
+
+    @staticmethod
+    def _retry_after(error: Optional[BaseException]) -> Optional[float]:
+        response = getattr(error, "response", None)
+        if response is None:
+            return None
+        try:
+            return float(response.headers.get("retry-after"))
+        except (TypeError, ValueError):
+            return None
+
+    def stats(self) -> Dict[str, Any]:
+        """Governor statistics"""
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "completed": self.completed,
+            "retried": self.retried,
+            "failed": self.failed,
+            "queue_latency_avg_seconds": round(self._queued_total / self._attempts, 4) if self._attempts else 0.0,
+            "queue_latency_max_seconds": round(self._queued_max, 4),
+            "model_latency_avg_seconds": round(self._model_total / self._attempts, 4) if self._attempts else 0.0,
+        }
@@ -0,0 +1,376 @@
+"""Rule-based order parser for simple orders, no OpenAI round trip"""
+import re
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from src.database import Assortment, AssortmentSnapshot
+from src.metrics import Counter
+from .search import ProductSearchIndex, normalize, tokenize
+
+LOCAL_PARSE = Counter(
+    "local_parse_total",
+    "Local parser attempts by result (hit or the reason to fall back to OpenAI)",
+    ["result"],
+)
+LOCAL_PARSE_SHADOW = Counter(
+    "local_parse_shadow_total",
+    "Local parser hits re-parsed by OpenAI in the background, by agreement",
+    ["result"],
+)
+
+# Same conversions as in the system prompt
+KEG_LITERS = 30
+THERMOKEG_LITERS = 25
+
+# Second best product must score this much lower to take the best one
+MIN_SCORE_MARGIN = 0.1
+
+# The address ends at punctuation, "на" or a date written right after it
+ADDRESS_PATTERN = re.compile(
+    r"\bадресс?(?:у|а)?\b(?:\s+доставки)?\s*[:\-]?\s*(?P<address>[^,;\n]+?)\s*"
+    r"(?=[,;\n]|\.\s|\.$|\s+на\s|\s+(?:(?:после)?завтра|сегодня)\b|\s+\d{1,2}\.\d{1,2}\b|$)",
+    re.IGNORECASE,
+)
+_COMPANY = re.compile(r"\b(?:ООО|ОАО|ЗАО|ПАО|АО|ИП)\s+(?:«[^»]+»|\"[^\"]+\"|[^\s,.;]+)")
+DATE_PATTERN = re.compile(r"\b(\d{1,2})\.(\d{1,2})(?:\.(\d{4}|\d{2}))?\b")
+_RELATIVE_DATES = {"сегодня": 0, "завтра": 1, "послезавтра": 2}
+_RELATIVE_DATE = re.compile(r"\b(?:после)?завтра\b|\bсегодня\b", re.IGNORECASE)
+# "до 12:00", "к 10 утра": orders have no delivery time, the model decides what to do with it
+_TIME = re.compile(
+    r"\b\d{1,2}:\d{2}\b|\b(?:к|до|после)\s+\d{1,2}\b(?!\s*(?:л|литр\w*|кег\w*|термокег\w*|шт\w*)\b)"
+    r"|\b\d{1,2}\s*(?:утра|дня|вечера)\b",
+    re.IGNORECASE,
+)
+# Address ends with the house number: "Ленина 4", "Советская 69/1", "Мира д.5к2"
+_HOUSE_NUMBER = re.compile(r"\d[^\s]*$")
+_CASH = re.compile(r"\b(?:нал|налом|наличн\w*)\b", re.IGNORECASE)
+_CASHLESS = re.compile(r"\b(?:безнал|безналом|безналичн\w*)\b", re.IGNORECASE)
+SEGMENT_SEPARATORS = re.compile(r"[,;\n+]|\.(?=\s|$)|\s+и\s+", re.IGNORECASE)
+# "20л" → "20 л"
+_NUMBER_SUFFIX = re.compile(r"(\d)(?=[^\d\s.,/])")
+
+NUMBER_WORDS = {
+    "один": 1, "одна": 1, "одну": 1, "два": 2, "две": 2, "три": 3, "четыре": 4, "пять": 5,
+    "шесть": 6, "семь": 7, "восемь": 8, "девять": 9, "десять": 10,
+}
+UNIT_WORDS = {
+    "кега": "keg", "кеги": "keg", "кегу": "keg", "кег": "keg", "кегов": "keg", "кегами": "keg",
+    "термокега": "thermokeg", "термокеги": "thermokeg", "термокегу": "thermokeg", "термокег": "thermokeg",
+    "л": "liter", "литр": "liter", "литра": "liter", "литров": "liter", "литры": "liter",
+    "шт": "piece", "штук": "piece", "штука": "piece", "штуки": "piece", "штуку": "piece",
+}
+# Words that carry no order information
+STOPWORDS = {
+    "привет", "здравствуйте", "добрый", "день", "утро", "вечер", "пожалуйста", "спасибо",
+    "заказ", "заказываю", "закажу", "хочу", "нужно", "нужна", "нужен", "надо", "прошу",
+    "на", "по", "в", "во", "к", "с", "еще", "также", "оплата", "оплатой", "расчет", "доставка", "доставку",
+}
+
+
+@dataclass(frozen=True)
+class LocalParseResult:
+    """Parsed orders, or None and the reason to fall back to OpenAI"""
+    orders: Optional[List[Dict]]
+    reason: str
+
+
+def _fallback(reason: str) -> LocalParseResult:
+    return LocalParseResult(None, reason)
+
+
+def _product_kind(product: Assortment) -> str:
+    product_type = (product.type or "").lower()
+    if product_type.startswith("шт"):
+        return "piece"
+    if "термокег" in product_type:
+        return "thermokeg"
+    return "liquid"
+
+
+def to_order_quantity(product: Assortment, number: int, unit: Optional[str]) -> Optional[int]:
+    """
+    Quantity as stored in goods: number of min_size batches
+
+    A bare number is liters when it is a multiple of min_size ("Гаус 60"),
+    otherwise kegs/thermokegs/pieces ("Гаус 2"). A bare number of a drink
+    sold by the liter (min_size of 1 liter or less) may be either, so it is
+    left to OpenAI. None if the quantity does not convert to whole batches,
+    the unit does not fit the product or is ambiguous.
+    """
+    kind = _product_kind(product)
+    min_size = product.min_size or 1
+    if kind == "liquid" and unit is None and min_size <= 1:
+        return None
+    if kind == "piece":
+        if unit not in (None, "piece"):
+            return None
+        amount = number
+    elif unit == "liter" or (unit is None and min_size > 1 and number >= min_size and number % min_size == 0):
+        amount = number
+    elif kind == "thermokeg":
+        # Plain "кега" for a thermokeg-only product is ambiguous
+        if unit not in (None, "thermokeg"):
+            return None
+        return number
+    elif unit in (None, "keg"):
+        amount = number * KEG_LITERS
+    elif unit == "thermokeg":
+        amount = number * THERMOKEG_LITERS
+    else:
+        return None
+
+    batches = amount / min_size
+    if batches < 1 or batches != int(batches):
+        return None
+    return int(batches)
+
+
+class LocalOrderParser:
+    """
+    Parses orders like "Гаус 2 кеги, Лагер 60 л. Адрес: Ленина 4, на 18.10"
+    with the product search index and the rules of the system prompt.
+
+    Every part of the message must be understood: one address (written
+    after "адрес" or one of the customer's known addresses), at most one
+    date, and segments of product name plus a single quantity. Anything
+    else (unknown words, ambiguous names, several addresses, quantities
+    not fitting min_size) falls back to OpenAI.
+    """
+
+    def __init__(self, min_score: float = 0.85):
+        self.min_score = min_score
+
+    def parse(self, text: str, snapshot: AssortmentSnapshot, index: ProductSearchIndex,
+              today: date, known_addresses: Sequence[str] = ()) -> LocalParseResult:
+        """Parse text into the same structure OpenAI returns, or give the reason it can't"""
+        cashless, cash = bool(_CASHLESS.search(text)), bool(_CASH.search(text))
+        if cash and cashless:
+            return _fallback("ambiguous_payment")
+        text = _CASH.sub(",", _CASHLESS.sub(",", text))
+        if _TIME.search(text):
+            return _fallback("delivery_time")
+
+        address, text, reason = self._extract_address(text, known_addresses)
+        if reason:
+            return _fallback(reason)
+
+        delivery_date, text, reason = self._extract_date(text, today)
+        if reason:
+            return _fallback(reason)
+
+        companies = _COMPANY.findall(text)
+        if len(companies) > 1:
+            return _fallback("multiple_companies")
+        text = _COMPANY.sub(",", text)
+
+        goods: Dict[str, int] = {}
+        for segment in SEGMENT_SEPARATORS.split(_NUMBER_SUFFIX.sub(r"\1 ", text)):
+            words = [word for word in tokenize(segment) if word not in STOPWORDS]
+            if not words:
+                continue
+            groups = self._group(words)
+            if groups is None:
+                return _fallback("no_quantity")
+            for name_words, number, unit in groups:
+                product, reason = self._match_product(name_words, snapshot, index)
+                if reason:
+                    return _fallback(reason)
+                quantity = to_order_quantity(product, number, unit)
+                if quantity is None:
+                    return _fallback("bad_quantity")
+                key = str(product.good_id)
+                if key in goods:
+                    # Same product twice may be a correction, let the model decide
+                    return _fallback("repeated_product")
+                goods[key] = quantity
+
+        if not goods:
+            return _fallback("no_goods")
+        if address is None:
+            distinct = {normalize(known) for known in known_addresses}
+            if len(distinct) != 1:
+                return _fallback("no_address")
+            address = known_addresses[0]
+
+        return LocalParseResult([{
+            "date_delivery": delivery_date,
+            "adress": address,
+            "goods": goods,
+            "payment_type": "price_c" if cash else "price_amt",
+            "company_name": companies[0] if companies else None,
+        }], "hit")
+
+    @staticmethod
+    def _extract_address(text: str, known_addresses: Sequence[str]) -> Tuple[Optional[str], str, Optional[str]]:
+        """Address and text without it"""
+        matches = list(ADDRESS_PATTERN.finditer(text))
+        if len(matches) > 1:
+            return None, text, "multiple_addresses"
+        if matches:
+            address = matches[0].group("address").strip()
+            if not re.search(r"[^\W\d_]", address):
+                return None, text, "no_address"
+            if not _HOUSE_NUMBER.search(address):
+                # Words after the house number ("Мира 5 вечером") may be anything
+                return None, text, "unclear_address"
+            return address, text[:matches[0].start()] + "," + text[matches[0].end():], None
+
+        # Known address of the customer written without "адрес"
+        found = []
+        normalized_text = f" {normalize(text)} "
+        for known in dict.fromkeys(known_addresses):
+            normalized = normalize(known)
+            if normalized and f" {normalized} " in normalized_text:
+                found.append(known)
+        if len(found) > 1:
+            return None, text, "multiple_addresses"
+        if found:
+            # Cut the words of the address out of the text, whatever punctuation it was written with
+            pattern = r"[\W_]+".join(re.escape(word) for word in tokenize(found[0]))
+            stripped = re.sub(pattern, ",", text.replace("ё", "е").replace("Ё", "Е"), count=1, flags=re.IGNORECASE)
+            return found[0], stripped, None
+        return None, text, None
+
+    @staticmethod
+    def _extract_date(text: str, today: date) -> Tuple[Optional[str], str, Optional[str]]:
+        """Delivery date as YYYY-MM-DD and text without it"""
+        dates = []
+        for match in DATE_PATTERN.finditer(text):
+            day, month, year = int(match.group(1)), int(match.group(2)), match.group(3)
+            try:
+                if year:
+                    value = date(int(year) + (2000 if len(year) == 2 else 0), month, day)
+                else:
+                    value = date(today.year, month, day)
+                    if value < today:
+                        value = date(today.year + 1, month, day)
+            except ValueError:
+                return None, text, "bad_date"
+            dates.append(value)
+        text = DATE_PATTERN.sub(",", text)
+
+        for word in tokenize(text):
+            if word in _RELATIVE_DATES:
+                dates.append(today + timedelta(days=_RELATIVE_DATES[word]))
+        text = _RELATIVE_DATE.sub(",", text)
+
+        if len(set(dates)) > 1:
+            return None, text, "multiple_dates"
+        return (dates[0].isoformat() if dates else None), text, None
+
+    @staticmethod
+    def _group(words: List[str]) -> Optional[List[Tuple[List[str], int, Optional[str]]]]:
+        """
+        Split segment words into (name words, number, unit) items
+
+        Either every item is "name number [unit]" or every item is
+        "number [unit] name"; None if the words don't follow one of them.
+        """
+        number_first = words[0].isdigit() or words[0] in NUMBER_WORDS
+        items = []
+        name: List[str] = []
+        number: Optional[int] = None
+        unit: Optional[str] = None
+        for word in words:
+            value = int(word) if word.isdigit() else NUMBER_WORDS.get(word)
+            if value is not None:
+                if number_first and number is not None:
+                    items.append((name, number, unit))
+                    name, unit = [], None
+                elif not number_first and number is not None:
+                    return None
+                number = value
+            elif word in UNIT_WORDS:
+                if number is None or unit is not None:
+                    return None
+                unit = UNIT_WORDS[word]
+            else:
+                if not number_first and number is not None:
+                    items.append((name, number, unit))
+                    name, number, unit = [], None, None
+                name.append(word)
+        if number is None:
+            return None
+        items.append((name, number, unit))
+        if any(not item_name for item_name, _, _ in items):
+            return None
+        return items
+
+    def _match_product(self, name_words: List[str], snapshot: AssortmentSnapshot,
+                       index: ProductSearchIndex) -> Tuple[Optional[Assortment], Optional[str]]:
+        results = index.search(" ".join(name_words), limit=2)
+        if not results or results[0].score < self.min_score:
+            return None, "unknown_product"
+        if len(results) > 1 and results[1].score > results[0].score - MIN_SCORE_MARGIN:
+            return None, "ambiguous_product"
+        product = snapshot.get(results[0].good_id)
+        if product is None:
+            # Index is behind the snapshot
+            return None, "unknown_product"
+        product_words = tokenize(product.name)
+        if any(word.isdigit() for word in product_words):
+            # "Балтика 9 2" can't be split into name and quantity reliably
+            return None, "ambiguous_product"
+        for word in name_words:
+            # Extra words ("Гаус светлый" when only "Гаус" exists) may mean another product
+            if not any(token.startswith(word) or word.startswith(token) for token in product_words):
+                return None, "unknown_product"
+        return product, None
+
+
+def looks_complete(text: str, index: ProductSearchIndex, known_addresses: Sequence[str] = (),
+                   min_score: float = 0.6) -> bool:
+    """
+    Whether the text has what an order needs: an address and a product
+    with a quantity. A cheap check whether to wait for more messages, not a parse.
+
+    An address is written after "адрес", is one of the customer's known
+    addresses, or is a part with a house number that names no product
+    ("Гаус 2 кеги, Ленина 5", "Гаус 2 кеги на Ленина 5 завтра").
+    """
+    has_address = bool(ADDRESS_PATTERN.search(text))
+    normalized = f" {normalize(text)} "
+    if any(f" {normalize(known)} " in normalized for known in known_addresses if normalize(known)):
+        has_address = True
+
+    rest = _RELATIVE_DATE.sub(",", DATE_PATTERN.sub(",", ADDRESS_PATTERN.sub(",", _TIME.sub(",", text))))
+    has_product = False
+    for segment in SEGMENT_SEPARATORS.split(_NUMBER_SUFFIX.sub(r"\1 ", rest)):
+        for part in re.split(r"\s+на\s+", segment, flags=re.IGNORECASE):
+            words = tokenize(part)
+            if not any(word.isdigit() or word in NUMBER_WORDS for word in words):
+                continue
+            name = [
+                word for word in words
+                if not word.isdigit() and word not in NUMBER_WORDS and word not in UNIT_WORDS and word not in STOPWORDS
+            ]
+            if not name:
+                continue
+            if index.search(" ".join(name), limit=1, min_score=min_score):
+                has_product = True
+            elif not any(word in UNIT_WORDS for word in words):
+                # A number without a unit next to no product: a house number
+                has_address = True
+    return has_address and has_product
+
+
+def orders_agree(local: List[Dict], model: List[Dict]) -> bool:
+    """
+    Whether two parses order the same: goods, address, delivery date and
+    payment type (company name only labels the order and is not compared)
+    """
+    def key(orders: List[Dict]):
+        return [
+            (
+                {str(good_id): float(quantity) for good_id, quantity in (order.get("goods") or {}).items()},
+                normalize(str(order.get("adress") or "")),
+                str(order.get("date_delivery") or ""),
+                order.get("payment_type") or "price_amt",
+            )
+            for order in orders
+        ]
+    try:
+        return key(local) == key(model)
+    except (TypeError, ValueError, AttributeError):
+        return False
@@ -1,55 +1,63 @@
 """AI service for parsing orders from text"""
+import asyncio
 import json
 import logging
-from datetime import datetime
-from typing import List, Dict, Optional
-from openai import AsyncOpenAI, BadRequestError
+import random
+import re
+import time
+from datetime import date, datetime
+from contextlib import aclosing
+from typing import Any, AsyncIterator, List, Dict, Optional, Sequence, Set, Tuple
+from openai import APIConnectionError, APITimeoutError, AsyncOpenAI, BadRequestError, InternalServerError, RateLimitError
 from src.config import get_settings
-from src.database import Assortment
+from src.database import Assortment, AssortmentSnapshot, Order, get_assortment_store
+from src.metrics import Counter, Histogram
+from .corrections import (
+    CORRECTION_INSTRUCTIONS, CORRECTIONS, NewOrderError, PatchError, apply_patch, format_current_order,
+    is_patchable, order_good_ids,
+)
+from .governor import OpenAIGovernor
+from .parse_cache import get_parse_cache
+from .routing import ModelRouter, RouteResult
+from .local_parser import LOCAL_PARSE, LOCAL_PARSE_SHADOW, LocalOrderParser, looks_complete, orders_agree
+from .retrieval import PROMPT_CATALOG, CatalogRetriever, frequent_good_ids
+from .search import get_product_index
+from .streaming import FIRST_ORDER_LATENCY, OrderStreamParser, StreamedOrder, as_streamed
 
 logger = logging.getLogger(__name__)
 
+PARSE_LATENCY = Histogram(
+    "order_parse_seconds",
+    "OrderParser.parse_order latency",
+    ["result"],
+)
+OPENAI_TOKENS = Counter(
+    "openai_tokens_total",
+    "OpenAI tokens used by order parsing",
+    ["kind"],
+)
+OPENAI_REQUEST_LATENCY = Histogram(
+    "openai_request_seconds",
+    "OpenAI chat completion latency by catalog in the prompt (full or pruned)",
+    ["catalog"],
+)
+OPENAI_PROMPT_TOKENS = Histogram(
+    "openai_prompt_tokens",
+    "Prompt tokens per OpenAI request by catalog in the prompt (full or pruned)",
+    ["catalog"],
+    buckets=(250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000, 128000),
+)
+OPENAI_PROMPT_TOKENS_SAVED = Counter(
+    "openai_prompt_tokens_saved_total",
+    "Estimated prompt tokens saved by sending candidate products instead of the full catalog",
+)
 
-class OrderParser:
-    """Service for parsing orders using OpenAI"""
-    
-    def __init__(self):
-        settings = get_settings().ai
-        self.client = AsyncOpenAI(api_key=settings.api_key)
-        self.model = settings.model
-        self.max_tokens = settings.max_tokens
-        self._assortment_cache: Optional[List[Dict]] = None
-        self._system_prompt: Optional[str] = None
 
-    async def _get_assortment(self) -> List[Dict]:
-        """Get assortment from database and cache it"""
-        if self._assortment_cache is None:
-            products = await Assortment.get_all()
-            self._assortment_cache = [
-                {
-                    "good_id": p.good_id,
-                    "name": p.name,
-                    "type": p.type,
-                    "price_c": p.price_c,
-                    "price_amt": p.price_amt,
-                    "min_size": p.min_size,
-                }
-                for p in products
-            ]
-        return self._assortment_cache
-
-    def _build_system_prompt(self, assortment: List[Dict]) -> str:
-        """Build system prompt for AI"""
-        content = '''
-1. Товары (Ассортимент) в формате JSON:
-%s
-End
-
-Твоя задача: прочитать сообщение от клиента и выявить что он хотел заказать. Определить good_id по названию товара (name)  и кол-во! Выявить Дату доставки,
+SYSTEM_PROMPT_INSTRUCTIONS = """Твоя задача: прочитать сообщение от клиента и выявить что он хотел заказать. Определить good_id по названию товара (name)  и кол-во! Выявить Дату доставки,
 Выявить Адресса Заказов. 
 Вернуть ответ в JSON
 [
-{'date_delivery':'(дата доставки)','adress':'(Наименование адреса)','goods':{(good_id из ассортимента 1,2 20 и тп):(кол-во товара), ... },'payment_type':(тип оплаты- price_c или price_amt ), company_name : (Название компании из сообщения если явно указанно либо null)
+{"date_delivery":"(дата доставки)","adress":"(Наименование адреса)","goods":{(good_id из ассортимента 1,2 20 и тп):(кол-во товара), ... },"payment_type":(тип оплаты- price_c или price_amt ), company_name : (Название компании из сообщения если явно указанно либо null)
 }, ...]
 Если Адресов больше 1, то вернуть столько же json в списке
 Без переносов строки без посторонних символов
@@ -66,75 +74,659 @@ End
         термокеги : Можно заказать 20 / 25 л, 40 /50 ли т.д. (кратно полю min_size). В ответах используй правильные склонения: 1 термокега, 2 термокеги, 5 термокег.
         Штуки : Можно заказать 1, 2, 3 и т.д. (кратно полю min_size). В ответах используй правильные склонения: 1 штука, 2 штуки, 5 штук.
 
-'''
-        assortment_json = json.dumps(assortment, ensure_ascii=False)
-        return (content % assortment_json).replace("'", '"')
+"""
+CATALOG_HEADER = "Товары (Ассортимент) в формате TSV, первая строка - названия колонок:\n"
+CATALOG_COLUMNS = ("good_id", "name", "type", "price_c", "price_amt", "min_size")
+
+
+def _tsv_value(value) -> str:
+    if isinstance(value, float):
+        # 150.0 -> 150, 12.5 -> 12.5
+        return f"{value:g}"
+    return " ".join(str(value).split())
+
+
+def format_catalog_tsv(products: Sequence[Assortment]) -> str:
+    """Catalog as TSV with a header line, far fewer tokens than JSON with keys per product"""
+    lines = ["\t".join(CATALOG_COLUMNS)]
+    for product in products:
+        lines.append("\t".join(_tsv_value(getattr(product, column)) for column in CATALOG_COLUMNS))
+    return "\n".join(lines)
+
+
+def parse_ai_response(content: str) -> Optional[List[Dict]]:
+    """Orders from the AI answer (JSON, possibly wrapped in text), None if there are none"""
+    try:
+        parsed = json.loads(content)
+    except json.JSONDecodeError:
+        # Try to extract JSON from text
+        json_match = re.search(r'\[.*\]', content, re.DOTALL)
+        if not json_match:
+            return None
+        try:
+            parsed = json.loads(json_match.group())
+        except json.JSONDecodeError:
+            return None
+    if isinstance(parsed, dict):
+        return [parsed]
+    if isinstance(parsed, list) and all(isinstance(order, dict) for order in parsed):
+        return parsed
+    return None
+
+
+class OrderParser:
+    """Service for parsing orders using OpenAI"""
+    
+    def __init__(self):
+        settings = get_settings().ai
+        # Retries and timeouts are up to the governor
+        self.client = AsyncOpenAI(
+            api_key=settings.api_key,
+            base_url=settings.base_url,
+            max_retries=0,
+            timeout=settings.request_timeout,
+        )
+        self.governor = OpenAIGovernor(
+            self.client,
+            max_concurrency=settings.max_concurrency,
+            requests_per_minute=settings.requests_per_minute,
+            tokens_per_minute=settings.tokens_per_minute,
+            attempt_timeout=settings.request_timeout,
+            max_attempts=settings.max_attempts,
+        )
+        routing = get_settings().model_routing
+        self.router = ModelRouter(
+            self.governor,
+            model=settings.model,
+            fallback_model=routing.fallback_model,
+            hedge_enabled=routing.hedge_enabled,
+            hedge_model=routing.hedge_model,
+            hedge_quantile=routing.hedge_quantile,
+            hedge_min_delay=routing.hedge_min_delay,
+            hedge_max_delay=routing.hedge_max_delay,
+            degraded_error_rate=routing.degraded_error_rate,
+            degraded_latency=routing.degraded_latency,
+            degraded_cooldown=routing.degraded_cooldown,
+        )
+        self.model = settings.model
+        self.max_tokens = settings.max_tokens
+        self.stream = settings.stream
+        # System prompt built for the assortment snapshot version
+        self._system_prompt: Optional[str] = None
+        self._prompt_version: Optional[str] = None
+        # Rule-based fast path for simple orders
+        local_settings = get_settings().local_parser
+        self.local_parser = LocalOrderParser(local_settings.min_score) if local_settings.enabled else None
+        self.shadow_rate = local_settings.shadow_rate
+        self._shadow_tasks: Set[asyncio.Task] = set()
+        # Candidate products instead of the whole catalog in the prompt
+        pruning = get_settings().catalog_pruning
+        self.retriever = CatalogRetriever(
+            top_k=pruning.top_k,
+            min_score=pruning.min_score,
+            min_catalog_size=pruning.min_catalog_size,
+        ) if pruning.enabled else None
+        self.frequent_items = pruning.frequent_items
+        # AI results of repeated messages
+        self.parse_cache = get_parse_cache() if get_settings().parse_cache.enabled else None
+        # Corrections as patches of the parsed order
+        corrections = get_settings().corrections
+        self.corrections_enabled = corrections.enabled
+        self.correction_max_tokens = corrections.max_tokens
+        self._correction_prompt: Optional[str] = None
+        self._correction_prompt_version: Optional[str] = None
+
+        # Stats
+        self.local_results: Dict[str, int] = {}
+        self.shadow_results: Dict[str, int] = {}
+        self.prompt_catalogs: Dict[str, int] = {}
+        self.prompt_tokens_saved = 0
+        self.stream_results: Dict[str, int] = {}
+        self.correction_results: Dict[str, int] = {}
 
-    async def parse_order(self, text: str, previous_messages: Optional[List[str]] = None) -> List[Dict]:
+    def _get_system_prompt(self, assortment: AssortmentSnapshot) -> str:
+        """System prompt for the snapshot, built once per snapshot version"""
+        if self._prompt_version != assortment.version:
+            self._system_prompt = self._build_system_prompt(assortment.products)
+            self._prompt_version = assortment.version
+        return self._system_prompt
+
+    def _build_system_prompt(self, products: Sequence[Assortment]) -> str:
+        """
+        Build system prompt for AI
+
+        Instructions come first and never change, the catalog follows, so
+        the prompt prefix is byte-identical across calls (and across
+        assortment versions) for the provider's prompt caching.
+        """
+        return SYSTEM_PROMPT_INSTRUCTIONS + CATALOG_HEADER + format_catalog_tsv(products) + "\nEnd\n"
+
+    async def parse_order(self, text: str, previous_messages: Optional[List[str]] = None,
+                          user_id: Optional[int] = None) -> List[Dict]:
         """
-        Parse order from text using AI
+        Parse order from text: locally if the rule-based parser is sure, else
+        from the parse cache or with AI
         
         Args:
             text: Order text from user
             previous_messages: Optional list of previous messages for context
+            user_id: Customer, their known addresses let the local parser skip "адрес"
             
         Returns:
             List of parsed order dictionaries
         """
+        started_at = time.perf_counter()
+        recent_orders = await self._recent_orders(user_id)
+        orders, cache_key = await self._parse_without_ai(text, previous_messages, recent_orders, started_at)
+        if orders is not None:
+            return orders
+
+        orders = await self._parse_order(text, previous_messages, recent_orders)
+        await self._parsed_with_ai(orders, cache_key, started_at)
+        return orders
+
+    async def parse_order_stream(self, text: str, previous_messages: Optional[List[str]] = None,
+                                 user_id: Optional[int] = None) -> AsyncIterator[StreamedOrder]:
+        """
+        parse_order yielding the orders one by one: with AI each order as
+        soon as its object is complete in the streamed completion, so
+        multi-address orders can be shown while the rest is generated
+        """
+        started_at = time.perf_counter()
+        recent_orders = await self._recent_orders(user_id)
+        orders, cache_key = await self._parse_without_ai(text, previous_messages, recent_orders, started_at)
+        if orders is None and (not self.stream or self.router.primary_degraded()):
+            # The fallback model is used for whole completions only
+            orders = await self._parse_order(text, previous_messages, recent_orders)
+            await self._parsed_with_ai(orders, cache_key, started_at)
+        if orders is not None:
+            for streamed in as_streamed(orders):
+                yield streamed
+            return
+
+        orders = []
+        async for streamed in self._stream_order(text, previous_messages, recent_orders):
+            if not orders:
+                FIRST_ORDER_LATENCY.observe(time.perf_counter() - started_at)
+            orders.append(streamed.order)
+            yield streamed
+        await self._parsed_with_ai(orders, cache_key, started_at)
+
+    async def looks_complete(self, text: str, user_id: Optional[int] = None) -> bool:
+        """
+        Whether the message(s) look like a whole order: an address and a
+        product with a quantity. The customer's known addresses are only
+        loaded when the text has no address of its own.
+        """
+        try:
+            index = await get_product_index()
+        except Exception as e:
+            logger.error(f"Failed to check order completeness: {e}")
+            # Don't hold the messages back when we can't tell
+            return True
+        if looks_complete(text, index):
+            return True
+        known_addresses = self._known_addresses(await self._recent_orders(user_id))
+        return bool(known_addresses) and looks_complete(text, index, known_addresses)
+
+    async def parse_correction(self, text: str, order_data: Optional[List[Dict]],
+                               user_message: Optional[str] = None, user_id: Optional[int] = None) -> List[Dict]:
+        """
+        Parse a correction of an already parsed order: the AI gets the order
+        and the new message only and returns a patch, which is applied and
+        validated against the assortment here. A correction that isn't a
+        valid patch (or a whole new order) is parsed from scratch with the
+        original message as context.
+
+        Args:
+            text: Correction text from user
+            order_data: Orders parsed so far (FSM order_data)
+            user_message: Message(s) the orders were parsed from
+            user_id: Customer
+
+        Returns:
+            List of parsed order dictionaries
+        """
+        previous_messages = [user_message] if user_message else None
+        if not self.corrections_enabled or not is_patchable(order_data):
+            return await self.parse_order(text, previous_messages, user_id)
+
+        started_at = time.perf_counter()
+        try:
+            orders = await self._patch_order(text, order_data)
+            result = "patched"
+        except NewOrderError:
+            orders, result = None, "new_order"
+        except PatchError as e:
+            logger.warning(f"Correction {text!r} is not a valid patch, parsing from scratch: {e}")
+            orders, result = None, "invalid"
+        except Exception as e:
+            logger.error(f"Correction patch failed: {e!r}")
+            orders, result = None, "error"
+        CORRECTIONS.labels(result=result).inc()
+        self.correction_results[result] = self.correction_results.get(result, 0) + 1
+        if orders is None:
+            return await self.parse_order(text, previous_messages, user_id)
+        PARSE_LATENCY.labels(result="patched").observe(time.perf_counter() - started_at)
+        return orders
+
+    async def _patch_order(self, text: str, order_data: List[Dict]) -> List[Dict]:
+        """
+        Corrected orders from the AI patch
+
+        Raises:
+            PatchError: no valid patch (NewOrderError if the message is a new order)
+        """
+        assortment = await get_assortment_store().get()
+        system_prompt = await self._select_correction_prompt(text, order_data, assortment)
+        context = (
+            f"Сегодняшняя дата: {datetime.now().strftime('%Y-%m-%d')}\n"
+            f"Текущий заказ: {format_current_order(order_data, assortment)}\n"
+            f"Уточнение: {text}"
+        )
+        messages = [
+            {'role': 'system', 'content': system_prompt},
+            {'role': 'user', 'content': context},
+        ]
+        with OPENAI_REQUEST_LATENCY.labels(catalog="correction").time():
+            result = await self.router.complete(messages, self.correction_max_tokens, parse_ai_response)
+        self._note_usage(result.response.usage, "correction", assortment, system_prompt, context, None)
+
+        operations = result.orders
+        if operations is None:
+            raise PatchError(f"Not a list of operations: {result.content}")
+        orders = apply_patch(order_data, operations, assortment)
+        logger.info(f"AI ({result.route}, {result.model}) patched order with {operations}: {orders}")
+        return orders
+
+    async def _select_correction_prompt(self, text: str, order_data: List[Dict],
+                                        assortment: AssortmentSnapshot) -> str:
+        """Correction prompt with the products of the order and of the correction, else the full catalog"""
+        candidates = None
+        if self.retriever is not None:
+            try:
+                index = await get_product_index()
+                candidates, _ = self.retriever.select(text, assortment, index)
+            except Exception as e:
+                logger.error(f"Catalog pruning failed, using full catalog: {e}")
+        if candidates is None:
+            if self._correction_prompt_version != assortment.version:
+                self._correction_prompt = (
+                    CORRECTION_INSTRUCTIONS + CATALOG_HEADER + format_catalog_tsv(assortment.products) + "\nEnd\n"
+                )
+                self._correction_prompt_version = assortment.version
+            return self._correction_prompt
+
+        good_ids = {product.good_id for product in candidates} | order_good_ids(order_data)
+        products = [assortment.get(good_id) for good_id in sorted(good_ids)]
+        products = [product for product in products if product is not None]
+        return CORRECTION_INSTRUCTIONS + CATALOG_HEADER + format_catalog_tsv(products) + "\nEnd\n"
+
+    async def _parse_without_ai(self, text: str, previous_messages: Optional[List[str]],
+                                recent_orders: Sequence[Order], started_at: float
+                                ) -> Tuple[Optional[List[Dict]], Optional[str]]:
+        """
+        Orders from the local parser or the parse cache
+
+        Returns:
+            (orders or None to ask the AI, parse cache key for the AI result)
+        """
+        if self.local_parser and not previous_messages:
+            orders = await self._parse_locally(text, recent_orders)
+            if orders is not None:
+                PARSE_LATENCY.labels(result="local").observe(time.perf_counter() - started_at)
+                return orders, None
+
+        cache_key = None
+        if self.parse_cache:
+            assortment = await get_assortment_store().get()
+            cache_key = self.parse_cache.key(text, date.today(), assortment.version, previous_messages)
+            orders = await self.parse_cache.get(cache_key)
+            if orders is not None:
+                PARSE_LATENCY.labels(result="cached").observe(time.perf_counter() - started_at)
+                return orders, None
+        return None, cache_key
+
+    async def _parsed_with_ai(self, orders: List[Dict], cache_key: Optional[str], started_at: float):
+        """Cache a successful AI result and observe the parse latency"""
+        failed = bool(orders) and bool(orders[0].get('message')) and not orders[0].get('adress')
+        if cache_key and orders and not failed:
+            await self.parse_cache.put(cache_key, orders)
+        PARSE_LATENCY.labels(result="failed" if failed else "ok").observe(time.perf_counter() - started_at)
+
+    @staticmethod
+    async def _recent_orders(user_id: Optional[int]) -> List[Order]:
+        """Confirmed orders of the customer: their addresses and usual products"""
+        if user_id is None:
+            return []
+        try:
+            return await Order.get_recent_confirmed(user_id)
+        except Exception as e:
+            logger.error(f"Failed to load recent orders of user {user_id}: {e}")
+            return []
+
+    @staticmethod
+    def _known_addresses(recent_orders: Sequence[Order]) -> List[str]:
+        addresses = []
+        for order in recent_orders:
+            for item in order.order_data if isinstance(order.order_data, list) else [order.order_data]:
+                if isinstance(item, dict) and item.get('adress'):
+                    addresses.append(item['adress'])
+        return addresses
+
+    async def _parse_locally(self, text: str, recent_orders: Sequence[Order]) -> Optional[List[Dict]]:
+        """Orders from the local parser, None to ask the AI"""
+        try:
+            snapshot = await get_assortment_store().get()
+            index = await get_product_index()
+            known_addresses = self._known_addresses(recent_orders) if "адрес" not in text.lower() else []
+            result = self.local_parser.parse(text, snapshot, index, date.today(), known_addresses)
+        except Exception as e:
+            logger.error(f"Local order parsing failed: {e}")
+            LOCAL_PARSE.labels(result="error").inc()
+            self.local_results["error"] = self.local_results.get("error", 0) + 1
+            return None
+
+        LOCAL_PARSE.labels(result=result.reason).inc()
+        self.local_results[result.reason] = self.local_results.get(result.reason, 0) + 1
+        if result.orders is not None and random.random() < self.shadow_rate:
+            task = asyncio.create_task(self._shadow_parse(text, result.orders))
+            self._shadow_tasks.add(task)
+            task.add_done_callback(self._shadow_tasks.discard)
+        return result.orders
+
+    async def _select_prompt(self, text: str, assortment: AssortmentSnapshot,
+                             recent_orders: Sequence[Order],
+                             previous_messages: Optional[List[str]] = None) -> Tuple[str, Optional[int]]:
+        """
+        System prompt with candidate products if they can be picked with
+        confidence, else with the full catalog
+
+        Candidates are picked from the previous messages too: the model
+        restates the whole order, with the products named there.
+
+        Returns:
+            (prompt, number of candidate products or None for the full catalog)
+        """
+        if self.retriever is None:
+            return self._get_system_prompt(assortment), None
+        try:
+            index = await get_product_index()
+            candidates, reason = self.retriever.select(
+                "\n".join([*(previous_messages or []), text]), assortment, index,
+                frequent_ids=frequent_good_ids(recent_orders, self.frequent_items),
+                known_addresses=self._known_addresses(recent_orders),
+            )
+        except Exception as e:
+            logger.error(f"Catalog pruning failed, using full catalog: {e}")
+            candidates, reason = None, "error"
+        PROMPT_CATALOG.labels(result=reason).inc()
+        self.prompt_catalogs[reason] = self.prompt_catalogs.get(reason, 0) + 1
+        if candidates is None:
+            return self._get_system_prompt(assortment), None
+        return self._build_system_prompt(candidates), len(candidates)
+
+    def _note_savings(self, assortment: AssortmentSnapshot, system_prompt: str, user_content: str,
+                      candidates: int, prompt_tokens: int):
+        """Estimate prompt tokens saved by the pruned catalog from the actual tokens per character"""
+        full_length = len(self._get_system_prompt(assortment))
+        tokens_per_char = prompt_tokens / (len(system_prompt) + len(user_content))
+        saved = max(0, round((full_length - len(system_prompt)) * tokens_per_char))
+        OPENAI_PROMPT_TOKENS_SAVED.inc(saved)
+        self.prompt_tokens_saved += saved
+        logger.info(
+            f"Catalog pruned to {candidates} of {len(assortment)} products: "
+            f"{prompt_tokens} prompt tokens, ~{saved} saved"
+        )
+
+    async def _shadow_parse(self, text: str, local_orders: List[Dict]):
+        """Parse a local hit with AI too and count whether they agree"""
+        model_orders = await self._parse_order(text)
+        if not model_orders or model_orders[0].get('message'):
+            result = "failed"
+        elif orders_agree(local_orders, model_orders):
+            result = "agree"
+        else:
+            result = "disagree"
+            logger.info(f"Local parse disagrees with AI for {text!r}: {local_orders} vs {model_orders}")
+        LOCAL_PARSE_SHADOW.labels(result=result).inc()
+        self.shadow_results[result] = self.shadow_results.get(result, 0) + 1
+
+    def stats(self) -> Dict[str, float]:
+        """Local parser hit rate and agreement with AI on shadowed hits"""
+        attempts = sum(self.local_results.values())
+        hits = self.local_results.get("hit", 0)
+        compared = self.shadow_results.get("agree", 0) + self.shadow_results.get("disagree", 0)
+        stats = {
+            "local_attempts": attempts,
+            "local_hits": hits,
+            "local_hit_rate": round(hits / attempts, 4) if attempts else 0.0,
+            "shadow_compared": compared,
+            "shadow_agreement": round(self.shadow_results.get("agree", 0) / compared, 4) if compared else 0.0,
+            "shadow_failed": self.shadow_results.get("failed", 0),
+        }
+        for reason, count in sorted(self.local_results.items()):
+            if reason != "hit":
+                stats[f"local_fallback_{reason}"] = count
+        for reason, count in sorted(self.prompt_catalogs.items()):
+            stats[f"prompt_catalog_{reason}"] = count
+        stats["prompt_tokens_saved"] = self.prompt_tokens_saved
+        for result, count in sorted(self.stream_results.items()):
+            stats[f"stream_{result}"] = count
+        for result, count in sorted(self.correction_results.items()):
+            stats[f"correction_{result}"] = count
+        return stats
+
+    @staticmethod
+    def _build_messages(system_prompt: str, text: str,
+                        previous_messages: Optional[List[str]] = None) -> Tuple[List[Dict], str]:
+        """Chat messages of the parse request and the user message content"""
+        context = f"Сегодняшняя дата: {datetime.now().strftime('%Y-%m-%d')}\n"
+        if previous_messages:
+            context += "Предыдущие сообщения: " + " | ".join(previous_messages) + "\n"
+        context += f"Сообщение: {text}"
+        messages = [
+            {'role': 'system', 'content': system_prompt},
+            {'role': 'user', 'content': context},
+        ]
+        return messages, context
+
+    def _note_usage(self, usage, catalog: str, assortment: AssortmentSnapshot, system_prompt: str,
+                    context: str, candidates: Optional[int]):
+        """Token metrics of a completion"""
+        if not usage:
+            return
+        OPENAI_TOKENS.labels(kind="prompt").inc(usage.prompt_tokens)
+        OPENAI_TOKENS.labels(kind="completion").inc(usage.completion_tokens)
+        OPENAI_PROMPT_TOKENS.labels(catalog=catalog).observe(usage.prompt_tokens)
+        if candidates is not None:
+            self._note_savings(assortment, system_prompt, context, candidates, usage.prompt_tokens)
+
+    async def _stream_order(self, text: str, previous_messages: Optional[List[str]] = None,
+                            recent_orders: Sequence[Order] = ()) -> AsyncIterator[StreamedOrder]:
+        """
+        Parse order from text with a streamed OpenAI chat completion,
+        yielding each order once its object is complete. Without an order
+        by the router's hedge deadline the hedge model is asked too, and
+        its valid answer wins if it comes first. If the stream fails before
+        the first order, the order is parsed without streaming (with
+        hedging and the fallback model).
+        """
+        assortment = await get_assortment_store().get()
+        system_prompt, candidates = await self._select_prompt(
+            text, assortment, recent_orders, previous_messages
+        )
+        catalog = "full" if candidates is None else "pruned"
+        messages, context = self._build_messages(system_prompt, text, previous_messages)
+
+        # The stream is read by a task of its own, so a slow consumer (message
+        # edits waiting for Telegram limits) doesn't hold the OpenAI slot
+        queue: asyncio.Queue = asyncio.Queue()
+        reader = asyncio.create_task(self._read_stream(messages, catalog, queue))
+        emitted = 0
+        try:
+            streamed, hedged = await self._first_or_hedge(queue, messages)
+            if hedged is not None:
+                logger.info(f"AI ({hedged.route}, {hedged.model}) answered before the stream: {hedged.orders}")
+                self.router.count_stream(hedged.route)
+                self.stream_results["hedged"] = self.stream_results.get("hedged", 0) + 1
+                self._note_usage(hedged.response.usage, catalog, assortment, system_prompt, context, candidates)
+                for streamed in as_streamed(hedged.orders):
+                    yield streamed
+                return
+            while streamed is not None:
+                emitted += 1
+                yield streamed
+                streamed = await queue.get()
+            content, usage = await reader
+        except Exception as e:
+            if emitted:
+                # Shown orders can't be taken back
+                raise
+            logger.warning(f"Streamed order parsing failed ({e!r}), parsing without streaming")
+            self.stream_results["fallback"] = self.stream_results.get("fallback", 0) + 1
+            orders = await self._parse_order(text, previous_messages, recent_orders)
+            for streamed in as_streamed(orders):
+                yield streamed
+            return
+        finally:
+            reader.cancel()
+
+        self.router.count_stream("primary")
+        self.stream_results["ok"] = self.stream_results.get("ok", 0) + 1
+        self._note_usage(usage, catalog, assortment, system_prompt, context, candidates)
+        if emitted:
+            return
+        # Nothing looked like an order object, try the whole answer
+        orders = parse_ai_response(content)
+        if orders is None:
+            logger.error(f"AI returned invalid JSON: {content}")
+            orders = [{
+                'date_delivery': None,
+                'adress': None,
+                'goods': {},
+                'payment_type': None,
+                'company_name': None,
+                'message': 'Не удалось распознать заказ. Пожалуйста, попробуйте еще раз или уточните детали заказа.'
+            }]
+        for streamed in as_streamed(orders):
+            yield streamed
+
+    async def _first_or_hedge(self, queue: asyncio.Queue, messages: List[Dict]
+                              ) -> Tuple[Optional[StreamedOrder], Optional[RouteResult]]:
+        """
+        First item of the stream queue, or the hedge model's valid answer
+        if the stream has no order by the hedge deadline and the hedge
+        answers first
+
+        Returns:
+            (first item, None) or (None, hedge answer)
+        """
+        getter = asyncio.ensure_future(queue.get())
+        hedge: Optional[asyncio.Task] = None
+        try:
+            if self.router.hedge_enabled:
+                done, _ = await asyncio.wait({getter}, timeout=self.router.hedge_delay())
+                if not done:
+                    hedge = asyncio.create_task(self.router.hedge(messages, self.max_tokens, parse_ai_response))
+                    await asyncio.wait({getter, hedge}, return_when=asyncio.FIRST_COMPLETED)
+                    if getter.done() and getter.result() is None:
+                        # Stream ended without an order, the hedge may still answer
+                        await asyncio.wait({hedge})
+                    streamed_first = getter.done() and getter.result() is not None
+                    if not streamed_first and hedge.done() and hedge.exception() is None \
+                            and hedge.result().orders is not None:
+                        return None, hedge.result()
+                    # Hedge failed or answered nonsense: the stream still may answer
+            return await getter, None
+        finally:
+            getter.cancel()
+            if hedge is not None:
+                hedge.cancel()
+
+    async def _read_stream(self, messages: List[Dict], catalog: str, queue: asyncio.Queue) -> Tuple[str, Any]:
+        """
+        Read the completion stream, putting complete orders to the queue
+        and None at the end
+
+        Returns:
+            (completion content, usage)
+        """
+        parser = OrderStreamParser()
+        content: List[str] = []
+        usage = None
+        started_at = time.monotonic()
+        outcome = "error"
+        try:
+            with OPENAI_REQUEST_LATENCY.labels(catalog=catalog).time():
+                async with aclosing(self.governor.stream(messages, self.max_tokens, model=self.model)) as chunks:
+                    async for chunk in chunks:
+                        if chunk.usage is not None:
+                            usage = chunk.usage
+                        if not chunk.choices or not chunk.choices[0].delta.content:
+                            continue
+                        delta = chunk.choices[0].delta.content
+                        content.append(delta)
+                        for streamed in parser.feed(delta):
+                            queue.put_nowait(streamed)
+            for streamed in parser.finish():
+                queue.put_nowait(streamed)
+            outcome = "invalid" if parser.errors else "ok"
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        finally:
+            queue.put_nowait(None)
+            # Streams are the primary's requests too: its latencies set the hedge deadline and health
+            self.router.record_primary(started_at, outcome)
+        if parser.errors:
+            logger.error(f"AI returned {parser.errors} invalid order objects: {''.join(content)}")
+        return "".join(content), usage
+
+    async def _parse_order(self, text: str, previous_messages: Optional[List[str]] = None,
+                           recent_orders: Sequence[Order] = ()) -> List[Dict]:
+        """Parse order from text with OpenAI chat completion"""
         try:
             # Get assortment and build prompt
-            assortment = await self._get_assortment()
-            system_prompt = self._build_system_prompt(assortment)
-            
-            messages = [
-                {'role': 'system', 'content': system_prompt}
-            ]
-            
-            # Add context
-            context = f"Сегодняшняя дата: {datetime.now().strftime('%Y-%m-%d')}\n"
-            if previous_messages:
-                context += "Предыдущие сообщения: " + " | ".join(previous_messages) + "\n"
-            context += f"Сообщение: {text}"
+            assortment = await get_assortment_store().get()
+            system_prompt, candidates = await self._select_prompt(
+                text, assortment, recent_orders, previous_messages
+            )
+            catalog = "full" if candidates is None else "pruned"
             
-            messages.append({"role": "user", "content": context})
+            messages, context = self._build_messages(system_prompt, text, previous_messages)
             
-            # Call OpenAI API
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                max_tokens=self.max_tokens
-            )
+            # Call OpenAI API (primary model, hedged or fallback)
+            with OPENAI_REQUEST_LATENCY.labels(catalog=catalog).time():
+                result = await self.router.complete(messages, self.max_tokens, parse_ai_response)
+            self._note_usage(result.response.usage, catalog, assortment, system_prompt, context, candidates)
             
-            ai_response = response.choices[0].message.content
-            messages.append({"role": "assistant", "content": ai_response})
+            if result.orders is not None:
+                logger.info(f"AI ({result.route}, {result.model}) returned valid JSON: {result.orders}")
+                return result.orders
             
-            # Parse JSON response
-            try:
-                parsed = json.loads(ai_response)
-                logger.info(f"AI returned valid JSON: {parsed}")
-                return parsed if isinstance(parsed, list) else [parsed]
-            except json.JSONDecodeError:
-                logger.error(f"AI returned invalid JSON: {ai_response}")
-                # Try to extract JSON from text
-                import re
-                json_match = re.search(r'\[.*\]', ai_response, re.DOTALL)
-                if json_match:
-                    try:
-                        parsed = json.loads(json_match.group())
-                        return parsed if isinstance(parsed, list) else [parsed]
-                    except json.JSONDecodeError:
-                        pass
-                
-                # Return error response
-                return [{
-                    'date_delivery': None,
-                    'adress': None,
-                    'goods': {},
-                    'payment_type': None,
-                    'company_name': None,
-                    'message': 'Не удалось распознать заказ. Пожалуйста, попробуйте еще раз или уточните детали заказа.'
-                }]
+            logger.error(f"AI returned invalid JSON: {result.content}")
+            # Return error response
+            return [{
+                'date_delivery': None,
+                'adress': None,
+                'goods': {},
+                'payment_type': None,
+                'company_name': None,
+                'message': 'Не удалось распознать заказ. Пожалуйста, попробуйте еще раз или уточните детали заказа.'
+            }]
                 
+        except (RateLimitError, APITimeoutError, asyncio.TimeoutError, APIConnectionError, InternalServerError) as e:
+            # Still failing after the governor's retries (asyncio.TimeoutError: the attempt deadline)
+            logger.error(f"OpenAI unavailable: {e!r}")
+            return [{
+                'date_delivery': None,
+                'adress': None,
+                'goods': {},
+                'payment_type': None,
+                'company_name': None,
+                'message': 'Сервис распознавания заказов сейчас перегружен. Попробуйте через минуту.'
+            }]
         except BadRequestError as e:
             logger.error(f"OpenAI API error: {e}")
             return [{
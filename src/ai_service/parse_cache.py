@@ -0,0 +1,163 @@
+"""Cache of order parse results by message text"""
+import copy
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from src.config import get_settings
+from src.database import get_database
+from src.metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+PARSE_CACHE_REQUESTS = Counter(
+    "parse_cache_requests_total",
+    "Order parse cache lookups",
+    ["result"],
+)
+
+
+def normalize_message(text: str) -> str:
+    """Lower case, ё → е, single spaces; punctuation is kept, it can matter for addresses"""
+    return " ".join(text.lower().replace("ё", "е").split())
+
+
+class ParseCache:
+    """
+    LRU cache of AI parse results with TTL.
+
+    The key is the normalized message text plus today's date (relative
+    dates like "завтра" resolve differently tomorrow) and the assortment
+    version (good_id and min_size come from it). With use_database the
+    results are also kept in the parse_cache table, so they survive
+    restarts and are shared by all bot replicas.
+    """
+
+    def __init__(self, ttl: int = 86400, max_size: int = 5000, use_database: bool = False):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.use_database = use_database
+        self._results: "OrderedDict[str, Tuple[float, List[Dict]]]" = OrderedDict()
+        self._last_cleanup = time.monotonic()
+
+        # Stats
+        self.hits = 0
+        self.database_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(text: str, today: date, assortment_version: str,
+            previous_messages: Optional[Sequence[str]] = None) -> str:
+        """Cache key of a message (sha256, fits CHAR(64))"""
+        parts = [today.isoformat(), assortment_version, normalize_message(text)]
+        if previous_messages:
+            parts.extend(normalize_message(message) for message in previous_messages)
+        return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+    async def get(self, key: str) -> Optional[List[Dict]]:
+        """Cached orders (a copy), None on miss"""
+        now = time.monotonic()
+        entry = self._results.get(key)
+        if entry is not None:
+            if entry[0] > now:
+                self._results.move_to_end(key)
+                self.hits += 1
+                PARSE_CACHE_REQUESTS.labels(result="hit").inc()
+                # Handlers keep orders in FSM state and may change them
+                return copy.deepcopy(entry[1])
+            del self._results[key]
+
+        if self.use_database:
+            orders = await self._get_from_database(key)
+            if orders is not None:
+                self._remember(key, orders, now)
+                self.database_hits += 1
+                PARSE_CACHE_REQUESTS.labels(result="database_hit").inc()
+                return copy.deepcopy(orders)
+
+        self.misses += 1
+        PARSE_CACHE_REQUESTS.labels(result="miss").inc()
+        return None
+
+    async def put(self, key: str, orders: List[Dict]):
+        """Cache successfully parsed orders"""
+        now = time.monotonic()
+        self._remember(key, copy.deepcopy(orders), now)
+        if self.use_database:
+            await self._put_to_database(key, orders, now)
+
+    def _remember(self, key: str, orders: List[Dict], now: float):
+        self._results[key] = (now + self.ttl, orders)
+        self._results.move_to_end(key)
+        while len(self._results) > self.max_size:
+            self._results.popitem(last=False)
+
+    async def _get_from_database(self, key: str) -> Optional[List[Dict]]:
+        try:
+            rows = await get_database().execute_query(
+                """SELECT result FROM parse_cache
+                   WHERE cache_key = %s AND created_at > NOW() - INTERVAL %s SECOND""",
+                (key, self.ttl),
+                row_factory=tuple,
+            )
+        except Exception as e:
+            logger.error(f"Failed to read parse cache: {e}")
+            return None
+        if not rows:
+            return None
+        result = rows[0][0]
+        return json.loads(result) if isinstance(result, (str, bytes)) else result
+
+    async def _put_to_database(self, key: str, orders: List[Dict], now: float):
+        db = get_database()
+        try:
+            await db.execute_command(
+                """INSERT INTO parse_cache (cache_key, result) VALUES (%s, %s)
+                   ON DUPLICATE KEY UPDATE result = VALUES(result), created_at = NOW()""",
+                (key, json.dumps(orders, ensure_ascii=False)),
+            )
+            if now - self._last_cleanup > self.ttl:
+                self._last_cleanup = now
+                await db.execute_command(
+                    "DELETE FROM parse_cache WHERE created_at < NOW() - INTERVAL %s SECOND",
+                    (self.ttl,)
+                )
+        except Exception as e:
+            # The result is still cached in process
+            logger.error(f"Failed to write parse cache: {e}")
+
+    def clear(self):
+        self._results.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Parse cache statistics"""
+        lookups = self.hits + self.database_hits + self.misses
+        return {
+            "backend": "mysql" if self.use_database else "memory",
+            "size": len(self._results),
+            "hits": self.hits,
+            "database_hits": self.database_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.database_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+
+# Global parse cache instance
+_parse_cache: Optional[ParseCache] = None
+
+
+def get_parse_cache() -> ParseCache:
+    """Get parse cache instance (singleton)"""
+    global _parse_cache
+    if _parse_cache is None:
+        settings = get_settings().parse_cache
+        _parse_cache = ParseCache(
+            ttl=settings.ttl,
+            max_size=settings.max_size,
+            use_database=settings.backend == "mysql",
+        )
+    return _parse_cache
@@ -0,0 +1,93 @@
+"""Candidate products for the AI prompt instead of the whole catalog"""
+from collections import Counter as TallyCounter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from src.database import Assortment, AssortmentSnapshot, Order
+from src.metrics import Counter
+from .local_parser import ADDRESS_PATTERN, DATE_PATTERN, NUMBER_WORDS, SEGMENT_SEPARATORS, STOPWORDS, UNIT_WORDS
+from .search import ProductSearchIndex, normalize, tokenize
+
+PROMPT_CATALOG = Counter(
+    "prompt_catalog_total",
+    "AI prompts by catalog sent: pruned to candidates, or full and why",
+    ["result"],
+)
+
+# Products per line of the message kept as candidates (near misses included)
+CANDIDATES_PER_LINE = 3
+
+
+def frequent_good_ids(orders: Iterable[Order], limit: int) -> List[int]:
+    """Products the customer orders most often in the given orders"""
+    tally: TallyCounter = TallyCounter()
+    for order in orders:
+        items = order.order_data if isinstance(order.order_data, list) else [order.order_data]
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            for good_id in item.get("goods") or {}:
+                try:
+                    tally[int(good_id)] += 1
+                except (TypeError, ValueError):
+                    continue
+    return [good_id for good_id, _ in tally.most_common(limit)]
+
+
+class CatalogRetriever:
+    """
+    Picks the products an order message can refer to: the best name
+    matches of every line plus the customer's frequent items.
+
+    The full catalog is used instead (None) when the catalog is small
+    anyway or the message can't be matched with confidence: a line with
+    a quantity but no product found, or more candidates than top_k.
+    """
+
+    def __init__(self, top_k: int = 30, min_score: float = 0.6, min_catalog_size: int = 100):
+        self.top_k = top_k
+        self.min_score = min_score
+        self.min_catalog_size = min_catalog_size
+
+    def select(self, text: str, snapshot: AssortmentSnapshot, index: ProductSearchIndex,
+               frequent_ids: Sequence[int] = (), known_addresses: Sequence[str] = ()
+               ) -> Tuple[Optional[List[Assortment]], str]:
+        """
+        Returns:
+            (candidate products, "pruned") or (None, reason to send the full catalog)
+        """
+        if len(snapshot) < self.min_catalog_size:
+            return None, "small_catalog"
+
+        # Address and date lines have numbers too, they are not product lines
+        text = DATE_PATTERN.sub(",", ADDRESS_PATTERN.sub(",", text))
+        addresses = {normalize(address) for address in known_addresses}
+
+        scores: Dict[int, float] = {}
+        for line in SEGMENT_SEPARATORS.split(text):
+            words = [
+                word for word in tokenize(line)
+                if word not in STOPWORDS and word not in UNIT_WORDS and word not in NUMBER_WORDS
+                and not word.isdigit()
+            ]
+            if not words:
+                continue
+            results = index.search(line, limit=CANDIDATES_PER_LINE, min_score=self.min_score)
+            if not results:
+                if any(char.isdigit() for char in line) and normalize(line) not in addresses:
+                    # Something with a quantity we can't find, maybe under another name
+                    return None, "unmatched_line"
+                continue
+            for result in results:
+                scores[result.good_id] = max(scores.get(result.good_id, 0.0), result.score)
+
+        if not scores:
+            return None, "no_match"
+        if len(scores) > self.top_k:
+            return None, "too_many"
+        for good_id in frequent_ids:
+            if len(scores) >= self.top_k:
+                break
+            scores.setdefault(good_id, 0.0)
+
+        products = [snapshot.get(good_id) for good_id in sorted(scores)]
+        return [product for product in products if product is not None], "pruned"
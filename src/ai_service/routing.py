@@ -0,0 +1,253 @@
+"""Hedged and fallback routing of chat completions between models"""
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, List, Optional, Set
+
+from src.metrics import Counter, Histogram
+from .governor import OpenAIGovernor
+
+logger = logging.getLogger(__name__)
+
+OPENAI_ROUTE_LATENCY = Histogram(
+    "openai_route_seconds",
+    "Chat completion latency by route (primary, hedge, fallback) and result",
+    ["route", "result"],
+)
+OPENAI_ROUTE_WINS = Counter(
+    "openai_route_wins_total",
+    "Requests answered by each route",
+    ["route"],
+)
+
+# Latencies (and outcomes) of the primary model kept for the hedge deadline and health
+HEALTH_WINDOW = 200
+# Fewer samples than this say nothing about percentiles or error rate
+MIN_SAMPLES = 20
+
+Validator = Callable[[str], Optional[List[Dict]]]
+
+
+@dataclass
+class RouteResult:
+    """Completion that answered the request"""
+    response: Any
+    content: str
+    orders: Optional[List[Dict]]
+    route: str
+    model: str
+
+
+class _ModelHealth:
+    """Rolling latencies and error rate of a model"""
+
+    def __init__(self, window: int = HEALTH_WINDOW):
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.outcomes: Deque[bool] = deque(maxlen=window)
+
+    def record(self, latency: float, ok: bool):
+        self.outcomes.append(ok)
+        if ok:
+            self.latencies.append(latency)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if len(self.latencies) < MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def error_rate(self) -> Optional[float]:
+        if len(self.outcomes) < MIN_SAMPLES:
+            return None
+        return 1 - sum(self.outcomes) / len(self.outcomes)
+
+    def reset(self):
+        self.latencies.clear()
+        self.outcomes.clear()
+
+
+class ModelRouter:
+    """
+    Sends a completion to the primary model and, if it hasn't answered by
+    the hedge deadline (a percentile of its recent latencies), also to the
+    hedge model; the first valid answer wins and the other is cancelled.
+
+    When the primary fails, or is degraded (error rate or median latency
+    over the limits), requests go to the fallback model; a degraded
+    primary gets traffic again after the cooldown.
+
+    Streamed requests of the primary are made by the caller, which
+    reports them (record_primary, count_stream) and hedges them (hedge).
+    """
+
+    def __init__(
+        self,
+        governor: OpenAIGovernor,
+        model: str,
+        fallback_model: Optional[str] = None,
+        hedge_enabled: bool = True,
+        hedge_model: Optional[str] = None,
+        hedge_quantile: float = 0.95,
+        hedge_min_delay: float = 1.0,
+        hedge_max_delay: float = 8.0,
+        degraded_error_rate: float = 0.5,
+        degraded_latency: float = 8.0,
+        degraded_cooldown: float = 30.0,
+    ):
+        self.governor = governor
+        self.model = model
+        self.fallback_model = fallback_model
+        self.hedge_enabled = hedge_enabled
+        self.hedge_model = hedge_model or model
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_max_delay = hedge_max_delay
+        self.degraded_error_rate = degraded_error_rate
+        self.degraded_latency = degraded_latency
+        self.degraded_cooldown = degraded_cooldown
+        self._primary = _ModelHealth()
+        self._degraded_until = 0.0
+
+        # Stats
+        self.requests = 0
+        self.hedged = 0
+        self.wins: Dict[str, int] = {}
+
+    def hedge_delay(self) -> float:
+        """Seconds to wait for the primary before hedging"""
+        latency = self._primary.quantile(self.hedge_quantile)
+        if latency is None:
+            return self.hedge_max_delay
+        return min(self.hedge_max_delay, max(self.hedge_min_delay, latency))
+
+    def primary_degraded(self) -> bool:
+        """Whether requests should skip the primary model for now"""
+        if self.fallback_model is None:
+            return False
+        now = time.monotonic()
+        if now < self._degraded_until:
+            return True
+        error_rate = self._primary.error_rate()
+        median = self._primary.quantile(0.5)
+        if (error_rate is not None and error_rate >= self.degraded_error_rate) or (
+            median is not None and median >= self.degraded_latency
+        ):
+            logger.warning(
+                f"Model {self.model} degraded (error rate {error_rate}, median {median}s), "
+                f"using {self.fallback_model} for {self.degraded_cooldown}s"
+            )
+            self._degraded_until = now + self.degraded_cooldown
+            # Judge the primary afresh after the cooldown
+            self._primary.reset()
+            return True
+        return False
+
+    async def complete(self, messages: List[Dict[str, Any]], max_tokens: int, validate: Validator) -> RouteResult:
+        """
+        Get a completion over the routes
+
+        validate turns the content into orders (None if invalid); an
+        invalid answer doesn't win while another route may still answer.
+        """
+        self.requests += 1
+        if self.primary_degraded():
+            result = await self._call("fallback", self.fallback_model, messages, max_tokens, validate)
+            return self._won(result)
+
+        tasks: Set[asyncio.Task] = {
+            asyncio.create_task(self._call("primary", self.model, messages, max_tokens, validate))
+        }
+        hedge_at = time.monotonic() + self.hedge_delay() if self.hedge_enabled else None
+        invalid: Optional[RouteResult] = None
+        error: Optional[BaseException] = None
+        try:
+            while tasks:
+                timeout = max(0.0, hedge_at - time.monotonic()) if hedge_at is not None else None
+                done, tasks = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedge_at = None
+                    tasks.add(asyncio.create_task(self.hedge(messages, max_tokens, validate)))
+                    continue
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                        continue
+                    result = task.result()
+                    if result.orders is not None:
+                        return self._won(result)
+                    invalid = invalid or result
+                if not tasks and hedge_at is not None:
+                    # Primary failed or answered nonsense before the deadline, hedge right away
+                    hedge_at = None
+                    tasks.add(asyncio.create_task(self.hedge(messages, max_tokens, validate)))
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        if invalid is not None:
+            return self._won(invalid)
+        if self.fallback_model is not None:
+            logger.warning(f"Model {self.model} failed ({error!r}), falling back to {self.fallback_model}")
+            result = await self._call("fallback", self.fallback_model, messages, max_tokens, validate)
+            return self._won(result)
+        raise error
+
+    async def hedge(self, messages: List[Dict[str, Any]], max_tokens: int, validate: Validator) -> RouteResult:
+        """Completion of the hedge model for a primary request made by the caller"""
+        self.hedged += 1
+        return await self._call("hedge", self.hedge_model, messages, max_tokens, validate)
+
+    def record_primary(self, started_at: float, outcome: str):
+        """Latency and outcome (ok, invalid, error, cancelled) of a primary request made by the caller"""
+        elapsed = time.monotonic() - started_at
+        OPENAI_ROUTE_LATENCY.labels(route="primary", result=outcome).observe(elapsed)
+        # A cancelled straggler took at least this long, keep it so the percentile isn't biased low
+        self._primary.record(elapsed, outcome != "error")
+
+    def count_stream(self, route: str):
+        """Count a streamed request answered by the route (primary or hedge)"""
+        self.requests += 1
+        self._count_win(route)
+
+    async def _call(self, route: str, model: str, messages: List[Dict[str, Any]], max_tokens: int,
+                    validate: Validator) -> RouteResult:
+        started_at = time.monotonic()
+        outcome = "error"
+        try:
+            response = await self.governor.create(messages, max_tokens, model=model)
+            content = response.choices[0].message.content or ""
+            orders = validate(content)
+            outcome = "ok" if orders is not None else "invalid"
+            return RouteResult(response, content, orders, route, model)
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        finally:
+            if route == "primary":
+                self.record_primary(started_at, outcome)
+            else:
+                OPENAI_ROUTE_LATENCY.labels(route=route, result=outcome).observe(time.monotonic() - started_at)
+
+    def _won(self, result: RouteResult) -> RouteResult:
+        self._count_win(result.route)
+        return result
+
+    def _count_win(self, route: str):
+        OPENAI_ROUTE_WINS.labels(route=route).inc()
+        self.wins[route] = self.wins.get(route, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Routing statistics"""
+        stats = {
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "hedge_delay_seconds": round(self.hedge_delay(), 4),
+            "primary_degraded": int(time.monotonic() < self._degraded_until),
+        }
+        for route in ("primary", "hedge", "fallback"):
+            wins = self.wins.get(route, 0)
+            stats[f"{route}_wins"] = wins
+            stats[f"{route}_win_rate"] = round(wins / self.requests, 4) if self.requests else 0.0
+        return stats
@@ -0,0 +1,245 @@
+"""In-memory fuzzy search over assortment product names"""
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from src.database import Assortment, AssortmentSnapshot, get_assortment_store
+
+_NON_WORD = re.compile(r"[^\w]+")
+
+# Postings entries counted per search, rarest trigrams first; common ones
+# (shared by thousands of products) add little and cost the most
+POSTING_BUDGET = 512
+# Candidates kept after the trigram hit count, and of them rescored by words
+MAX_CANDIDATES = 32
+RESCORED_CANDIDATES = 16
+# Deeper prefixes are rare, no need to keep them in the trie
+MAX_PREFIX_LENGTH = 12
+MIN_PREFIX_LENGTH = 3
+
+
+def normalize(text: str) -> str:
+    """Lower case, ё → е, punctuation to spaces, single spaces"""
+    text = text.lower().replace("ё", "е")
+    return " ".join(_NON_WORD.sub(" ", text).replace("_", " ").split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Normalized words of text"""
+    return normalize(text).split()
+
+
+def trigrams(tokens: Iterable[str]) -> FrozenSet[str]:
+    """Character trigrams of words padded with spaces ("гаус" → " га", "гау", "аус", "ус ")"""
+    result = set()
+    for token in tokens:
+        padded = f" {token} "
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return frozenset(result)
+
+
+@dataclass(frozen=True)
+class SearchResult:
+    """Ranked product candidate"""
+    good_id: int
+    name: str
+    score: float
+
+
+@dataclass(frozen=True)
+class _Document:
+    name: str
+    tokens: Tuple[str, ...]
+    trigrams: FrozenSet[str]
+
+
+class _TrieNode:
+    __slots__ = ("children", "ids")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        # Products having a word that starts with the prefix of this node
+        self.ids: Set[int] = set()
+
+
+class ProductSearchIndex:
+    """
+    Fuzzy product name index: trigram postings for typos and word order,
+    a prefix trie for shorthand ("хорош" → "Хорошечное").
+
+    Built from an assortment snapshot; sync() with a newer snapshot only
+    re-indexes added, changed and removed products.
+    """
+
+    def __init__(self):
+        self.version: Optional[str] = None
+        self._documents: Dict[int, _Document] = {}
+        self._postings: Dict[str, Set[int]] = {}
+        self._trie = _TrieNode()
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def sync(self, snapshot: AssortmentSnapshot) -> int:
+        """
+        Bring index up to the snapshot
+
+        Returns:
+            Number of re-indexed products (0 if the version is unchanged)
+        """
+        if snapshot.version == self.version:
+            return 0
+        changed = 0
+        for good_id in [good_id for good_id in self._documents if good_id not in snapshot.by_id]:
+            self.remove(good_id)
+            changed += 1
+        for product in snapshot:
+            document = self._documents.get(product.good_id)
+            if document is None or document.name != product.name:
+                self.add(product)
+                changed += 1
+        self.version = snapshot.version
+        return changed
+
+    def add(self, product: Assortment):
+        """Index product (re-index if its name changed)"""
+        if product.good_id in self._documents:
+            self.remove(product.good_id)
+        tokens = tuple(tokenize(product.name))
+        document = _Document(product.name, tokens, trigrams(tokens))
+        self._documents[product.good_id] = document
+
+        for trigram in document.trigrams:
+            self._postings.setdefault(trigram, set()).add(product.good_id)
+        for token in tokens:
+            node = self._trie
+            for char in token[:MAX_PREFIX_LENGTH]:
+                node = node.children.setdefault(char, _TrieNode())
+                node.ids.add(product.good_id)
+
+    def remove(self, good_id: int):
+        """Drop product from index"""
+        document = self._documents.pop(good_id, None)
+        if document is None:
+            return
+        for trigram in document.trigrams:
+            posting = self._postings.get(trigram)
+            if posting is not None:
+                posting.discard(good_id)
+                if not posting:
+                    del self._postings[trigram]
+        for token in document.tokens:
+            path = []
+            node = self._trie
+            for char in token[:MAX_PREFIX_LENGTH]:
+                child = node.children.get(char)
+                if child is None:
+                    break
+                child.ids.discard(good_id)
+                path.append((node, char, child))
+                node = child
+            # Prune branches left without products
+            for parent, char, child in reversed(path):
+                if child.ids or child.children:
+                    break
+                del parent.children[char]
+
+    def _prefix_ids(self, prefix: str) -> Set[int]:
+        node = self._trie
+        for char in prefix[:MAX_PREFIX_LENGTH]:
+            node = node.children.get(char)
+            if node is None:
+                return set()
+        return node.ids
+
+    def search(self, text: str, limit: int = 5, min_score: float = 0.3) -> List[SearchResult]:
+        """
+        Rank products by how well their names are present in text
+
+        Score is 1.0 when every word of the name is in the text, partial
+        words (prefixes) and typos (shared trigrams) score lower.
+        """
+        query_tokens = [token for token in tokenize(text) if not token.isdigit()]
+        if not query_tokens or not self._documents:
+            return []
+        query_trigrams = trigrams(query_tokens)
+
+        # Cheap candidate generation: hits in the most selective trigram postings and prefix matches
+        postings = sorted(
+            (posting for posting in map(self._postings.get, query_trigrams) if posting),
+            key=len,
+        )
+        hits: Counter = Counter()
+        budget = POSTING_BUDGET
+        for posting in postings:
+            if len(posting) > budget and hits:
+                break
+            hits.update(posting)
+            budget -= len(posting)
+        prefixed: Set[int] = set()
+        for token in query_tokens:
+            if len(token) >= MIN_PREFIX_LENGTH:
+                ids = self._prefix_ids(token)
+                if len(ids) <= MAX_CANDIDATES:
+                    prefixed.update(ids)
+        if len(hits) > MAX_CANDIDATES:
+            candidates = {good_id for good_id, _ in hits.most_common(MAX_CANDIDATES)}
+        else:
+            candidates = set(hits)
+        if len(prefixed) <= MAX_CANDIDATES:
+            candidates.update(prefixed)
+
+        # Trigram containment is cheap (set intersection), word matching only for the best of them
+        rough = []
+        for good_id in candidates:
+            document = self._documents[good_id]
+            trigram_score = len(document.trigrams & query_trigrams) / len(document.trigrams)
+            rough.append((trigram_score + (0.5 if good_id in prefixed else 0.0), good_id, trigram_score))
+        rough.sort(reverse=True)
+
+        query_words = set(query_tokens)
+        results = []
+        for _, good_id, trigram_score in rough[:max(limit * 3, RESCORED_CANDIDATES)]:
+            document = self._documents[good_id]
+            score = max(self._word_score(document, query_words), 0.9 * trigram_score)
+            if score >= min_score:
+                results.append(SearchResult(good_id, document.name, round(score, 4)))
+        results.sort(key=lambda result: (-result.score, len(result.name)))
+        return results[:limit]
+
+    @staticmethod
+    def _word_score(document: _Document, query_words: Set[str]) -> float:
+        """Share of name words found in the query, exactly or as a prefix ("хорош" for "хорошечное")"""
+        if not document.tokens:
+            return 0.0
+        total = 0.0
+        for token in document.tokens:
+            if token in query_words:
+                total += 1.0
+                continue
+            # Longest prefix of the word written in the query
+            for length in range(len(token) - 1, MIN_PREFIX_LENGTH - 1, -1):
+                if token[:length] in query_words:
+                    total += 0.6 + 0.4 * length / len(token)
+                    break
+        return total / len(document.tokens)
+
+
+# Global index instance
+_index: Optional[ProductSearchIndex] = None
+
+
+def get_search_index() -> ProductSearchIndex:
+    """Get product search index instance (singleton), possibly behind the assortment"""
+    global _index
+    if _index is None:
+        _index = ProductSearchIndex()
+    return _index
+
+
+async def get_product_index() -> ProductSearchIndex:
+    """Get product search index synced with the current assortment snapshot"""
+    index = get_search_index()
+    index.sync(await get_assortment_store().get())
+    return index
@@ -0,0 +1,125 @@
+"""Incremental parsing of a streamed AI order answer"""
+import json
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from src.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+FIRST_ORDER_LATENCY = Histogram(
+    "order_parse_first_order_seconds",
+    "Time from a streamed AI parse start to its first complete order",
+)
+
+
+@dataclass
+class StreamedOrder:
+    """Order of a parse result; last is False while more orders may follow"""
+    order: Dict
+    last: bool
+
+
+def as_streamed(orders: List[Dict]) -> List[StreamedOrder]:
+    """Orders parsed at once as a stream"""
+    return [StreamedOrder(order, last=i == len(orders) - 1) for i, order in enumerate(orders)]
+
+
+class OrderStreamParser:
+    """
+    Incremental parser of the AI answer: a JSON array of order objects or
+    a single object, possibly after some text (a code fence, a preface).
+
+    feed() takes the completion chunk by chunk and returns the orders
+    whose objects got complete. An order is held back until the next
+    separator shows whether more follow (',' or ']'), so the caller knows
+    which one is the last.
+    """
+
+    def __init__(self):
+        self._object: List[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        # '[' or '{' once the JSON has started
+        self._top: Optional[str] = None
+        self._held: Optional[Dict] = None
+        self.done = False
+        # Objects that were complete but not valid JSON orders
+        self.errors = 0
+
+    def feed(self, chunk: str) -> List[StreamedOrder]:
+        """Orders completed by the chunk"""
+        ready: List[StreamedOrder] = []
+        for char in chunk:
+            if self.done:
+                break
+            if self._depth:
+                self._read_object(char, ready)
+            elif self._top is None:
+                if char in "[{":
+                    self._top = char
+                    if char == "{":
+                        self._start_object()
+            elif char == "{":
+                if self._held is not None:
+                    ready.append(StreamedOrder(self._held, last=False))
+                    self._held = None
+                self._start_object()
+            elif char == ",":
+                if self._held is not None:
+                    ready.append(StreamedOrder(self._held, last=False))
+                    self._held = None
+            elif char == "]":
+                self.done = True
+                if self._held is not None:
+                    ready.append(StreamedOrder(self._held, last=True))
+                    self._held = None
+        return ready
+
+    def finish(self) -> List[StreamedOrder]:
+        """The held back order at the end of the completion"""
+        if self._held is None:
+            return []
+        held, self._held = self._held, None
+        return [StreamedOrder(held, last=True)]
+
+    def _start_object(self):
+        self._object = ["{"]
+        self._depth = 1
+
+    def _read_object(self, char: str, ready: List[StreamedOrder]):
+        self._object.append(char)
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif char == "\\":
+                self._escape = True
+            elif char == '"':
+                self._in_string = False
+            return
+        if char == '"':
+            self._in_string = True
+        elif char in "{[":
+            self._depth += 1
+        elif char in "}]":
+            self._depth -= 1
+            if self._depth == 0:
+                self._complete("".join(self._object), ready)
+                self._object = []
+
+    def _complete(self, text: str, ready: List[StreamedOrder]):
+        try:
+            order = json.loads(text)
+        except json.JSONDecodeError:
+            order = None
+        if not isinstance(order, dict):
+            self.errors += 1
+            logger.warning(f"Streamed order is not a valid JSON object: {text}")
+            return
+        if self._top == "{":
+            self.done = True
+            ready.append(StreamedOrder(order, last=True))
+        else:
+            self._held = order
@@ -2,6 +2,22 @@
 
 from .handlers import setup_handlers
 from .states import RegistrationStates, OrderStates
+from .outbound import OutboundScheduler, get_outbound_scheduler, notify_many, send_to_many
+from .middlewares import FSMScopeMiddleware, RequestMetricsMiddleware, UserMiddleware
+from .aggregation import OrderAggregator, get_order_aggregator
 
-__all__ = ["setup_handlers", "RegistrationStates", "OrderStates"]
+__all__ = [
+    "setup_handlers",
+    "RegistrationStates",
+    "OrderStates",
+    "OutboundScheduler",
+    "get_outbound_scheduler",
+    "send_to_many",
+    "notify_many",
+    "RequestMetricsMiddleware",
+    "UserMiddleware",
+    "FSMScopeMiddleware",
+    "OrderAggregator",
+    "get_order_aggregator",
+]
 
@@ -0,0 +1,223 @@
+"""Per-chat aggregation of order messages sent in quick succession"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from src.ai_service import get_order_parser
+from src.config import get_settings
+from src.metrics import Counter, Histogram
+from src.updates import get_scheduler
+
+logger = logging.getLogger(__name__)
+
+ORDER_AGGREGATION_FLUSHES = Counter(
+    "order_aggregation_flushes_total",
+    "Order parses of aggregated messages by flush reason (complete, window, max_wait, shutdown)",
+    ["reason"],
+)
+ORDER_AGGREGATION_SAVED = Counter(
+    "order_aggregation_parses_saved_total",
+    "Order messages parsed together with the previous ones instead of on their own",
+)
+ORDER_AGGREGATION_DELAY = Histogram(
+    "order_aggregation_delay_seconds",
+    "Time from the last message of a window to its parse, by flush reason",
+    ["reason"],
+)
+
+Flush = Callable[[str], Awaitable[Any]]
+# (text, user id) -> whether the text is a whole order
+Completeness = Callable[[str, Optional[int]], Awaitable[bool]]
+
+
+@dataclass
+class _Window:
+    """Messages of a chat waiting for the rest of the order"""
+    texts: List[str]
+    flush: Flush
+    first_at: float
+    last_at: float
+    task: Optional[asyncio.Task] = None
+
+
+class OrderAggregator:
+    """
+    Debounce window in front of order parsing, per chat.
+
+    Customers often split an order over quick messages: address in one,
+    products in the next. A message that doesn't make a complete order
+    (see OrderParser.looks_complete) waits up to `window` seconds for the
+    next one, but no longer than `max_wait` since the first; then the
+    messages are parsed together once, in the chat's scheduler lane. A
+    message that completes the order is parsed right away with the
+    messages before it, so a single complete message is never delayed.
+    """
+
+    def __init__(self, is_complete: Completeness, window: float = 2.0, max_wait: float = 10.0,
+                 enabled: bool = True):
+        self.is_complete = is_complete
+        self.window = window
+        self.max_wait = max_wait
+        self.enabled = enabled
+        self._windows: Dict[int, _Window] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+        # Stats
+        self.messages = 0
+        self.parses_saved = 0
+        self.flushes: Dict[str, int] = {}
+        self._delay_total = 0.0
+
+    async def submit(self, key: int, text: str, flush: Flush, user_id: Optional[int] = None) -> Optional[str]:
+        """
+        Add an order message of the chat; called in the chat's lane
+
+        Args:
+            user_id: Sender, their known addresses count as the address
+
+        Returns:
+            Text of the window's messages to parse now, or None if the
+            message waits for more: flush(text) is then called in the
+            chat's lane when the window closes
+        """
+        self.messages += 1
+        if not self.enabled:
+            return text
+
+        window = self._windows.get(key)
+        texts = (window.texts if window else []) + [text]
+        merged = "\n".join(texts)
+        if await self.is_complete(merged, user_id):
+            if window is not None:
+                del self._windows[key]
+                window.task.cancel()
+            self._flushed("complete", texts, 0.0)
+            return merged
+
+        now = time.monotonic()
+        if window is None:
+            window = _Window(texts=texts, flush=flush, first_at=now, last_at=now)
+            self._windows[key] = window
+            window.task = asyncio.create_task(self._wait(key, window))
+            self._tasks.add(window.task)
+            window.task.add_done_callback(self._tasks.discard)
+        else:
+            window.texts = texts
+            window.flush = flush
+            window.last_at = now
+        return None
+
+    def _deadline(self, window: _Window) -> float:
+        return min(window.last_at + self.window, window.first_at + self.max_wait)
+
+    async def _wait(self, key: int, window: _Window):
+        """Flush the window when it closes"""
+        while True:
+            delay = self._deadline(window) - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            # A message may extend the window while the flush waits for the lane
+            if await self._run_in_lane(key, lambda: self._flush(key, window, force=False)):
+                return
+
+    async def _flush(self, key: int, window: _Window, force: bool) -> bool:
+        """Parse the window's messages unless it got extended; False if it did"""
+        if self._windows.get(key) is not window:
+            # Taken by a message that completed the order
+            return True
+        now = time.monotonic()
+        if not force and self._deadline(window) > now:
+            return False
+        del self._windows[key]
+        if force:
+            reason = "shutdown"
+        else:
+            reason = "max_wait" if window.first_at + self.max_wait <= window.last_at + self.window else "window"
+        self._flushed(reason, window.texts, now - window.last_at)
+        try:
+            await window.flush("\n".join(window.texts))
+        except Exception as e:
+            logger.error(f"Failed to process aggregated order messages: {e}", exc_info=True)
+        return True
+
+    @staticmethod
+    async def _run_in_lane(key: int, func: Callable[[], Awaitable[bool]]) -> bool:
+        scheduler = get_scheduler()
+        if scheduler is None:
+            return await func()
+        return await scheduler.run(key, func)
+
+    def _flushed(self, reason: str, texts: List[str], delay: float):
+        saved = len(texts) - 1
+        ORDER_AGGREGATION_FLUSHES.labels(reason=reason).inc()
+        ORDER_AGGREGATION_DELAY.labels(reason=reason).observe(delay)
+        if saved:
+            ORDER_AGGREGATION_SAVED.inc(saved)
+        self.parses_saved += saved
+        self.flushes[reason] = self.flushes.get(reason, 0) + 1
+        self._delay_total += delay
+
+    async def drain(self, timeout: float) -> int:
+        """
+        Parse all waiting messages now (on shutdown); parses still running
+        at the deadline are cancelled
+
+        Returns:
+            Number of windows not processed by the deadline
+        """
+        drains: Dict[asyncio.Task, int] = {}
+        for key, window in list(self._windows.items()):
+            window.task.cancel()
+            task = asyncio.create_task(
+                self._run_in_lane(key, lambda key=key, window=window: self._flush(key, window, force=True))
+            )
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            drains[task] = key
+        if not drains:
+            return 0
+        _, pending = await asyncio.wait(list(drains), timeout=timeout)
+        if pending:
+            logger.warning(
+                f"Abandoning aggregated order messages of chats "
+                f"{sorted(drains[task] for task in pending)}: not processed in {timeout}s"
+            )
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        return len(pending)
+
+    def stats(self) -> Dict[str, Any]:
+        """Aggregation statistics"""
+        flushes = sum(self.flushes.values())
+        stats = {
+            "enabled": int(self.enabled),
+            "pending": len(self._windows),
+            "messages": self.messages,
+            "parses_saved": self.parses_saved,
+            "delay_avg_seconds": round(self._delay_total / flushes, 4) if flushes else 0.0,
+        }
+        for reason in ("complete", "window", "max_wait", "shutdown"):
+            stats[f"flushes_{reason}"] = self.flushes.get(reason, 0)
+        return stats
+
+
+# Global aggregator instance
+_aggregator: Optional[OrderAggregator] = None
+
+
+def get_order_aggregator() -> OrderAggregator:
+    """Get order message aggregator instance (singleton)"""
+    global _aggregator
+    if _aggregator is None:
+        settings = get_settings().order_aggregation
+        _aggregator = OrderAggregator(
+            get_order_parser().looks_complete,
+            window=settings.window,
+            max_wait=settings.max_wait,
+            enabled=settings.enabled,
+        )
+    return _aggregator
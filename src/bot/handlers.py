@@ -1,11 +1,15 @@
 """Bot handlers"""
 import logging
+import time
+from typing import Optional
 from aiogram import Bot, Dispatcher, Router, F
 from aiogram.types import Message, CallbackQuery
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 
 from .states import RegistrationStates, OrderStates
+from .outbound import notify_many
+from .aggregation import get_order_aggregator
 from .keyboards import (
     get_confirm_order_keyboard,
     get_user_approval_keyboard,
@@ -22,6 +26,9 @@ from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+# Min seconds between edits of the message showing orders as they are parsed
+PROGRESS_EDIT_INTERVAL = 1.0
+
 
 def setup_handlers(router: Router, bot: Bot, dp: Dispatcher):
     """Setup all bot handlers"""
@@ -32,14 +39,12 @@ def setup_handlers(router: Router, bot: Bot, dp: Dispatcher):
     bot_instance = bot
     
     @router.message(Command("start"))
-    async def cmd_start(message: Message, state: FSMContext):
+    async def cmd_start(message: Message, state: FSMContext, user: Optional[User]):
         """Handle /start command - user registration"""
         user_id = message.from_user.id
         logger.info(f"User {user_id} started bot")
         
-        # Check if user exists in database
-        user = await User.get_by_id(user_id)
-        
+        # User is loaded by UserMiddleware
         if user:
             if user.approved:
                 await message.answer(start_2)
@@ -71,19 +76,16 @@ def setup_handlers(router: Router, bot: Bot, dp: Dispatcher):
         # Send approval request to admin
         keyboard = get_user_approval_keyboard(user_id)
         
-        for admin_id in admin_ids:
-            try:
-                await bot_instance.send_message(
-                    admin_id,
-                    f"🔔 Новый пользователь хочет зарегистрироваться:\n"
-                    f"ID: {user_id}\n"
-                    f"Имя: {message.from_user.first_name or 'Не указано'}\n"
-                    f"Username: @{message.from_user.username or 'Не указано'}\n"
-                    f"Организация: {message.text}",
-                    reply_markup=keyboard
-                )
-            except Exception as e:
-                logger.error(f"Failed to send message to admin {admin_id}: {e}")
+        notify_many(
+            bot_instance,
+            admin_ids,
+            f"🔔 Новый пользователь хочет зарегистрироваться:\n"
+            f"ID: {user_id}\n"
+            f"Имя: {message.from_user.first_name or 'Не указано'}\n"
+            f"Username: @{message.from_user.username or 'Не указано'}\n"
+            f"Организация: {message.text}",
+            reply_markup=keyboard
+        )
         
         await message.answer("Спасибо! Ваша заявка отправлена администратору на подтверждение.")
         await state.clear()
@@ -96,16 +98,13 @@ def setup_handlers(router: Router, bot: Bot, dp: Dispatcher):
             return
         
         user_id = int(callback.data.split(":")[1])
-        user = await User.get_by_id(user_id)
+        user = await User.get_cached(user_id)
         
         if user:
             await user.update_approval(True)
             
             # Notify user
-            try:
-                await bot_instance.send_message(user_id, start_2)
-            except Exception as e:
-                logger.error(f"Failed to notify user {user_id}: {e}")
+            notify_many(bot_instance, [user_id], start_2)
             
             # Update admin message
             await callback.message.edit_text(
@@ -125,7 +124,7 @@ def setup_handlers(router: Router, bot: Bot, dp: Dispatcher):
             return
         
         user_id = int(callback.data.split(":")[1])
-        user = await User.get_by_id(user_id)
+        user = await User.get_cached(user_id)
         
         if user:
             # Delete user (or mark as rejected)
@@ -133,10 +132,7 @@ def setup_handlers(router: Router, bot: Bot, dp: Dispatcher):
             await user.update_approval(False)
             
             # Notify user
-            try:
-                await bot_instance.send_message(user_id, "❌ Ваша регистрация отклонена администратором.")
-            except Exception as e:
-                logger.error(f"Failed to notify user {user_id}: {e}")
+            notify_many(bot_instance, [user_id], "❌ Ваша регистрация отклонена администратором.")
             
             # Update admin message
             await callback.message.edit_text(
@@ -149,12 +145,9 @@ def setup_handlers(router: Router, bot: Bot, dp: Dispatcher):
             await callback.answer("Пользователь не найден!", show_alert=True)
 
     @router.message(F.text)
-    async def handle_message(message: Message, state: FSMContext):
+    async def handle_message(message: Message, state: FSMContext, user: Optional[User]):
         """Handle all text messages"""
-        user_id = message.from_user.id
-        
-        # Check registration
-        user = await User.get_by_id(user_id)
+        # Check registration (user is loaded by UserMiddleware)
         if not user or not user.approved:
             await message.answer(start_0)
             return
@@ -169,16 +162,39 @@ def setup_handlers(router: Router, bot: Bot, dp: Dispatcher):
             await handle_updated_order(message, state, user)
 
     async def handle_new_order(message: Message, state: FSMContext, user: User):
-        """Handle new order"""
+        """Handle new order: quick messages of one order are parsed together"""
+        text = await get_order_aggregator().submit(
+            message.chat.id,
+            message.text,
+            lambda merged: process_new_order(message, state, user, merged),
+            user_id=message.from_user.id
+        )
+        if text is not None:
+            await process_new_order(message, state, user, text)
+
+    async def process_new_order(message: Message, state: FSMContext, user: User, text: str):
+        """Parse order text (one or several messages) and ask to confirm it"""
         user_id = message.from_user.id
         
-        # Show processing message
+        # Show processing message, it shows the orders as they are parsed and becomes the order message
         processing_msg = await message.answer("🔄 Обрабатываю ваш заказ...")
+        order_message = None
         
         try:
             # Parse order with AI
             parser = get_order_parser()
-            orders_data = await parser.parse_order(message.text)
+            orders_data = []
+            last_edit = 0.0
+            async for streamed in parser.parse_order_stream(text, user_id=user_id):
+                orders_data.append(streamed.order)
+                if streamed.last or time.monotonic() - last_edit < PROGRESS_EDIT_INTERVAL:
+                    continue
+                last_edit = time.monotonic()
+                try:
+                    progress_text = await format_order_response(orders_data)
+                    await processing_msg.edit_text(progress_text + "\n🔄 Обрабатываю остальные адреса...")
+                except Exception as e:
+                    logger.warning(f"Failed to show order progress: {e}")
             
             logger.info(f"Parsed order for user {user_id}: {orders_data}")
             
@@ -188,8 +204,8 @@ def setup_handlers(router: Router, bot: Bot, dp: Dispatcher):
             response_text += "\n✅ Если все верно - подтвердите заказ кнопкой ниже.\n"
             response_text += "❌ Если есть ошибки - отправьте исправленный текст заказа."
             
-            # Send order message with confirmation button
-            order_message = await message.answer(
+            # Turn processing message into order message with confirmation button
+            order_message = await processing_msg.edit_text(
                 response_text,
                 reply_markup=get_confirm_order_keyboard()
             )
@@ -198,7 +214,7 @@ def setup_handlers(router: Router, bot: Bot, dp: Dispatcher):
             await state.update_data(
                 order_message_id=order_message.message_id,
                 order_data=orders_data,
-                user_message=message.text
+                user_message=text
             )
             
             await state.set_state(OrderStates.waiting_for_confirmation)
@@ -207,10 +223,11 @@ def setup_handlers(router: Router, bot: Bot, dp: Dispatcher):
             logger.error(f"Error processing order: {e}", exc_info=True)
             await message.answer("❌ Произошла ошибка при обработке заказа. Попробуйте еще раз.")
         finally:
-            try:
-                await processing_msg.delete()
-            except:
-                pass
+            if order_message is None:
+                try:
+                    await processing_msg.delete()
+                except:
+                    pass
 
     async def handle_updated_order(message: Message, state: FSMContext, user: User):
         """Handle updated order (when user sends correction)"""
@@ -236,9 +253,15 @@ def setup_handlers(router: Router, bot: Bot, dp: Dispatcher):
                 except Exception as e:
                     logger.warning(f"Failed to update previous message: {e}")
             
-            # Parse new order
+            # Patch the parsed order with the correction (or parse it anew)
             parser = get_order_parser()
-            orders_data = await parser.parse_order(message.text)
+            previous_message = current_data.get('user_message')
+            orders_data = await parser.parse_correction(
+                message.text,
+                current_data.get('order_data'),
+                user_message=previous_message,
+                user_id=user_id
+            )
             
             # Format response
             response_text = await format_order_response(orders_data)
@@ -249,11 +272,11 @@ def setup_handlers(router: Router, bot: Bot, dp: Dispatcher):
                 reply_markup=get_confirm_order_keyboard()
             )
             
-            # Update state
+            # Update state, the next correction gets all messages of the order as context
             await state.update_data(
                 order_message_id=order_message.message_id,
                 order_data=orders_data,
-                user_message=message.text
+                user_message=f"{previous_message}\n{message.text}" if previous_message else message.text
             )
             
             await state.set_state(OrderStates.waiting_for_confirmation)
@@ -268,7 +291,7 @@ def setup_handlers(router: Router, bot: Bot, dp: Dispatcher):
                 pass
 
     @router.callback_query(OrderStates.waiting_for_confirmation, F.data == "confirm_order")
-    async def confirm_user_order(callback: CallbackQuery, state: FSMContext):
+    async def confirm_user_order(callback: CallbackQuery, state: FSMContext, user: Optional[User]):
         """Handle order confirmation by user"""
         user_id = callback.from_user.id
         
@@ -276,7 +299,6 @@ def setup_handlers(router: Router, bot: Bot, dp: Dispatcher):
             # Get order data from state
             current_data = await state.get_data()
             order_data = current_data.get('order_data')
-            order_message_id = current_data.get('order_message_id')
             
             if not order_data:
                 await callback.answer("❌ Данные заказа не найдены", show_alert=True)
@@ -291,8 +313,6 @@ def setup_handlers(router: Router, bot: Bot, dp: Dispatcher):
             )
             await order.save()
 
-            user = await User.get_by_id(user_id)
-
             # If user is admin, confirm immediately without additional approval
             if user_id in admin_ids:
                 await _confirm_order_as_admin(order, order_data, user)
@@ -322,17 +342,14 @@ def setup_handlers(router: Router, bot: Bot, dp: Dispatcher):
                 user.user_info if user else "Неизвестно"
             )
             # Send to all admins
-            admin_keyboard = get_admin_confirm_order_keyboard(user_id, order_message_id)
+            admin_keyboard = get_admin_confirm_order_keyboard(order.order_id)
             
-            for admin_id in admin_ids:
-                try:
-                    await bot_instance.send_message(
-                        admin_id,
-                        admin_message_text,
-                        reply_markup=admin_keyboard
-                    )
-                except Exception as e:
-                    logger.error(f"Failed to send order to admin {admin_id}: {e}")
+            notify_many(
+                bot_instance,
+                admin_ids,
+                admin_message_text,
+                reply_markup=admin_keyboard
+            )
             
             # Update user message
             await callback.message.edit_text(
@@ -352,7 +369,7 @@ def setup_handlers(router: Router, bot: Bot, dp: Dispatcher):
             await callback.message.answer("❌ Произошла ошибка при отправке заказа. Попробуйте еще раз.")
             await callback.answer()
 
-    @router.callback_query(F.data.startswith("admin_confirm:"))
+    @router.callback_query(F.data.startswith("admin_order:"))
     async def confirm_admin_order(callback: CallbackQuery, state: FSMContext):
         """Handle order confirmation by admin"""
         if callback.from_user.id not in admin_ids:
@@ -360,80 +377,75 @@ def setup_handlers(router: Router, bot: Bot, dp: Dispatcher):
             return
         
         try:
-            # Parse callback data
-            _, user_id_str, order_message_id_str = callback.data.split(":")
-            user_id = int(user_id_str)
-            order_message_id = int(order_message_id_str)
-            
-            # Get user and order data
-            user = await User.get_by_id(user_id)
-            if not user:
-                await callback.answer("Пользователь не найден", show_alert=True)
-                return
-            
-            # Get order from database (we need to find it by user_id and order_message_id)
-            # For now, we'll extract order_data from the message text or state
-            # In a real implementation, you might want to store order_id in callback data
-            
-            logger.info(f"Order confirmed by admin. User ID: {user_id}, Order Message ID: {order_message_id}")
-            
-            # Try to get order data from database
-            # We'll search for the most recent order from this user with pending_admin status
-            from src.database.connection import get_database
-            db = get_database()
-            orders = await db.execute_query(
-                "SELECT * FROM orders WHERE user_id = %s AND status = 'pending_admin' ORDER BY created_at DESC LIMIT 1",
-                (user_id,)
-            )
-            if not orders:
-                await callback.answer("Заказ не найден или уже подтвержден", show_alert=True)
-                return
-            
-            import json
-            order_row = orders[0]
-            order_data = json.loads(order_row['order_data'])
-            order = OrderModel(
-                order_id=order_row['order_id'],
-                user_id=user_id,
-                order_data=order_data,
-                status=order_row['status'],
-                created_at=order_row.get('created_at')
-            )
-            
-            # Common admin confirmation logic
-            await _confirm_order_as_admin(order, order_data, user)
-            
-            # Update admin message
-            await callback.message.edit_text(
-                f"✅ ЗАКАЗ ПОДТВЕРЖДЕН АДМИНОМ\n\n{callback.message.text}",
-                reply_markup=None
-            )
-            
-            # Notify user
-            try:
-                await bot_instance.send_message(
-                    user_id,
-                    "🎉 Ваш заказ подтвержден администратором!"
-                )
-                await state.set_state(OrderStates.waiting_for_order)
-            except Exception as e:
-                logger.error(f"Failed to notify user {user_id}: {e}")
-            
-            await callback.answer("Заказ подтвержден!")
-            
+            order_id = int(callback.data.split(":")[1])
+            order = await OrderModel.get_by_id(order_id)
+            await _handle_admin_confirmation(callback, state, order)
         except Exception as e:
             logger.error(f"Error confirming order by admin: {e}", exc_info=True)
             await callback.answer("❌ Ошибка при подтверждении заказа", show_alert=True)
 
-
-    async def _confirm_order_as_admin(order: OrderModel, order_data, user: User):
-        """Common logic for admin confirmation: update status and write to Google Sheets"""
-        user_id = user.user_id if user else order.user_id
+    @router.callback_query(F.data.startswith("admin_confirm:"))
+    async def confirm_admin_order_legacy(callback: CallbackQuery, state: FSMContext):
+        """
+        Handle admin confirmation buttons sent before callbacks carried order_id
+        (admin_confirm:<user_id>:<order_message_id>), the latest pending order of the user is confirmed
+        """
+        if callback.from_user.id not in admin_ids:
+            await callback.answer("У вас нет прав для этого действия", show_alert=True)
+            return
         
         try:
-            await order.update_status('confirmed')
+            _, user_id_str, _ = callback.data.split(":")
+            order = await OrderModel.get_latest_pending(int(user_id_str))
+            await _handle_admin_confirmation(callback, state, order)
         except Exception as e:
-            logger.error(f"Failed to update order status for user {user_id}: {e}")
+            logger.error(f"Error confirming order by admin: {e}", exc_info=True)
+            await callback.answer("❌ Ошибка при подтверждении заказа", show_alert=True)
+
+    async def _handle_admin_confirmation(callback: CallbackQuery, state: FSMContext, order: OrderModel):
+        """Confirm order from admin callback and notify the customer"""
+        if not order or order.status != 'pending_admin':
+            await callback.answer("Заказ не найден или уже подтвержден", show_alert=True)
+            return
+        
+        user_id = order.user_id
+        user = await User.get_cached(user_id)
+        if not user:
+            await callback.answer("Пользователь не найден", show_alert=True)
+            return
+        
+        logger.info(f"Order {order.order_id} confirmed by admin. User ID: {user_id}")
+        
+        # Common admin confirmation logic, a repeated click finds the order already confirmed
+        if not await _confirm_order_as_admin(order, order.order_data, user):
+            await callback.answer("Заказ уже подтвержден", show_alert=True)
+            return
+
+        # Notify user first: the admin chat's rate limit may delay the edit
+        notify_many(bot_instance, [user_id], "🎉 Ваш заказ подтвержден администратором!")
+        await state.set_state(OrderStates.waiting_for_order)
+
+        # Update admin message
+        await callback.message.edit_text(
+            f"✅ ЗАКАЗ ПОДТВЕРЖДЕН АДМИНОМ\n\n{callback.message.text}",
+            reply_markup=None
+        )
+
+        await callback.answer("Заказ подтвержден!")
+
+
+    async def _confirm_order_as_admin(order: OrderModel, order_data, user: User) -> bool:
+        """
+        Common logic for admin confirmation: update status and write to Google Sheets
+
+        Returns:
+            False if the order was already confirmed (nothing is written again)
+        """
+        user_id = user.user_id if user else order.user_id
+        
+        if not await order.transition_status('pending_admin', 'confirmed'):
+            logger.info(f"Order {order.order_id} of user {user_id} is already {order.status}")
+            return False
         
         try:
             sheets_service = get_google_sheets_service()
@@ -454,3 +466,4 @@ def setup_handlers(router: Router, bot: Bot, dp: Dispatcher):
             )
         except Exception as e:
             logger.error(f"Error writing confirmed order to Google Sheets for user {user_id}: {e}", exc_info=True)
+        return True
@@ -23,11 +23,11 @@ def get_user_approval_keyboard(user_id: int) -> InlineKeyboardMarkup:
     )
 
 
-def get_admin_confirm_order_keyboard(user_id: int, order_message_id: int) -> InlineKeyboardMarkup:
+def get_admin_confirm_order_keyboard(order_id: int) -> InlineKeyboardMarkup:
     """Get keyboard for admin order confirmation"""
     return InlineKeyboardMarkup(
         inline_keyboard=[[
-            InlineKeyboardButton(text="✅ Подтвердить заказ", callback_data=f"admin_confirm:{user_id}:{order_message_id}")
+            InlineKeyboardButton(text="✅ Подтвердить заказ", callback_data=f"admin_order:{order_id}")
         ]]
     )
 
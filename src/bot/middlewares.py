@@ -0,0 +1,91 @@
+"""Bot middlewares"""
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+from aiogram.types import TelegramObject
+
+from src.database import MySQLStorage, User
+from src.database.connection import current_user_id
+from src.metrics import Histogram
+
+TELEGRAM_API_LATENCY = Histogram(
+    "telegram_api_seconds",
+    "Telegram Bot API request latency",
+    ["method", "result"],
+)
+
+
+class RequestMetricsMiddleware(BaseRequestMiddleware):
+    """Session middleware measuring Telegram Bot API calls"""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        started_at = time.perf_counter()
+        result = "ok"
+        try:
+            return await make_request(bot, method)
+        except Exception:
+            result = "error"
+            raise
+        finally:
+            TELEGRAM_API_LATENCY.labels(
+                method=type(method).__name__,
+                result=result,
+            ).observe(time.perf_counter() - started_at)
+
+
+class UserMiddleware(BaseMiddleware):
+    """
+    Update middleware loading the sender from the user cache once per
+    update and passing it to handlers as `user` (None if not registered).
+
+    Also marks the sender as the current database user, so their reads
+    after their own writes are served by the primary.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        from_user = data.get("event_from_user")
+        if not from_user:
+            data["user"] = None
+            return await handler(event, data)
+
+        # Workers handle many updates in one task, so the user is reset after each
+        token = current_user_id.set(from_user.id)
+        try:
+            data["user"] = await User.get_cached(from_user.id)
+            return await handler(event, data)
+        finally:
+            current_user_id.reset(token)
+
+
+class FSMScopeMiddleware(BaseMiddleware):
+    """
+    Update middleware limiting the MySQL FSM storage cache to the update:
+    the next update of the chat reads the state again, as another replica
+    may have changed it in between.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        state = data.get("state")
+        if state is None or not isinstance(state.storage, MySQLStorage):
+            return await handler(event, data)
+        with state.storage.scope(state.key):
+            return await handler(event, data)
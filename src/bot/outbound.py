@@ -0,0 +1,233 @@
+"""Outbound Telegram request scheduler with rate limits"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Dict, Iterable, List, Optional, Set
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import (
+    CopyMessage,
+    EditMessageCaption,
+    EditMessageReplyMarkup,
+    EditMessageText,
+    ForwardMessage,
+    SendDocument,
+    SendMediaGroup,
+    SendMessage,
+    SendPhoto,
+    TelegramMethod,
+)
+from aiogram.methods.base import Response, TelegramType
+
+from src.config import get_settings
+from src.updates import get_scheduler
+from src.utils.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Methods counted by Telegram flood limits
+RATE_LIMITED_METHODS = (
+    SendMessage,
+    EditMessageText,
+    EditMessageReplyMarkup,
+    EditMessageCaption,
+    SendPhoto,
+    SendDocument,
+    SendMediaGroup,
+    CopyMessage,
+    ForwardMessage,
+)
+
+
+class OutboundScheduler(BaseRequestMiddleware):
+    """
+    Session middleware every Bot API request goes through.
+
+    Sends and edits wait for a token of the global bucket (30 msg/s by
+    default) and of the per-chat bucket (1 msg/s with a small burst), and
+    are retried after `retry_after` when Telegram answers 429 anyway.
+    This covers message.answer(), callback.message.edit_text() and
+    bot.send_message() alike. While waiting, the request gives the update
+    scheduler's concurrency slot of its handler to other chats.
+
+    Messages to other chats than the one being handled (admin
+    notifications) go through notify(): they are sent in the background,
+    so the handler's lane doesn't wait for the rate limits of those chats.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 30.0,
+        chat_rate: float = 1.0,
+        chat_burst: float = 3.0,
+        max_retries: int = 3,
+    ):
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chat_rate = chat_rate
+        self._chat_burst = chat_burst
+        self._chats: Dict[Any, TokenBucket] = {}
+        self.max_retries = max_retries
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._notifications: Set[asyncio.Task] = set()
+
+        # Stats
+        self.in_flight = 0
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self._waits = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _chat_bucket(self, chat_id: Any) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) > 10000:
+                # Forget chats which buckets have refilled completely
+                self._chats = {key: value for key, value in self._chats.items() if not value.idle}
+            bucket = self._chats[chat_id] = TokenBucket(self._chat_rate, self._chat_burst)
+        return bucket
+
+    async def _wait_for_slot(self, chat_id: Any) -> float:
+        """Wait for chat and global tokens, returns queue latency"""
+        started_at = time.monotonic()
+        if chat_id is not None:
+            await self._sleep(self._chat_bucket(chat_id).reserve())
+        await self._sleep(self._global.reserve())
+        waited = time.monotonic() - started_at
+        self._waits += 1
+        self._wait_total += waited
+        self._wait_max = max(self._wait_max, waited)
+        return waited
+
+    @staticmethod
+    async def _sleep(delay: float):
+        """Sleep without holding the handler's concurrency slot"""
+        if delay <= 0:
+            return
+        scheduler = get_scheduler()
+        if scheduler is None:
+            await asyncio.sleep(delay)
+            return
+        async with scheduler.slot_released():
+            await asyncio.sleep(delay)
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        if not isinstance(method, RATE_LIMITED_METHODS):
+            return await make_request(bot, method)
+
+        chat_id = getattr(method, "chat_id", None)
+        self.in_flight += 1
+        self._idle.clear()
+        try:
+            attempt = 0
+            while True:
+                await self._wait_for_slot(chat_id)
+                try:
+                    response = await make_request(bot, method)
+                    self.sent += 1
+                    return response
+                except TelegramRetryAfter as e:
+                    attempt += 1
+                    if attempt > self.max_retries:
+                        self.failed += 1
+                        raise
+                    self.retried += 1
+                    logger.warning(
+                        f"Flood control on {type(method).__name__} in chat {chat_id}, "
+                        f"retry {attempt} in {e.retry_after}s"
+                    )
+                    await self._sleep(e.retry_after)
+        finally:
+            self.in_flight -= 1
+            if not self.in_flight:
+                self._idle.set()
+
+    def notify(self, coro: Awaitable[Any]) -> "asyncio.Task[Any]":
+        """Send in the background, without waiting for rate limits (see wait_idle())"""
+        task = asyncio.ensure_future(coro)
+        self._notifications.add(task)
+        task.add_done_callback(self._notifications.discard)
+        return task
+
+    async def wait_idle(self, timeout: float) -> int:
+        """
+        Wait for pending outbound requests and background notifications
+
+        Returns:
+            Number of requests still pending at the deadline
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        if self._notifications:
+            await asyncio.wait(list(self._notifications), timeout=timeout)
+        try:
+            await asyncio.wait_for(self._idle.wait(), max(0.0, deadline - loop.time()))
+        except asyncio.TimeoutError:
+            pass
+        return self.in_flight
+
+    def stats(self) -> Dict[str, Any]:
+        """Outbound statistics"""
+        return {
+            "in_flight": self.in_flight,
+            "notifications": len(self._notifications),
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed,
+            "chats": len(self._chats),
+            "queue_latency_avg_seconds": round(self._wait_total / self._waits, 4) if self._waits else 0.0,
+            "queue_latency_max_seconds": round(self._wait_max, 4),
+        }
+
+
+async def send_to_many(bot: Bot, chat_ids: Iterable[int], text: str, **kwargs) -> List[Optional[Any]]:
+    """
+    Send the same message to several chats concurrently
+
+    Failures are logged and returned as None in place of the sent message
+    """
+    chat_ids = list(chat_ids)
+    results = await asyncio.gather(
+        *(bot.send_message(chat_id, text, **kwargs) for chat_id in chat_ids),
+        return_exceptions=True,
+    )
+    sent = []
+    for chat_id, result in zip(chat_ids, results):
+        if isinstance(result, Exception):
+            logger.error(f"Failed to send message to {chat_id}: {result}")
+            sent.append(None)
+        else:
+            sent.append(result)
+    return sent
+
+
+def notify_many(bot: Bot, chat_ids: Iterable[int], text: str, **kwargs) -> "asyncio.Task[List[Optional[Any]]]":
+    """send_to_many() in the background, for messages to chats other than the handled one"""
+    return get_outbound_scheduler().notify(send_to_many(bot, chat_ids, text, **kwargs))
+
+
+# Global scheduler instance
+_outbound: Optional[OutboundScheduler] = None
+
+
+def get_outbound_scheduler() -> OutboundScheduler:
+    """Get outbound scheduler instance (singleton)"""
+    global _outbound
+    if _outbound is None:
+        settings = get_settings().outbound
+        _outbound = OutboundScheduler(
+            global_rate=settings.global_rate,
+            chat_rate=settings.chat_rate,
+            chat_burst=settings.chat_burst,
+            max_retries=settings.max_retries,
+        )
+    return _outbound
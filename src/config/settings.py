@@ -1,6 +1,6 @@
 """Application settings and configuration"""
 import os
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import List, Optional
 from dotenv import load_dotenv
 
@@ -18,6 +18,10 @@ class DatabaseConfig:
     password: str
     pool_min_size: int = 5
     pool_max_size: int = 20
+    replica_dsn: Optional[str] = None
+    replica_max_lag: float = 2.0
+    replica_sticky_seconds: float = 5.0
+    replica_check_interval: float = 5.0
 
 
 @dataclass
@@ -25,6 +29,7 @@ class BotConfig:
     """Bot configuration"""
     token: str
     admin_ids: List[int]
+    api_url: Optional[str] = None
 
 
 @dataclass
@@ -33,6 +38,13 @@ class AIConfig:
     api_key: str
     model: str = "gpt-4o-mini"
     max_tokens: int = 900
+    base_url: Optional[str] = None
+    max_concurrency: int = 8
+    requests_per_minute: float = 500.0
+    tokens_per_minute: float = 200000.0
+    request_timeout: float = 20.0
+    max_attempts: int = 3
+    stream: bool = True
 
 
 @dataclass
@@ -52,6 +64,111 @@ class WebhookConfig:
     certificate_path: Optional[str] = None
 
 
+@dataclass
+class UpdateQueueConfig:
+    """Incoming update queue configuration"""
+    max_size: int = 1000
+    workers: int = 32
+    max_concurrency: int = 16
+    polling_timeout: int = 30
+    drain_timeout: float = 20.0
+
+
+@dataclass
+class DedupConfig:
+    """Update de-duplication configuration"""
+    ttl: int = 3600
+    max_size: int = 100000
+    backend: str = "memory"
+
+
+@dataclass
+class FSMConfig:
+    """FSM storage configuration"""
+    storage: str = "memory"
+    cache_ttl: float = 5.0
+    flush_interval: float = 0.1
+    state_ttl: int = 604800
+
+
+@dataclass
+class OutboundConfig:
+    """Outbound Telegram requests rate limits"""
+    global_rate: float = 30.0
+    chat_rate: float = 1.0
+    chat_burst: float = 3.0
+    max_retries: int = 3
+
+
+@dataclass
+class UserCacheConfig:
+    """User cache configuration"""
+    ttl: float = 30.0
+    max_size: int = 10000
+
+
+@dataclass
+class AssortmentConfig:
+    """Assortment snapshot configuration"""
+    refresh_interval: float = 60.0
+
+
+@dataclass
+class LocalParserConfig:
+    """Rule-based order parser configuration"""
+    enabled: bool = True
+    min_score: float = 0.85
+    shadow_rate: float = 0.05
+
+
+@dataclass
+class ParseCacheConfig:
+    """Order parse cache configuration"""
+    enabled: bool = True
+    ttl: int = 86400
+    max_size: int = 5000
+    backend: str = "memory"
+
+
+@dataclass
+class CatalogPruningConfig:
+    """Candidate products in the AI prompt configuration"""
+    enabled: bool = True
+    top_k: int = 30
+    min_score: float = 0.6
+    frequent_items: int = 10
+    min_catalog_size: int = 100
+
+
+@dataclass
+class ModelRoutingConfig:
+    """Hedged and fallback OpenAI model routing configuration"""
+    fallback_model: Optional[str] = None
+    hedge_enabled: bool = True
+    hedge_model: Optional[str] = None
+    hedge_quantile: float = 0.95
+    hedge_min_delay: float = 1.0
+    hedge_max_delay: float = 8.0
+    degraded_error_rate: float = 0.5
+    degraded_latency: float = 8.0
+    degraded_cooldown: float = 30.0
+
+
+@dataclass
+class CorrectionConfig:
+    """Order corrections as patches of the parsed order"""
+    enabled: bool = True
+    max_tokens: int = 300
+
+
+@dataclass
+class OrderAggregationConfig:
+    """Per-chat window merging quick order messages into one parse"""
+    enabled: bool = True
+    window: float = 2.0
+    max_wait: float = 10.0
+
+
 @dataclass
 class Settings:
     """Application settings"""
@@ -60,6 +177,18 @@ class Settings:
     ai: AIConfig
     google_sheets: GoogleSheetsConfig
     webhook: Optional[WebhookConfig] = None
+    updates: UpdateQueueConfig = field(default_factory=UpdateQueueConfig)
+    dedup: DedupConfig = field(default_factory=DedupConfig)
+    fsm: FSMConfig = field(default_factory=FSMConfig)
+    outbound: OutboundConfig = field(default_factory=OutboundConfig)
+    user_cache: UserCacheConfig = field(default_factory=UserCacheConfig)
+    assortment: AssortmentConfig = field(default_factory=AssortmentConfig)
+    local_parser: LocalParserConfig = field(default_factory=LocalParserConfig)
+    parse_cache: ParseCacheConfig = field(default_factory=ParseCacheConfig)
+    catalog_pruning: CatalogPruningConfig = field(default_factory=CatalogPruningConfig)
+    model_routing: ModelRoutingConfig = field(default_factory=ModelRoutingConfig)
+    corrections: CorrectionConfig = field(default_factory=CorrectionConfig)
+    order_aggregation: OrderAggregationConfig = field(default_factory=OrderAggregationConfig)
 
     @classmethod
     def from_env(cls) -> "Settings":
@@ -73,6 +202,10 @@ class Settings:
             password=os.getenv("DB_PASSWORD", ""),
             pool_min_size=int(os.getenv("DB_POOL_MIN", "5")),
             pool_max_size=int(os.getenv("DB_POOL_MAX", "20")),
+            replica_dsn=os.getenv("DB_REPLICA_DSN", None),
+            replica_max_lag=float(os.getenv("DB_REPLICA_MAX_LAG", "2")),
+            replica_sticky_seconds=float(os.getenv("DB_REPLICA_STICKY_SECONDS", "5")),
+            replica_check_interval=float(os.getenv("DB_REPLICA_CHECK_INTERVAL", "5")),
         )
 
         # Bot config
@@ -82,6 +215,7 @@ class Settings:
         bot_config = BotConfig(
             token=os.getenv("BOT_TOKEN", ""),
             admin_ids=admin_ids,
+            api_url=os.getenv("BOT_API_URL", None),
         )
 
         # AI config
@@ -89,6 +223,13 @@ class Settings:
             api_key=os.getenv("OPENAI_API_KEY", ""),
             model=os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
             max_tokens=int(os.getenv("OPENAI_MAX_TOKENS", "900")),
+            base_url=os.getenv("OPENAI_BASE_URL", None),
+            max_concurrency=int(os.getenv("OPENAI_MAX_CONCURRENCY", "8")),
+            requests_per_minute=float(os.getenv("OPENAI_RPM", "500")),
+            tokens_per_minute=float(os.getenv("OPENAI_TPM", "200000")),
+            request_timeout=float(os.getenv("OPENAI_REQUEST_TIMEOUT", "20")),
+            max_attempts=int(os.getenv("OPENAI_MAX_ATTEMPTS", "3")),
+            stream=os.getenv("OPENAI_STREAM", "true").lower() in ("1", "true", "yes"),
         )
 
         # Google Sheets config
@@ -110,12 +251,117 @@ class Settings:
                 certificate_path=os.getenv("WEBHOOK_CERTIFICATE_PATH", None),
             )
 
+        # Incoming update queue config
+        updates_config = UpdateQueueConfig(
+            max_size=int(os.getenv("UPDATE_QUEUE_MAX_SIZE", "1000")),
+            workers=int(os.getenv("UPDATE_WORKERS", "32")),
+            max_concurrency=int(os.getenv("UPDATE_MAX_CONCURRENCY", "16")),
+            polling_timeout=int(os.getenv("POLLING_TIMEOUT", "30")),
+            drain_timeout=float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "20")),
+        )
+
+        # Update de-duplication config
+        dedup_config = DedupConfig(
+            ttl=int(os.getenv("UPDATE_DEDUP_TTL", "3600")),
+            max_size=int(os.getenv("UPDATE_DEDUP_MAX_SIZE", "100000")),
+            backend=os.getenv("UPDATE_DEDUP_BACKEND", "memory"),
+        )
+
+        # FSM storage config
+        fsm_config = FSMConfig(
+            storage=os.getenv("FSM_STORAGE", "memory"),
+            cache_ttl=float(os.getenv("FSM_CACHE_TTL", "5")),
+            flush_interval=float(os.getenv("FSM_FLUSH_INTERVAL", "0.1")),
+            state_ttl=int(os.getenv("FSM_STATE_TTL", "604800")),
+        )
+
+        # Outbound rate limits config
+        outbound_config = OutboundConfig(
+            global_rate=float(os.getenv("OUTBOUND_GLOBAL_RATE", "30")),
+            chat_rate=float(os.getenv("OUTBOUND_CHAT_RATE", "1")),
+            chat_burst=float(os.getenv("OUTBOUND_CHAT_BURST", "3")),
+            max_retries=int(os.getenv("OUTBOUND_MAX_RETRIES", "3")),
+        )
+
+        # User cache config
+        user_cache_config = UserCacheConfig(
+            ttl=float(os.getenv("USER_CACHE_TTL", "30")),
+            max_size=int(os.getenv("USER_CACHE_MAX_SIZE", "10000")),
+        )
+
+        # Assortment snapshot config
+        assortment_config = AssortmentConfig(
+            refresh_interval=float(os.getenv("ASSORTMENT_REFRESH_INTERVAL", "60")),
+        )
+
+        # Local order parser config
+        local_parser_config = LocalParserConfig(
+            enabled=os.getenv("LOCAL_PARSER_ENABLED", "true").lower() in ("1", "true", "yes"),
+            min_score=float(os.getenv("LOCAL_PARSER_MIN_SCORE", "0.85")),
+            shadow_rate=float(os.getenv("LOCAL_PARSER_SHADOW_RATE", "0.05")),
+        )
+
+        # Parse cache config
+        parse_cache_config = ParseCacheConfig(
+            enabled=os.getenv("PARSE_CACHE_ENABLED", "true").lower() in ("1", "true", "yes"),
+            ttl=int(os.getenv("PARSE_CACHE_TTL", "86400")),
+            max_size=int(os.getenv("PARSE_CACHE_MAX_SIZE", "5000")),
+            backend=os.getenv("PARSE_CACHE_BACKEND", "memory"),
+        )
+
+        # Catalog pruning config
+        catalog_pruning_config = CatalogPruningConfig(
+            enabled=os.getenv("CATALOG_PRUNING_ENABLED", "true").lower() in ("1", "true", "yes"),
+            top_k=int(os.getenv("CATALOG_PRUNING_TOP_K", "30")),
+            min_score=float(os.getenv("CATALOG_PRUNING_MIN_SCORE", "0.6")),
+            frequent_items=int(os.getenv("CATALOG_PRUNING_FREQUENT_ITEMS", "10")),
+            min_catalog_size=int(os.getenv("CATALOG_PRUNING_MIN_CATALOG_SIZE", "100")),
+        )
+
+        # Model routing config
+        model_routing_config = ModelRoutingConfig(
+            fallback_model=os.getenv("OPENAI_FALLBACK_MODEL", None),
+            hedge_enabled=os.getenv("OPENAI_HEDGE_ENABLED", "true").lower() in ("1", "true", "yes"),
+            hedge_model=os.getenv("OPENAI_HEDGE_MODEL", None),
+            hedge_quantile=float(os.getenv("OPENAI_HEDGE_QUANTILE", "0.95")),
+            hedge_min_delay=float(os.getenv("OPENAI_HEDGE_MIN_DELAY", "1")),
+            hedge_max_delay=float(os.getenv("OPENAI_HEDGE_MAX_DELAY", "8")),
+            degraded_error_rate=float(os.getenv("OPENAI_DEGRADED_ERROR_RATE", "0.5")),
+            degraded_latency=float(os.getenv("OPENAI_DEGRADED_LATENCY", "8")),
+            degraded_cooldown=float(os.getenv("OPENAI_DEGRADED_COOLDOWN", "30")),
+        )
+
+        # Order corrections config
+        correction_config = CorrectionConfig(
+            enabled=os.getenv("ORDER_CORRECTIONS_ENABLED", "true").lower() in ("1", "true", "yes"),
+            max_tokens=int(os.getenv("ORDER_CORRECTIONS_MAX_TOKENS", "300")),
+        )
+
+        # Order message aggregation config
+        order_aggregation_config = OrderAggregationConfig(
+            enabled=os.getenv("ORDER_AGGREGATION_ENABLED", "true").lower() in ("1", "true", "yes"),
+            window=float(os.getenv("ORDER_AGGREGATION_WINDOW", "2")),
+            max_wait=float(os.getenv("ORDER_AGGREGATION_MAX_WAIT", "10")),
+        )
+
         return cls(
             database=db_config,
             bot=bot_config,
             ai=ai_config,
             google_sheets=google_sheets_config,
             webhook=webhook_config,
+            updates=updates_config,
+            dedup=dedup_config,
+            fsm=fsm_config,
+            outbound=outbound_config,
+            user_cache=user_cache_config,
+            assortment=assortment_config,
+            local_parser=local_parser_config,
+            parse_cache=parse_cache_config,
+            catalog_pruning=catalog_pruning_config,
+            model_routing=model_routing_config,
+            corrections=correction_config,
+            order_aggregation=order_aggregation_config,
         )
 
 
@@ -2,6 +2,21 @@
 
 from .connection import Database, get_database
 from .models import User, Order, Assortment
+from .fsm_storage import MySQLStorage
+from .user_cache import UserCache, get_user_cache
+from .assortment_snapshot import AssortmentSnapshot, AssortmentStore, get_assortment_store
 
-__all__ = ["Database", "get_database", "User", "Order", "Assortment"]
+__all__ = [
+    "Database",
+    "get_database",
+    "User",
+    "Order",
+    "Assortment",
+    "MySQLStorage",
+    "UserCache",
+    "get_user_cache",
+    "AssortmentSnapshot",
+    "AssortmentStore",
+    "get_assortment_store",
+]
 
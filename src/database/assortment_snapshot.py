@@ -0,0 +1,158 @@
+"""Shared, versioned in-memory copy of the assortment table"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Tuple
+
+from src.config import get_settings
+from .connection import get_database
+from .models import Assortment
+
+logger = logging.getLogger(__name__)
+
+# Cheap change check: one row back, no products transferred or built
+CHECKSUM_QUERY = """
+    SELECT COUNT(*), COALESCE(SUM(CRC32(CONCAT_WS('|', good_id, name, type, price_c, price_amt, min_size))), 0)
+    FROM assortment
+"""
+
+
+@dataclass(frozen=True)
+class AssortmentSnapshot:
+    """
+    Immutable assortment at some version.
+
+    The version comes from the table checksum, so it is the same on all
+    replicas of the bot and can be used in cache keys.
+    """
+    version: str
+    products: Tuple[Assortment, ...]
+    by_id: Mapping[int, Assortment] = field(repr=False)
+    loaded_at: float = 0.0
+
+    @classmethod
+    def build(cls, version: str, products: List[Assortment]) -> "AssortmentSnapshot":
+        return cls(
+            version=version,
+            products=tuple(products),
+            by_id=MappingProxyType({p.good_id: p for p in products}),
+            loaded_at=time.monotonic(),
+        )
+
+    def get(self, good_id: int) -> Optional[Assortment]:
+        """Product by good_id"""
+        return self.by_id.get(good_id)
+
+    def as_dicts(self) -> List[Dict[str, Any]]:
+        """Products as plain dicts (for prompts)"""
+        return [
+            {
+                "good_id": p.good_id,
+                "name": p.name,
+                "type": p.type,
+                "price_c": p.price_c,
+                "price_amt": p.price_amt,
+                "min_size": p.min_size,
+            }
+            for p in self.products
+        ]
+
+    def __iter__(self) -> Iterator[Assortment]:
+        return iter(self.products)
+
+    def __len__(self) -> int:
+        return len(self.products)
+
+
+class AssortmentStore:
+    """
+    Holds the current assortment snapshot for the whole process.
+
+    get() returns the current snapshot right away. At most once per
+    refresh_interval it starts a background checksum query, and only if
+    the checksum changed the table is reloaded and the snapshot swapped.
+    """
+
+    def __init__(self, refresh_interval: float = 60.0):
+        self.refresh_interval = refresh_interval
+        self._snapshot: Optional[AssortmentSnapshot] = None
+        self._checked_at = 0.0
+        self._load_lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+
+        # Stats
+        self.checks = 0
+        self.reloads = 0
+
+    @property
+    def snapshot(self) -> Optional[AssortmentSnapshot]:
+        """Current snapshot without triggering a load (None before the first one)"""
+        return self._snapshot
+
+    async def get(self) -> AssortmentSnapshot:
+        """Get current snapshot, loading it on first use"""
+        if self._snapshot is None:
+            async with self._load_lock:
+                if self._snapshot is None:
+                    await self.refresh()
+            return self._snapshot
+
+        if time.monotonic() - self._checked_at >= self.refresh_interval and (
+            self._refresh_task is None or self._refresh_task.done()
+        ):
+            self._checked_at = time.monotonic()
+            self._refresh_task = asyncio.create_task(self._refresh_in_background())
+        return self._snapshot
+
+    async def _refresh_in_background(self):
+        try:
+            await self.refresh()
+        except Exception as e:
+            # Keep serving the previous snapshot
+            logger.error(f"Failed to refresh assortment: {e}")
+
+    async def _checksum(self) -> str:
+        rows = await get_database().execute_query(CHECKSUM_QUERY, row_factory=tuple)
+        count, checksum = rows[0] if rows else (0, 0)
+        return f"{int(count)}-{int(checksum)}"
+
+    async def refresh(self, force: bool = False) -> AssortmentSnapshot:
+        """Reload the snapshot if the table checksum changed (or if force)"""
+        self._checked_at = time.monotonic()
+        self.checks += 1
+        version = await self._checksum()
+        current = self._snapshot
+        if current is not None and current.version == version and not force:
+            return current
+
+        products = await Assortment.get_all()
+        # Single attribute assignment, readers see either the old or the new snapshot
+        self._snapshot = AssortmentSnapshot.build(version, products)
+        self.reloads += 1
+        logger.info(f"Assortment snapshot {version} loaded: {len(products)} products")
+        return self._snapshot
+
+    def stats(self) -> Dict[str, Any]:
+        """Assortment snapshot statistics"""
+        snapshot = self._snapshot
+        return {
+            "version": snapshot.version if snapshot else None,
+            "products": len(snapshot) if snapshot else 0,
+            "age_seconds": round(time.monotonic() - snapshot.loaded_at, 1) if snapshot else None,
+            "checks": self.checks,
+            "reloads": self.reloads,
+        }
+
+
+# Global assortment store instance
+_assortment_store: Optional[AssortmentStore] = None
+
+
+def get_assortment_store() -> AssortmentStore:
+    """Get assortment store instance (singleton)"""
+    global _assortment_store
+    if _assortment_store is None:
+        _assortment_store = AssortmentStore(refresh_interval=get_settings().assortment.refresh_interval)
+    return _assortment_store
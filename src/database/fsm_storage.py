@@ -0,0 +1,250 @@
+"""MySQL-backed FSM storage for aiogram"""
+import asyncio
+import json
+import logging
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, Optional, Set
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+from .connection import Database
+
+logger = logging.getLogger(__name__)
+
+# Retry delays of a failed flush: doubled from the first up to the last
+FLUSH_RETRY_MIN_DELAY = 1.0
+FLUSH_RETRY_MAX_DELAY = 30.0
+
+
+@dataclass
+class _CachedRecord:
+    """FSM record cached in process"""
+    state: Optional[str] = None
+    data: Dict[str, Any] = field(default_factory=dict)
+    loaded_at: float = 0.0
+
+
+class MySQLStorage(BaseStorage):
+    """
+    FSM storage in the fsm_storage table, shared by all bot replicas.
+
+    Records are cached in process while an update of the key is handled
+    (see scope()), but no longer than cache_ttl seconds, so repeated
+    get_state/get_data calls within one update cost no round trip. The
+    next update reads the record again: another replica may have handled
+    an update of the same chat in between.
+    Writes go to the cache at once and are flushed in batches every
+    flush_interval seconds: several writes of the same key in between
+    (update_data + set_state in a handler) become one upsert. The flush
+    task runs while there are unwritten records, a failed flush is
+    retried with backoff.
+    Records not updated for state_ttl seconds are treated as empty and purged.
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        cache_ttl: float = 5.0,
+        flush_interval: float = 0.1,
+        state_ttl: int = 604800,
+        key_builder: Optional[KeyBuilder] = None,
+    ):
+        self._db = db
+        self.cache_ttl = cache_ttl
+        self.flush_interval = flush_interval
+        self.state_ttl = state_ttl
+        self._key_builder = key_builder or DefaultKeyBuilder(with_destiny=True)
+        self._cache: Dict[str, _CachedRecord] = {}
+        self._dirty: Set[str] = set()
+        # Keys being written by the running flush
+        self._flushing: Set[str] = set()
+        # Keys with updates being handled: number of their scopes
+        self._scopes: Dict[str, int] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._last_purge = time.monotonic()
+
+        # Stats
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.flushes = 0
+        self.flush_failures = 0
+        self.rows_written = 0
+
+    async def _get_record(self, key: StorageKey) -> _CachedRecord:
+        """Get record from cache or load it from database"""
+        storage_key = self._key_builder.build(key)
+        record = self._cache.get(storage_key)
+        now = time.monotonic()
+        # Dirty records are newer than database, never reload them
+        if record and (self._unwritten(storage_key) or self._is_fresh(storage_key, record, now)):
+            self.cache_hits += 1
+            return record
+
+        self.cache_misses += 1
+        rows = await self._db.execute_query(
+            """SELECT state, data FROM fsm_storage
+               WHERE storage_key = %s AND updated_at > NOW() - INTERVAL %s SECOND""",
+            (storage_key, self.state_ttl),
+            row_factory=tuple,
+            # Another replica of the bot may have just written the state
+            use_primary=True,
+        )
+        record = _CachedRecord(loaded_at=now)
+        if rows:
+            state, data = rows[0]
+            record.state = state
+            record.data = json.loads(data) if data else {}
+        # A write may have happened while the query was running
+        if self._unwritten(storage_key):
+            return self._cache[storage_key]
+        self._cache[storage_key] = record
+        return record
+
+    def _unwritten(self, storage_key: str) -> bool:
+        """Whether the cached record is newer than database"""
+        return storage_key in self._dirty or storage_key in self._flushing
+
+    def _is_fresh(self, storage_key: str, record: _CachedRecord, now: float) -> bool:
+        """Whether a clean record may be served from cache"""
+        return storage_key in self._scopes and now - record.loaded_at < self.cache_ttl
+
+    @contextmanager
+    def scope(self, key: StorageKey) -> Iterator[None]:
+        """Handling of one update of the key: its reads may be served from cache"""
+        storage_key = self._key_builder.build(key)
+        self._scopes[storage_key] = self._scopes.get(storage_key, 0) + 1
+        try:
+            yield
+        finally:
+            self._scopes[storage_key] -= 1
+            if not self._scopes[storage_key]:
+                del self._scopes[storage_key]
+                # Dirty records are dropped by flush once written
+                if not self._unwritten(storage_key):
+                    self._cache.pop(storage_key, None)
+
+    async def _write(self, key: StorageKey) -> _CachedRecord:
+        """Get record for modification and schedule its flush"""
+        record = await self._get_record(key)
+        storage_key = self._key_builder.build(key)
+        self._cache[storage_key] = record
+        self._dirty.add(storage_key)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+        return record
+
+    async def _flush_later(self):
+        """Flush until no records are left unwritten, including ones written during a flush"""
+        delay = self.flush_interval
+        while True:
+            await asyncio.sleep(delay)
+            if await self.flush():
+                delay = self.flush_interval
+            else:
+                delay = min(FLUSH_RETRY_MAX_DELAY, max(FLUSH_RETRY_MIN_DELAY, delay * 2))
+            if not self._dirty:
+                return
+
+    async def flush(self) -> bool:
+        """
+        Write all modified records to database
+
+        Returns:
+            False if the write failed (the records stay modified)
+        """
+        if not self._dirty:
+            return True
+        keys = list(self._dirty)
+        self._dirty.clear()
+        self._flushing.update(keys)
+        rows = []
+        for storage_key in keys:
+            record = self._cache[storage_key]
+            rows.append((
+                storage_key,
+                record.state,
+                json.dumps(record.data, ensure_ascii=False, default=str),
+            ))
+        try:
+            await self._db.execute_many(
+                """INSERT INTO fsm_storage (storage_key, state, data)
+                   VALUES (%s, %s, %s)
+                   ON DUPLICATE KEY UPDATE
+                   state = VALUES(state),
+                   data = VALUES(data),
+                   updated_at = CURRENT_TIMESTAMP""",
+                rows
+            )
+            self.flushes += 1
+            self.rows_written += len(rows)
+        except asyncio.CancelledError:
+            self._dirty.update(keys)
+            raise
+        except Exception as e:
+            logger.error(f"Failed to flush {len(rows)} FSM records: {e}", exc_info=True)
+            # Keep records dirty, the flush task retries them
+            self.flush_failures += 1
+            self._dirty.update(keys)
+            return False
+        finally:
+            self._flushing.difference_update(keys)
+
+        now = time.monotonic()
+        self._prune_cache(now)
+        if now - self._last_purge > self.state_ttl / 10:
+            self._last_purge = now
+            try:
+                await self._db.execute_command(
+                    "DELETE FROM fsm_storage WHERE updated_at < NOW() - INTERVAL %s SECOND",
+                    (self.state_ttl,)
+                )
+            except Exception as e:
+                logger.error(f"Failed to purge expired FSM records: {e}")
+        return True
+
+    def _prune_cache(self, now: float):
+        """Drop clean cache records that can't be served anymore"""
+        expired = [
+            storage_key for storage_key, record in self._cache.items()
+            if not self._unwritten(storage_key) and not self._is_fresh(storage_key, record, now)
+        ]
+        for storage_key in expired:
+            del self._cache[storage_key]
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._write(key)
+        record.state = state.state if isinstance(state, State) else state
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._get_record(key)).state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        record = await self._write(key)
+        record.data = data.copy()
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._get_record(key)).data.copy()
+
+    async def close(self) -> None:
+        """Flush pending writes (one last attempt if the database is failing)"""
+        if self._flush_task and not self._flush_task.done():
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+        if not await self.flush():
+            logger.error(f"{len(self._dirty)} FSM records were not written on close")
+
+    def stats(self) -> Dict[str, Any]:
+        """Storage statistics"""
+        return {
+            "cached": len(self._cache),
+            "scopes": len(self._scopes),
+            "dirty": len(self._dirty),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "flushes": self.flushes,
+            "flush_failures": self.flush_failures,
+            "rows_written": self.rows_written,
+        }
@@ -1,8 +1,9 @@
 """Database models and data access"""
-from typing import Optional, List, Dict
+from typing import AsyncIterator, Optional, List, Dict
 from dataclasses import dataclass
 from datetime import datetime
 from .connection import get_database
+from .user_cache import get_user_cache
 
 
 @dataclass
@@ -48,6 +49,18 @@ class User:
             )
         return None
 
+    @classmethod
+    async def get_cached(cls, user_id: int) -> Optional["User"]:
+        """Get user by ID through the user cache"""
+        cache = get_user_cache()
+        found, user = cache.get(user_id)
+        if found:
+            return user
+        generation = cache.generation()
+        user = await cls.get_by_id(user_id)
+        cache.put(user_id, user, generation)
+        return user
+
     @classmethod
     async def get_by_username(cls, user_name: str) -> Optional["User"]:
         """Get user by username"""
@@ -84,6 +97,8 @@ class User:
             (self.user_id, self.user_name, self.tg_account, self.user_info, 
              self.phone, int(self.approved), self.date_register)
         )
+        db.mark_written(self.user_id)
+        get_user_cache().invalidate(self.user_id)
 
     async def update_approval(self, approved: bool):
         """Update user approval status"""
@@ -93,6 +108,8 @@ class User:
             "UPDATE users SET approved = %s WHERE user_id = %s",
             (int(approved), self.user_id)
         )
+        db.mark_written(self.user_id)
+        get_user_cache().invalidate(self.user_id)
 
     async def update_info(self, user_name: Optional[str] = None, tg_account: Optional[str] = None,
                          user_info: Optional[str] = None, phone: Optional[str] = None):
@@ -116,6 +133,8 @@ class User:
                WHERE user_id = %s""",
             (user_name, tg_account, user_info, phone, self.user_id)
         )
+        db.mark_written(self.user_id)
+        get_user_cache().invalidate(self.user_id)
 
     @classmethod
     async def create(cls, user_id: int, user_name: str, tg_account: Optional[str] = None,
@@ -160,22 +179,33 @@ class Assortment:
     price_amt: float
     min_size: float
 
+    COLUMNS = "good_id, name, type, price_c, price_amt, min_size"
+
+    @classmethod
+    def from_row(cls, row: tuple) -> "Assortment":
+        """Build product from a row tuple selected in COLUMNS order"""
+        good_id, name, type_, price_c, price_amt, min_size = row
+        return cls(
+            good_id=good_id,
+            name=name,
+            type=type_,
+            price_c=float(price_c),
+            price_amt=float(price_amt),
+            min_size=float(min_size),
+        )
+
     @classmethod
     async def get_all(cls) -> List["Assortment"]:
         """Get all products from assortment"""
         db = get_database()
-        result = await db.execute_query("SELECT * FROM assortment")
-        return [
-            cls(
-                good_id=row["good_id"],
-                name=row["name"],
-                type=row["type"],
-                price_c=float(row["price_c"]),
-                price_amt=float(row["price_amt"]),
-                min_size=float(row["min_size"]),
-            )
-            for row in result
-        ]
+        return await db.execute_query(f"SELECT {cls.COLUMNS} FROM assortment", row_factory=cls.from_row)
+
+    @classmethod
+    async def iter_all(cls) -> AsyncIterator["Assortment"]:
+        """Stream all products from assortment without loading the whole table"""
+        db = get_database()
+        async for product in db.stream_query(f"SELECT {cls.COLUMNS} FROM assortment", row_factory=cls.from_row):
+            yield product
 
     @classmethod
     async def get_by_id(cls, good_id: int) -> Optional["Assortment"]:
@@ -207,6 +237,60 @@ class Order:
     status: str
     created_at: Optional[datetime] = None
 
+    COLUMNS = "order_id, user_id, order_data, status, created_at"
+
+    @classmethod
+    def from_row(cls, row: tuple) -> "Order":
+        """Build order from a row tuple selected in COLUMNS order"""
+        import json
+        order_id, user_id, order_data, status, created_at = row
+        return cls(
+            order_id=order_id,
+            user_id=user_id,
+            order_data=json.loads(order_data) if isinstance(order_data, (str, bytes)) else order_data,
+            status=status,
+            created_at=created_at,
+        )
+
+    @classmethod
+    async def get_by_id(cls, order_id: int) -> Optional["Order"]:
+        """Get order by ID"""
+        db = get_database()
+        result = await db.execute_query(
+            f"SELECT {cls.COLUMNS} FROM orders WHERE order_id = %s",
+            (order_id,),
+            row_factory=cls.from_row,
+            # Orders are read right before status transitions, a lagging replica may not have them yet
+            use_primary=True,
+        )
+        return result[0] if result else None
+
+    @classmethod
+    async def get_latest_pending(cls, user_id: int) -> Optional["Order"]:
+        """Get the most recent order of user waiting for admin (idx_user_status_created)"""
+        db = get_database()
+        result = await db.execute_query(
+            f"""SELECT {cls.COLUMNS} FROM orders
+                WHERE user_id = %s AND status = 'pending_admin'
+                ORDER BY created_at DESC LIMIT 1""",
+            (user_id,),
+            row_factory=cls.from_row,
+            use_primary=True,
+        )
+        return result[0] if result else None
+
+    @classmethod
+    async def get_recent_confirmed(cls, user_id: int, limit: int = 20) -> List["Order"]:
+        """Get the latest confirmed orders of user, newest first (idx_user_status_created)"""
+        db = get_database()
+        return await db.execute_query(
+            f"""SELECT {cls.COLUMNS} FROM orders
+                WHERE user_id = %s AND status = 'confirmed'
+                ORDER BY created_at DESC LIMIT %s""",
+            (user_id, limit),
+            row_factory=cls.from_row,
+        ) or []
+
     async def save(self) -> int:
         """Save order to database"""
         import json
@@ -228,3 +312,19 @@ class Order:
             (status, self.order_id)
         )
 
+    async def transition_status(self, from_status: str, to_status: str) -> bool:
+        """
+        Change status only if the order is still in from_status
+
+        Returns:
+            False if another request already changed the status
+        """
+        db = get_database()
+        changed = await db.execute_rowcount(
+            "UPDATE orders SET status = %s WHERE order_id = %s AND status = %s",
+            (to_status, self.order_id, from_status)
+        )
+        if changed:
+            self.status = to_status
+        return changed > 0
+
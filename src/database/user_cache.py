@@ -0,0 +1,107 @@
+"""In-process cache of user records"""
+import copy
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple, TYPE_CHECKING
+
+from src.config import get_settings
+from src.metrics import Counter
+
+if TYPE_CHECKING:
+    from .models import User
+
+USER_CACHE_REQUESTS = Counter(
+    "user_cache_requests_total",
+    "User cache lookups",
+    ["result"],
+)
+
+
+class UserCache:
+    """
+    LRU cache of users by id with TTL.
+
+    Unknown users are cached too (as None), so unregistered users writing
+    to the bot don't hit MySQL on every message. Writes through User
+    methods invalidate the entry; TTL bounds staleness of changes made
+    by other replicas.
+    """
+
+    def __init__(self, ttl: float = 30.0, max_size: int = 10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._users: "OrderedDict[int, Tuple[float, Optional[User]]]" = OrderedDict()
+        # Bumped on every invalidation, a load that raced with a write is not cached
+        self._writes = 0
+
+        # Stats
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, user_id: int) -> Tuple[bool, Optional["User"]]:
+        """
+        Get cached user
+
+        Returns:
+            (found, user), user is a copy and is None for a cached unknown user
+        """
+        entry = self._users.get(user_id)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._users[user_id]
+            self.misses += 1
+            USER_CACHE_REQUESTS.labels(result="miss").inc()
+            return False, None
+
+        self._users.move_to_end(user_id)
+        self.hits += 1
+        USER_CACHE_REQUESTS.labels(result="hit").inc()
+        # Handlers may change the user, the cached record must not follow
+        return True, copy.copy(entry[1])
+
+    def generation(self) -> int:
+        """Token to take before loading a user from the database"""
+        return self._writes
+
+    def put(self, user_id: int, user: Optional["User"], generation: Optional[int] = None):
+        """Cache user (None for unknown user) unless a write happened since generation"""
+        if generation is not None and generation != self._writes:
+            return
+        self._users[user_id] = (time.monotonic() + self.ttl, copy.copy(user))
+        self._users.move_to_end(user_id)
+        while len(self._users) > self.max_size:
+            self._users.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        """Drop cached user after a write"""
+        self._writes += 1
+        if self._users.pop(user_id, None) is not None:
+            self.invalidations += 1
+
+    def clear(self):
+        self._users.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """User cache statistics"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._users),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+        }
+
+
+# Global user cache instance
+_user_cache: Optional[UserCache] = None
+
+
+def get_user_cache() -> UserCache:
+    """Get user cache instance (singleton)"""
+    global _user_cache
+    if _user_cache is None:
+        settings = get_settings().user_cache
+        _user_cache = UserCache(ttl=settings.ttl, max_size=settings.max_size)
+    return _user_cache
@@ -1,15 +1,23 @@
 """Google Sheets service for writing orders"""
 import logging
 import asyncio
+import time
 from typing import Dict, List, Optional
 from datetime import datetime
 import gspread
 from google.oauth2.service_account import Credentials
 from src.config import get_settings
-from src.database import Assortment
+from src.database import get_assortment_store
+from src.metrics import Histogram
 
 logger = logging.getLogger(__name__)
 
+SHEETS_WRITE_LATENCY = Histogram(
+    "sheets_write_seconds",
+    "GoogleSheetsService.write_order latency",
+    ["result"],
+)
+
 
 class GoogleSheetsService:
     """Service for writing orders to Google Sheets"""
@@ -101,6 +109,21 @@ class GoogleSheetsService:
         Returns:
             True if successful, False otherwise
         """
+        started_at = time.perf_counter()
+        written = await self._write_order(user_id, username, phone, organization, order_data, order_date)
+        SHEETS_WRITE_LATENCY.labels(result="ok" if written else "failed").observe(time.perf_counter() - started_at)
+        return written
+
+    async def _write_order(
+        self,
+        user_id: int,
+        username: Optional[str],
+        phone: Optional[str],
+        organization: str,
+        order_data: List[Dict],
+        order_date: Optional[datetime] = None
+    ) -> bool:
+        """Append order rows to the worksheet"""
         try:
             if not self._client:
                 logger.error("Google Sheets client not initialized")
@@ -108,9 +131,8 @@ class GoogleSheetsService:
             
             worksheet = await self._get_worksheet()
             
-            # Get all products for lookup
-            all_products = await Assortment.get_all()
-            product_map = {p.good_id: p for p in all_products}
+            # Shared assortment snapshot for lookup
+            assortment = await get_assortment_store().get()
             
             # Process each order (multiple addresses)
             row_all = []
@@ -127,9 +149,9 @@ class GoogleSheetsService:
                 for product_id_str, quantity in goods.items():
                     try:
                         product_id = int(product_id_str)
-                        product = product_map.get(product_id)
-                        q_a = quantity * product.min_size
+                        product = assortment.get(product_id)
                         if product:
+                            q_a = quantity * product.min_size
                             payment_type = order.get('payment_type', 'price_amt')
                             price = product.price_c if payment_type == 'price_c' else product.price_amt
                             cost = price * (q_a)
@@ -2,15 +2,36 @@
 import asyncio
 import logging
 import sys
+import time
 from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
 from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from aiogram import Bot, Dispatcher, Router, types
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.types import Update ,FSInputFile,ErrorEvent
 from aiogram.fsm.storage.memory import MemoryStorage
 
 from src.config import get_settings
-from src.database import get_database
-from src.bot import setup_handlers
+from src.database import get_database, get_user_cache, get_assortment_store, MySQLStorage
+from src.bot import (
+    setup_handlers, get_outbound_scheduler, get_order_aggregator,
+    FSMScopeMiddleware, RequestMetricsMiddleware, UserMiddleware,
+)
+from src.ai_service import get_order_parser, get_parse_cache
+from src.metrics import Histogram, REGISTRY
+from src.updates import (
+    create_update_queue,
+    get_update_queue,
+    create_scheduler,
+    get_scheduler,
+    get_deduplicator,
+    UpdatePoller,
+    UpdateDecoder,
+    peek_update,
+    resolve_update_type,
+)
 
 import html
 import traceback
@@ -25,9 +46,23 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+WEBHOOK_LATENCY = Histogram(
+    "webhook_request_seconds",
+    "Webhook request handling latency",
+    ["result"],
+)
+UPDATE_LATENCY = Histogram(
+    "update_processing_seconds",
+    "Update processing latency in dispatcher (excluding queue wait)",
+    ["type"],
+)
+
 # Global bot and dispatcher instances
 bot: Bot = None
 dp: Dispatcher = None
+update_decoder: UpdateDecoder = None
+poller: UpdatePoller = None
+accepting_updates: bool = False
 
 async def _error_handler(event: ErrorEvent):
     """
@@ -65,10 +100,16 @@ async def _error_handler(event: ErrorEvent):
         logging.error(f"Failed to send error message: {e}")
 
 
+async def _process_update(update: Update):
+    """Feed update from the queue to the dispatcher (run in its chat's lane)"""
+    with UPDATE_LATENCY.labels(type=resolve_update_type(update)).time():
+        await dp.feed_update(bot, update)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifespan context manager for startup and shutdown"""
-    global bot, dp
+    global bot, dp, update_decoder, poller, accepting_updates
     
     # Startup
     settings = get_settings()
@@ -79,9 +120,30 @@ async def lifespan(app: FastAPI):
     logger.info("Database connected")
     
     # Initialize bot
-    bot = Bot(token=settings.bot.token)
-    storage = MemoryStorage()
+    session = None
+    if settings.bot.api_url:
+        # Local Bot API server (or a stand-in for load tests)
+        session = AiohttpSession(api=TelegramAPIServer.from_base(settings.bot.api_url))
+    bot = Bot(token=settings.bot.token, session=session)
+    # All sends and edits go through rate limits and flood control retries
+    outbound = get_outbound_scheduler()
+    bot.session.middleware(outbound)
+    bot.session.middleware(RequestMetricsMiddleware())
+    if settings.fsm.storage == "mysql":
+        # Shared by all replicas, a confirmation may land on any of them
+        storage = MySQLStorage(
+            db,
+            cache_ttl=settings.fsm.cache_ttl,
+            flush_interval=settings.fsm.flush_interval,
+            state_ttl=settings.fsm.state_ttl,
+        )
+    else:
+        storage = MemoryStorage()
     dp = Dispatcher(storage=storage)
+    # Sender is loaded once per update and passed to handlers as `user`
+    dp.update.outer_middleware(UserMiddleware())
+    # FSM state is cached within an update only, another replica may handle the next one
+    dp.update.outer_middleware(FSMScopeMiddleware())
     router = Router()
     dp.include_router(router)
     
@@ -89,10 +151,25 @@ async def lifespan(app: FastAPI):
     setup_handlers(router, bot, dp)
     dp.errors.register(_error_handler)
     
+    # Decode only update types handled by routers
+    update_decoder = UpdateDecoder(bot, dp.resolve_used_update_types())
+    
+    # Start workers draining incoming updates
+    scheduler = create_scheduler()
+    update_queue = create_update_queue(_process_update, scheduler)
+    update_queue.start()
+    
     # Initialize bot (don't start polling if webhook is configured)
     if not settings.webhook:
-        # Start polling only if webhook is not configured
-        await dp.start_polling(bot, skip_updates=True)
+        # Start polling only if webhook is not configured.
+        # Polling runs in background and feeds the same queue as webhook
+        poller = UpdatePoller(
+            bot,
+            update_queue,
+            allowed_updates=dp.resolve_used_update_types(),
+            timeout=settings.updates.polling_timeout,
+        )
+        poller.start()
         logger.info("Bot started with polling")
     else:
         # Setup webhook
@@ -115,6 +192,7 @@ async def lifespan(app: FastAPI):
         
         logger.info("Bot started with webhook")
     
+    accepting_updates = True
     yield
     
     # Shutdown
@@ -122,6 +200,25 @@ async def lifespan(app: FastAPI):
     #     await bot.delete_webhook(drop_pending_updates=True)
     #     logger.info("Webhook deleted")
     
+    # Stop accepting updates: webhook answers 503 and Telegram retries later
+    accepting_updates = False
+    if poller:
+        await poller.stop()
+    
+    # Let in-flight orders finish before closing pools
+    loop = asyncio.get_running_loop()
+    drain_deadline = loop.time() + settings.updates.drain_timeout
+    drained, abandoned = await update_queue.drain(settings.updates.drain_timeout)
+    # Order messages still waiting for the rest of the order are parsed now
+    pending_orders = await get_order_aggregator().drain(max(0.0, drain_deadline - loop.time()))
+    pending_sends = await outbound.wait_idle(max(0.0, drain_deadline - loop.time()))
+    logger.info(
+        f"Shutdown drain finished: {drained} updates drained, {abandoned} abandoned, "
+        f"{pending_orders} aggregated orders abandoned, {pending_sends} outbound requests abandoned"
+    )
+    await update_queue.stop()
+    await scheduler.stop()
+    await storage.close()
     await db.close()
     await bot.session.close()
     logger.info("Bot stopped")
@@ -138,17 +235,55 @@ app = FastAPI(
 @app.post("/webhook_17821")
 async def webhook_handler(request: Request):
     """Handle webhook requests from Telegram"""
+    started_at = time.perf_counter()
     try:
-        data = await request.json()
-        update = Update(**data)
-        
-        if dp and bot:
-            await dp.feed_update(bot, update)
-        
-        return {"ok": True}
+        result, response = await _handle_webhook(request)
     except Exception as e:
         logger.error(f"Error processing webhook: {e}", exc_info=True)
-        return {"ok": False, "error": str(e)}
+        result, response = "error", {"ok": False, "error": str(e)}
+    WEBHOOK_LATENCY.labels(result=result).observe(time.perf_counter() - started_at)
+    return response
+
+
+async def _handle_webhook(request: Request) -> Tuple[str, Any]:
+    """Validate and enqueue webhook update, returns (result, response)"""
+    if not accepting_updates:
+        # Shutting down, make Telegram (or nginx) retry on another replica
+        return "shutting_down", JSONResponse(status_code=503, content={"ok": False, "error": "shutting down"})
+    
+    update_queue = get_update_queue()
+    if not (dp and bot and update_queue and update_decoder):
+        return "not_ready", {"ok": True}
+    
+    body = await request.body()
+    head = peek_update(body)
+    update = None
+    if head is None:
+        # Unusual payload layout, read id and type from the full model
+        update = update_decoder.decode(body)
+        head = (update.update_id, resolve_update_type(update))
+    update_id, update_type = head
+    
+    # Skip update types no router handles without building the model
+    if not update_decoder.is_allowed(update_type):
+        return "rejected", {"ok": True}
+    
+    # Skip updates redelivered by Telegram after a timeout
+    deduplicator = get_deduplicator()
+    if await deduplicator.is_duplicate(update_id):
+        logger.info(f"Duplicate update {update_id} skipped")
+        return "duplicate", {"ok": True}
+    
+    if update is None:
+        update = update_decoder.decode(body)
+    
+    # Answer Telegram right away, workers process the update in background
+    if not update_queue.put_nowait(update):
+        await deduplicator.forget(update_id)
+        # Non-2xx makes Telegram redeliver the update later
+        return "dropped", JSONResponse(status_code=503, content={"ok": False, "error": "queue is full"})
+    
+    return "accepted", {"ok": True}
 
 
 @app.get("/")
@@ -160,6 +295,54 @@ async def root():
     }
 
 
+def _stats_of(component: Optional[Any]) -> Optional[Dict[str, Any]]:
+    """Statistics of a component that may not be created yet"""
+    return component.stats() if component else None
+
+
+# Update processing components: (name, statistics getter). Getters are
+# called on /stats and /metrics requests only, singletons aren't built on import
+COMPONENT_STATS: List[Tuple[str, Callable[[], Optional[Dict[str, Any]]]]] = [
+    ("update_queue", lambda: _stats_of(get_update_queue())),
+    ("scheduler", lambda: _stats_of(get_scheduler())),
+    ("dedup", lambda: get_deduplicator().stats()),
+    ("decoder", lambda: _stats_of(update_decoder)),
+    ("poller", lambda: _stats_of(poller)),
+    ("outbound", lambda: get_outbound_scheduler().stats()),
+    ("fsm_storage", lambda: dp.storage.stats() if dp and isinstance(dp.storage, MySQLStorage) else None),
+    ("user_cache", lambda: get_user_cache().stats()),
+    ("assortment", lambda: get_assortment_store().stats()),
+    ("order_parser", lambda: get_order_parser().stats()),
+    ("parse_cache", lambda: get_parse_cache().stats()),
+    ("openai", lambda: get_order_parser().governor.stats()),
+    ("model_routing", lambda: get_order_parser().router.stats()),
+    ("order_aggregation", lambda: get_order_aggregator().stats()),
+]
+
+
+def _component_stats() -> Dict[str, Any]:
+    """Statistics of update processing components"""
+    return {name: getter() for name, getter in COMPONENT_STATS}
+
+
+# Export component statistics and pool saturation on /metrics
+for _name, _getter in COMPONENT_STATS:
+    REGISTRY.register_collector(_name, f"{_name} statistics", _getter)
+REGISTRY.register_collector("db_pool", "MySQL connection pool", lambda: get_database().pool_stats())
+
+
+@app.get("/stats")
+async def stats():
+    """Update processing statistics"""
+    return _component_stats()
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/health")
 async def health():
     """Health check endpoint"""
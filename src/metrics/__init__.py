@@ -0,0 +1,5 @@
+"""Metrics module"""
+
+from .registry import Counter, Gauge, Histogram, Registry, REGISTRY
+
+__all__ = ["Counter", "Gauge", "Histogram", "Registry", "REGISTRY"]
@@ -0,0 +1,22 @@
+"""Incoming updates processing module"""
+
+from .queue import UpdateQueue, create_update_queue, get_update_queue
+from .scheduler import KeyedScheduler, create_scheduler, get_scheduler
+from .dedup import UpdateDeduplicator, get_deduplicator
+from .polling import UpdatePoller
+from .decoding import UpdateDecoder, peek_update, resolve_update_type
+
+__all__ = [
+    "UpdateQueue",
+    "create_update_queue",
+    "get_update_queue",
+    "KeyedScheduler",
+    "create_scheduler",
+    "get_scheduler",
+    "UpdateDeduplicator",
+    "get_deduplicator",
+    "UpdatePoller",
+    "UpdateDecoder",
+    "peek_update",
+    "resolve_update_type",
+]
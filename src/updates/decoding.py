@@ -0,0 +1,70 @@
+"""Fast-path decoding of webhook payloads"""
+import re
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.types import Update
+from aiogram.types.update import UpdateTypeLookupError
+
+# Telegram always serializes update_id first, followed by the single event field
+_UPDATE_HEAD_RE = re.compile(rb'\A\s*\{\s*"update_id"\s*:\s*(\d+)\s*,\s*"([a-z_]+)"\s*:')
+
+
+def peek_update(body: bytes) -> Optional[Tuple[int, str]]:
+    """
+    Read update id and update type from the head of raw payload
+    without parsing the whole body
+
+    Returns:
+        (update_id, update_type) or None if the payload has an unexpected layout
+    """
+    match = _UPDATE_HEAD_RE.match(body)
+    if not match:
+        return None
+    return int(match.group(1)), match.group(2).decode()
+
+
+def resolve_update_type(update: Update) -> str:
+    """Get type of decoded update ("unknown" for events aiogram does not know)"""
+    try:
+        return update.event_type
+    except UpdateTypeLookupError:
+        return "unknown"
+
+
+class UpdateDecoder:
+    """
+    Decoder of raw webhook bodies into aiogram Update.
+
+    The body is validated straight from bytes with model_validate_json
+    (pydantic-core parses JSON in the same pass), and updates of types no
+    router handles are rejected from the payload head before any model is built.
+    """
+
+    def __init__(self, bot: Bot, allowed_types: Iterable[str]):
+        self._bot = bot
+        self.allowed_types = frozenset(allowed_types)
+
+        # Stats
+        self.decoded = 0
+        self.rejected = 0
+
+    def is_allowed(self, update_type: str) -> bool:
+        """Check if any router handles updates of the type"""
+        if update_type in self.allowed_types:
+            return True
+        self.rejected += 1
+        return False
+
+    def decode(self, body: bytes) -> Update:
+        """Validate raw body into Update bound to the bot"""
+        update = Update.model_validate_json(body, context={"bot": self._bot})
+        self.decoded += 1
+        return update
+
+    def stats(self) -> Dict[str, Any]:
+        """Decoder statistics"""
+        return {
+            "decoded": self.decoded,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,119 @@
+"""Telegram update de-duplication by update_id"""
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from src.config import get_settings
+from src.database import get_database
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateDeduplicator:
+    """
+    Bounded, TTL-evicting set of seen update ids.
+
+    Telegram redelivers webhooks that timed out, so the same update can
+    arrive more than once. With use_database the set is also kept in the
+    telegram_updates table, which lets several replicas behind nginx
+    share it.
+    """
+
+    def __init__(self, ttl: int = 3600, max_size: int = 100000, use_database: bool = False):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.use_database = use_database
+        self._seen: "OrderedDict[int, float]" = OrderedDict()
+        self._last_cleanup = time.monotonic()
+
+        # Stats
+        self.checked = 0
+        self.duplicates = 0
+
+    def _evict(self, now: float):
+        """Drop expired ids and ids over the size limit (oldest first)"""
+        while self._seen:
+            update_id, expires_at = next(iter(self._seen.items()))
+            if expires_at > now and len(self._seen) < self.max_size:
+                break
+            self._seen.popitem(last=False)
+
+    async def is_duplicate(self, update_id: int) -> bool:
+        """
+        Check update id and mark it as seen
+
+        Returns:
+            True if the update was already seen within TTL
+        """
+        self.checked += 1
+        now = time.monotonic()
+        self._evict(now)
+
+        if update_id in self._seen:
+            self.duplicates += 1
+            return True
+        self._seen[update_id] = now + self.ttl
+
+        if self.use_database and not await self._mark_in_database(update_id, now):
+            self.duplicates += 1
+            return True
+        return False
+
+    async def _mark_in_database(self, update_id: int, now: float) -> bool:
+        """Insert update id into shared table, False if another replica already has it"""
+        db = get_database()
+        try:
+            inserted = await db.execute_rowcount(
+                "INSERT IGNORE INTO telegram_updates (update_id) VALUES (%s)",
+                (update_id,)
+            )
+            if now - self._last_cleanup > self.ttl:
+                self._last_cleanup = now
+                await db.execute_command(
+                    "DELETE FROM telegram_updates WHERE received_at < NOW() - INTERVAL %s SECOND",
+                    (self.ttl,)
+                )
+            return inserted > 0
+        except Exception as e:
+            # Prefer processing an update twice to losing it
+            logger.error(f"Failed to check update {update_id} in database: {e}")
+            return True
+
+    async def forget(self, update_id: int):
+        """Remove update id, so a redelivery of the update is processed"""
+        self._seen.pop(update_id, None)
+        if self.use_database:
+            try:
+                await get_database().execute_command(
+                    "DELETE FROM telegram_updates WHERE update_id = %s",
+                    (update_id,)
+                )
+            except Exception as e:
+                logger.error(f"Failed to forget update {update_id} in database: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """De-duplication statistics"""
+        return {
+            "backend": "mysql" if self.use_database else "memory",
+            "size": len(self._seen),
+            "checked": self.checked,
+            "duplicates": self.duplicates,
+        }
+
+
+# Global deduplicator instance
+_deduplicator: Optional[UpdateDeduplicator] = None
+
+
+def get_deduplicator() -> UpdateDeduplicator:
+    """Get update deduplicator instance (singleton)"""
+    global _deduplicator
+    if _deduplicator is None:
+        settings = get_settings().dedup
+        _deduplicator = UpdateDeduplicator(
+            ttl=settings.ttl,
+            max_size=settings.max_size,
+            use_database=settings.backend == "mysql",
+        )
+    return _deduplicator
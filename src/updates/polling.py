@@ -0,0 +1,90 @@
+"""Long polling that feeds the update queue"""
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+from aiogram import Bot
+
+from .queue import UpdateQueue
+
+logger = logging.getLogger(__name__)
+
+
+class UpdatePoller:
+    """
+    Background long polling task.
+
+    Instead of dp.start_polling, fetched updates are put into the same
+    UpdateQueue the webhook uses, so updates are handled by the same
+    worker pool and chat lanes in both modes. When the queue is full the
+    poller waits for a free slot before fetching more.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        queue: UpdateQueue,
+        allowed_updates: Optional[List[str]] = None,
+        timeout: int = 30,
+        limit: int = 100,
+    ):
+        self._bot = bot
+        self._queue = queue
+        self._allowed_updates = allowed_updates
+        self.timeout = timeout
+        self.limit = limit
+        self._offset: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+
+        # Stats
+        self.received = 0
+        self.errors = 0
+
+    def start(self):
+        """Start polling in background"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="update-poller")
+            logger.info("Update polling started")
+
+    async def stop(self):
+        """Cancel polling and wait for it to finish"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        logger.info("Update polling stopped")
+
+    async def _run(self):
+        backoff = 1.0
+        while True:
+            try:
+                updates = await self._bot.get_updates(
+                    offset=self._offset,
+                    limit=self.limit,
+                    timeout=self.timeout,
+                    allowed_updates=self._allowed_updates,
+                    request_timeout=self.timeout + 10,
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Failed to fetch updates: {e}, retrying in {backoff:.0f}s")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+                continue
+
+            backoff = 1.0
+            for update in updates:
+                await self._queue.put(update)
+                self.received += 1
+                self._offset = update.update_id + 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Polling statistics"""
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "received": self.received,
+            "errors": self.errors,
+        }
@@ -0,0 +1,179 @@
+"""Bounded in-process queue of incoming Telegram updates"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiogram.types import Update
+
+from src.config import get_settings
+from .scheduler import KeyedScheduler
+
+logger = logging.getLogger(__name__)
+
+UpdateHandler = Callable[[Update], Awaitable[Any]]
+
+
+class UpdateQueue:
+    """
+    Bounded queue of updates drained by a pool of worker tasks.
+
+    The webhook only validates and enqueues an update, so Telegram gets
+    its answer right away while the OpenAI call, DB writes and Sheets
+    append run in the background workers.
+
+    Workers hand updates to the scheduler in their chat's order. A worker
+    waits for an update it started, but not for one that waits behind
+    earlier updates of its chat: those are run by the chat's lane and
+    count towards the queue size until they finish.
+    """
+
+    def __init__(self, handler: UpdateHandler, scheduler: KeyedScheduler, max_size: int = 1000,
+                 workers: int = 8):
+        self._handler = handler
+        self._scheduler = scheduler
+        self._queue: "asyncio.Queue[Tuple[Update, float]]" = asyncio.Queue(maxsize=max_size)
+        self._workers_count = max(1, workers)
+        self._workers: List[asyncio.Task] = []
+        self.max_size = max_size
+
+        # Stats
+        self.enqueued = 0
+        self.dropped = 0
+        self.processed = 0
+        self.failed = 0
+        self.active = 0
+        self.parked = 0
+        self._dequeued = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    @property
+    def depth(self) -> int:
+        """Number of updates waiting for a worker or behind earlier updates of their chat"""
+        return self._queue.qsize() + self.parked
+
+    def start(self):
+        """Start worker tasks"""
+        if self._workers:
+            return
+        for i in range(self._workers_count):
+            self._workers.append(asyncio.create_task(self._worker(), name=f"update-worker-{i}"))
+        logger.info(f"Update queue started with {self._workers_count} workers (max size {self.max_size})")
+
+    def put_nowait(self, update: Update) -> bool:
+        """
+        Enqueue update without waiting
+
+        Returns:
+            False if the queue is full and the update was dropped
+        """
+        try:
+            if self.depth >= self.max_size:
+                raise asyncio.QueueFull
+            self._queue.put_nowait((update, time.monotonic()))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning(f"Update queue is full, dropping update {update.update_id}")
+            return False
+        self.enqueued += 1
+        return True
+
+    async def put(self, update: Update):
+        """Enqueue update, waiting for a free slot (backpressure)"""
+        await self._queue.put((update, time.monotonic()))
+        self.enqueued += 1
+
+    async def _worker(self):
+        """Drain the queue and pass updates to the handler"""
+        while True:
+            update, enqueued_at = await self._queue.get()
+            wait = time.monotonic() - enqueued_at
+            self._dequeued += 1
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+            key = self._scheduler.key_for(update)
+            parked = self._scheduler.busy(key)
+            future = self._scheduler.submit(key, lambda update=update: self._handler(update))
+            if parked:
+                self.parked += 1
+                future.add_done_callback(lambda future, update=update: self._finished(update, future, parked=True))
+                continue
+            self.active += 1
+            await asyncio.wait({future})
+            self._finished(update, future, parked=False)
+
+    def _finished(self, update: Update, future: asyncio.Future, parked: bool):
+        if parked:
+            self.parked -= 1
+        else:
+            self.active -= 1
+        if future.cancelled():
+            self.failed += 1
+        elif future.exception() is not None:
+            self.failed += 1
+            e = future.exception()
+            logger.error(f"Error processing update {update.update_id}: {e}", exc_info=e)
+        else:
+            self.processed += 1
+        self._queue.task_done()
+
+    async def drain(self, timeout: float) -> Tuple[int, int]:
+        """
+        Wait for queued and running updates to finish
+
+        Args:
+            timeout: Maximum time to wait in seconds
+
+        Returns:
+            (drained, abandoned) - updates finished while draining
+            and updates still queued or running at the deadline
+        """
+        handled_before = self.processed + self.failed
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        drained = self.processed + self.failed - handled_before
+        abandoned = self.depth + self.active
+        return drained, abandoned
+
+    async def stop(self):
+        """Cancel worker tasks"""
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue statistics"""
+        return {
+            "depth": self.depth,
+            "max_size": self.max_size,
+            "workers": self._workers_count,
+            "active": self.active,
+            "parked": self.parked,
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "processed": self.processed,
+            "failed": self.failed,
+            "wait_avg_seconds": round(self._wait_total / self._dequeued, 4) if self._dequeued else 0.0,
+            "wait_max_seconds": round(self._wait_max, 4),
+        }
+
+
+# Global queue instance
+_update_queue: Optional[UpdateQueue] = None
+
+
+def create_update_queue(handler: UpdateHandler, scheduler: KeyedScheduler) -> UpdateQueue:
+    """Create the global update queue from settings"""
+    global _update_queue
+    settings = get_settings().updates
+    _update_queue = UpdateQueue(handler, scheduler, max_size=settings.max_size, workers=settings.workers)
+    return _update_queue
+
+
+def get_update_queue() -> Optional[UpdateQueue]:
+    """Get update queue instance (None until created in lifespan)"""
+    return _update_queue
@@ -0,0 +1,198 @@
+"""Per-chat ordered, cross-chat parallel update scheduler"""
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Optional, Set, Tuple, TypeVar
+
+from aiogram.dispatcher.middlewares.user_context import UserContextMiddleware
+from aiogram.types import Update
+
+from src.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_Work = Tuple[Callable[[], Awaitable[Any]], "asyncio.Future[Any]"]
+
+
+class _Slot:
+    """Concurrency slot of the work running in a task"""
+
+    def __init__(self, scheduler: "KeyedScheduler"):
+        self.scheduler = scheduler
+        self.task = asyncio.current_task()
+        self.held = False
+
+
+# Slot of the work being run, tasks spawned by the work inherit it but don't hold it
+_current_slot: ContextVar[Optional[_Slot]] = ContextVar("scheduler_slot", default=None)
+
+
+class KeyedScheduler:
+    """
+    Runs work (update handling) in the order of its key: chat id, or user
+    id when there is no chat.
+
+    Every key with work has a lane of its own, a queue drained by a task
+    that is created with the first work of the key and ends when the lane
+    is empty: two updates of the same chat never run at the same time and
+    keep their arrival order, while different chats never wait for each
+    other, only for the global concurrency cap. Work that only waits (for
+    a rate limit) may give its slot to other chats, see slot_released().
+    """
+
+    def __init__(self, max_concurrency: int = 16):
+        self._lanes: Dict[int, Deque[_Work]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        self.max_concurrency = max_concurrency
+
+        # Stats
+        self.running = 0
+        self.lane_waits = 0
+        self.slot_releases = 0
+
+    @staticmethod
+    def key_for(update: Update) -> Optional[int]:
+        """Get ordering key of the update: chat id, or user id if there is no chat"""
+        context = UserContextMiddleware.resolve_event_context(update)
+        if context.chat_id is not None:
+            return context.chat_id
+        return context.user_id
+
+    def busy(self, key: Optional[int]) -> bool:
+        """Whether work of the key is running or waiting"""
+        return key is not None and key in self._lanes
+
+    @property
+    def pending(self) -> int:
+        """Work waiting behind earlier work of its key"""
+        return sum(len(lane) - 1 for lane in self._lanes.values())
+
+    def submit(self, key: Optional[int], func: Callable[[], Awaitable[T]]) -> "asyncio.Future[T]":
+        """
+        Schedule coroutine function after the earlier work of the key,
+        without waiting
+
+        Returns:
+            Future of its result; cancelling it before the work starts skips the work
+        """
+        future: "asyncio.Future[T]" = asyncio.get_running_loop().create_future()
+        if key is None:
+            self._spawn(self._run_one(func, future))
+            return future
+        lane = self._lanes.get(key)
+        if lane is not None:
+            self.lane_waits += 1
+            lane.append((func, future))
+            return future
+        self._lanes[key] = deque([(func, future)])
+        self._spawn(self._drain(key))
+        return future
+
+    async def run(self, key: Optional[int], func: Callable[[], Awaitable[T]]) -> T:
+        """Run coroutine function after the earlier work of the key"""
+        return await self.submit(key, func)
+
+    def _spawn(self, coro: Awaitable[Any]):
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _drain(self, key: int):
+        """Run the lane's work in order, the lane is removed once empty"""
+        lane = self._lanes[key]
+        try:
+            while lane:
+                func, future = lane[0]
+                await self._run_one(func, future)
+                lane.popleft()
+        finally:
+            del self._lanes[key]
+            for _, future in lane:
+                future.cancel()
+
+    async def _run_one(self, func: Callable[[], Awaitable[Any]], future: "asyncio.Future[Any]"):
+        if future.done():
+            # Cancelled while waiting
+            return
+        slot = _Slot(self)
+        await self._semaphore.acquire()
+        slot.held = True
+        self.running += 1
+        token = _current_slot.set(slot)
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(result)
+        finally:
+            _current_slot.reset(token)
+            # Not held if cancelled while taking it back in slot_released()
+            if slot.held:
+                self.running -= 1
+                self._semaphore.release()
+
+    @asynccontextmanager
+    async def slot_released(self) -> AsyncIterator[None]:
+        """
+        Give the concurrency slot of the running work to other keys for the
+        duration of the block, e.g. while sleeping for a rate limit. The key's
+        lane stays busy, so its order is kept. Does nothing outside of work.
+        """
+        slot = _current_slot.get()
+        if slot is None or slot.scheduler is not self or slot.task is not asyncio.current_task() or not slot.held:
+            yield
+            return
+        slot.held = False
+        self.running -= 1
+        self.slot_releases += 1
+        self._semaphore.release()
+        try:
+            yield
+        finally:
+            await self._semaphore.acquire()
+            slot.held = True
+            self.running += 1
+
+    async def stop(self):
+        """Cancel running and waiting work"""
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """Scheduler statistics"""
+        return {
+            "lanes_busy": len(self._lanes),
+            "pending": self.pending,
+            "max_concurrency": self.max_concurrency,
+            "running": self.running,
+            "lane_waits": self.lane_waits,
+            "slot_releases": self.slot_releases,
+        }
+
+
+# Global scheduler instance
+_scheduler: Optional[KeyedScheduler] = None
+
+
+def create_scheduler() -> KeyedScheduler:
+    """Create the global scheduler from settings"""
+    global _scheduler
+    _scheduler = KeyedScheduler(max_concurrency=get_settings().updates.max_concurrency)
+    return _scheduler
+
+
+def get_scheduler() -> Optional[KeyedScheduler]:
+    """Get scheduler instance (None until created in lifespan)"""
+    return _scheduler
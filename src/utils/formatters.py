@@ -1,7 +1,7 @@
 """Message formatters"""
 import logging
 from typing import List, Dict
-from src.database import Assortment
+from src.database import get_assortment_store
 
 logger = logging.getLogger(__name__)
 
@@ -18,14 +18,13 @@ async def format_order_response(orders_data: List[Dict]) -> str:
     if first_order.get('message') and not first_order.get('adress'):
         return first_order.get('message', '')
     
-    # Get all products for lookup
-    all_products = await Assortment.get_all()
-    product_map = {p.good_id: p for p in all_products}
+    # Shared assortment snapshot for lookup
+    assortment = await get_assortment_store().get()
     
     for i, order in enumerate(orders_data, 1):
         response += f"\nЗаказ #{i}:\n"
         response += f"Организация {order.get('company_name','не распознано')}:\n"
-        response += f"📅 Дата доставки: {order.get('date_delivery', 'Не указана')}\n"
+        response += f"📅 Дата доставки: {order.get('date_delivery') or 'Не указана'}\n"
         response += f"🏠 Адрес: {order.get('adress', 'Не указан')}\n"
         response += "🛒 Товары:\n"
         
@@ -37,10 +36,10 @@ async def format_order_response(orders_data: List[Dict]) -> str:
             for product_id_str, quantity in goods.items():
                 try:
                     product_id = int(product_id_str)
-                    product = product_map.get(product_id)
-                    quantity_all = quantity * product.min_size
+                    product = assortment.get(product_id)
                     
                     if product:
+                        quantity_all = quantity * product.min_size
                         response += f"  • {product.name}: {quantity_all} {product.type}\n"
                         # Calculate cost
                         payment_type = order.get('payment_type', 'price_amt')
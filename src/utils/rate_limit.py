@@ -0,0 +1,46 @@
+"""Token bucket rate limiter"""
+import asyncio
+import time
+
+
+class TokenBucket:
+    """
+    Token bucket refilled at `rate` tokens per second up to `capacity`.
+
+    acquire() reserves tokens right away and lets the balance go negative,
+    so concurrent callers are served in call order and each one sleeps
+    exactly until its share of the refill.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def reserve(self, tokens: float = 1) -> float:
+        """Take tokens and return how many seconds to wait before using them"""
+        self._refill(time.monotonic())
+        self._tokens -= tokens
+        return max(0.0, -self._tokens / self.rate)
+
+    async def acquire(self, tokens: float = 1) -> float:
+        """Wait for tokens, returns waited time in seconds"""
+        delay = self.reserve(tokens)
+        if delay:
+            await asyncio.sleep(delay)
+        return delay
+
+    def release(self, tokens: float = 1):
+        """Return tokens that were reserved but not used"""
+        self._tokens = min(self.capacity, self._tokens + tokens)
+
+    @property
+    def idle(self) -> bool:
+        """True if the bucket is full (unused for a while)"""
+        self._refill(time.monotonic())
+        return self._tokens >= self.capacity
@@ -0,0 +1,31 @@
+"""OrderAggregator shutdown drain"""
+import asyncio
+
+from src.bot.aggregation import OrderAggregator
+
+
+async def _incomplete(text, user_id):
+    return False
+
+
+def test_drain_counts_parses_running_at_the_deadline():
+    async def scenario():
+        aggregator = OrderAggregator(_incomplete, window=10.0)
+        parsed = []
+
+        async def fast(text):
+            parsed.append(text)
+
+        async def slow(text):
+            await asyncio.sleep(1.0)
+            parsed.append(text)
+
+        await aggregator.submit(1, "Мира 5", fast)
+        await aggregator.submit(2, "Ленина 10", slow)
+        abandoned = await aggregator.drain(0.05)
+        return abandoned, parsed, aggregator.stats()
+
+    abandoned, parsed, stats = asyncio.run(scenario())
+    assert abandoned == 1
+    assert parsed == ["Мира 5"]
+    assert stats["pending"] == 0
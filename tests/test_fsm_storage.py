@@ -0,0 +1,88 @@
+"""MySQLStorage write-behind flushing"""
+import asyncio
+
+from aiogram.fsm.storage.base import StorageKey
+
+from src.database.fsm_storage import MySQLStorage
+
+
+class FakeDatabase:
+    """fsm_storage table in memory; writes wait for `release` while it is cleared"""
+
+    def __init__(self):
+        self.rows = {}
+        self.release = asyncio.Event()
+        self.release.set()
+        self.fail = 0
+
+    async def execute_query(self, query, params, row_factory=None, use_primary=False):
+        row = self.rows.get(params[0])
+        return [row] if row else []
+
+    async def execute_many(self, query, rows):
+        await self.release.wait()
+        if self.fail:
+            self.fail -= 1
+            raise ConnectionError("MySQL is away")
+        for storage_key, state, data in rows:
+            self.rows[storage_key] = (state, data)
+
+    async def execute_command(self, query, params=None):
+        pass
+
+
+def _key(chat_id: int) -> StorageKey:
+    return StorageKey(bot_id=1, chat_id=chat_id, user_id=chat_id)
+
+
+def test_write_during_flush_is_flushed():
+    async def scenario():
+        db = FakeDatabase()
+        storage = MySQLStorage(db, flush_interval=0.01)
+        db.release.clear()
+        await storage.set_state(_key(1), "first")
+        await asyncio.sleep(0.05)
+        # The flush of the first key is waiting for the database
+        await storage.set_state(_key(2), "second")
+        db.release.set()
+        await asyncio.sleep(0.1)
+        return db, storage
+
+    db, storage = asyncio.run(scenario())
+    assert {state for state, _ in db.rows.values()} == {"first", "second"}
+    assert storage.stats()["dirty"] == 0
+
+
+def test_failed_flush_is_retried_without_new_writes(monkeypatch):
+    monkeypatch.setattr("src.database.fsm_storage.FLUSH_RETRY_MIN_DELAY", 0.01)
+
+    async def scenario():
+        db = FakeDatabase()
+        db.fail = 2
+        storage = MySQLStorage(db, flush_interval=0.01)
+        await storage.set_data(_key(1), {"order_data": [{"adress": "Мира 5"}]})
+        await asyncio.sleep(0.2)
+        return db, storage
+
+    db, storage = asyncio.run(scenario())
+    assert len(db.rows) == 1
+    assert storage.stats()["flush_failures"] == 2
+    assert storage.stats()["dirty"] == 0
+
+
+def test_record_is_reloaded_by_the_next_update():
+    async def scenario():
+        db = FakeDatabase()
+        replica_a = MySQLStorage(db, flush_interval=0.01)
+        replica_b = MySQLStorage(db, flush_interval=0.01)
+        key = _key(1)
+        with replica_a.scope(key):
+            await replica_a.set_data(key, {"order_data": "original"})
+        await asyncio.sleep(0.05)
+        with replica_b.scope(key):
+            await replica_b.set_data(key, {"order_data": "corrected"})
+        await asyncio.sleep(0.05)
+        with replica_a.scope(key):
+            return await replica_a.get_data(key)
+
+    assert asyncio.run(scenario()) == {"order_data": "corrected"}
@@ -0,0 +1,48 @@
+"""KeyedScheduler lanes and concurrency slots"""
+import asyncio
+
+from src.updates.scheduler import KeyedScheduler
+
+
+def test_waiting_work_gives_its_slot_to_other_chats():
+    async def scenario():
+        scheduler = KeyedScheduler(max_concurrency=1)
+        events = []
+
+        async def throttled():
+            async with scheduler.slot_released():
+                await asyncio.sleep(0.05)
+            events.append("admin sent")
+
+        async def reply():
+            events.append("customer answered")
+
+        admin = scheduler.submit(1, throttled)
+        await asyncio.sleep(0)
+        await asyncio.wait_for(scheduler.run(2, reply), 0.02)
+        await admin
+        return events, scheduler.stats()
+
+    events, stats = asyncio.run(scenario())
+    assert events == ["customer answered", "admin sent"]
+    assert stats["running"] == 0
+    assert stats["slot_releases"] == 1
+
+
+def test_chat_order_is_kept_while_slot_is_released():
+    async def scenario():
+        scheduler = KeyedScheduler(max_concurrency=4)
+        events = []
+
+        async def first():
+            async with scheduler.slot_released():
+                await asyncio.sleep(0.02)
+            events.append("first")
+
+        async def second():
+            events.append("second")
+
+        await asyncio.gather(scheduler.run(1, first), scheduler.run(1, second))
+        return events
+
+    assert asyncio.run(scenario()) == ["first", "second"]